@@ -0,0 +1,137 @@
+"""Check the console parsers against recorded transcripts and measure their throughput.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_console_parser [--lines 100000] [--fuzz 2000]
+
+Every `benchmarks/transcripts/<command>-<case>.txt` is a raw console response,
+command echo and prompt included, and the `.json` next to it is the expected
+parse. `events-<case>.txt` transcripts are stretches of console log output
+instead of command responses. Three passes are run:
+
+- corpus: each transcript must parse to exactly its expected JSON.
+- fuzz: randomly truncated, spliced and corrupted transcripts must parse
+  without raising.
+- throughput: each grammar parses a response of `--lines` lines built from
+  its transcripts, reported in lines per second.
+
+Exits non-zero when the corpus or fuzz pass fails, so it can gate changes to
+console_parser.py.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+import console_parser
+
+PARSERS = {
+    'worlds': console_parser.parse_worlds,
+    'status': console_parser.parse_status,
+    'users': console_parser.parse_users,
+    'listbans': console_parser.parse_bans,
+    'friendRequests': console_parser.parse_friend_requests,
+    'sessionUrl': console_parser.parse_session_url,
+    'events': console_parser.parse_events,
+}
+
+TRANSCRIPTS = os.path.join(os.path.dirname(__file__), 'transcripts')
+
+
+def to_json(value):
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    return value.to_dict() if isinstance(value, console_parser.Record) else value
+
+
+def load_corpus():
+    """(command, case name, raw output, expected JSON) for every transcript"""
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(TRANSCRIPTS, '*.txt'))):
+        name = os.path.basename(path)[:-4]
+        with open(path, newline='') as f:
+            output = f.read()
+        with open(path[:-4] + '.json') as f:
+            expected = json.load(f)
+        corpus.append((name.split('-')[0], name, output, expected))
+    return corpus
+
+
+def check_corpus(corpus):
+    failures = 0
+    for command, name, output, expected in corpus:
+        actual = to_json(PARSERS[command](output))
+        if actual != expected:
+            failures += 1
+            print(f"FAIL {name}\n  expected: {expected}\n  actual:   {actual}")
+    print(f"corpus: {len(corpus) - failures}/{len(corpus)} transcripts match")
+    return failures
+
+
+def mutate(output, rng):
+    """A damaged copy of a transcript, like a response cut off or interleaved with other output"""
+    choice = rng.randrange(4)
+    if choice == 0:
+        return output[:rng.randrange(len(output) + 1)]
+    if choice == 1:
+        i = rng.randrange(len(output) + 1)
+        return output[:i] + rng.choice(['\t', ':', '[', ']', '\x1b[', '\r\n', ' ms', 'ID:', '>']) + output[i:]
+    if choice == 2:
+        lines = output.split('\n')
+        rng.shuffle(lines)
+        return '\n'.join(lines)
+    return ''.join(chr(rng.randrange(32, 127)) if rng.random() < 0.05 else c for c in output)
+
+
+def fuzz(corpus, iterations, seed):
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(iterations):
+        command, name, output, expected = rng.choice(corpus)
+        damaged = mutate(output, rng)
+        try:
+            to_json(PARSERS[command](damaged))
+        except Exception as e:
+            failures += 1
+            if failures <= 5:
+                print(f"FAIL {name} raised {e!r} on {damaged!r}")
+    print(f"fuzz: {iterations - failures}/{iterations} damaged transcripts parsed without raising")
+    return failures
+
+
+def throughput(corpus, line_count):
+    for command, parse in PARSERS.items():
+        body = []
+        for transcript_command, name, output, expected in corpus:
+            if transcript_command == command:
+                body.extend(output.replace('\r\n', '\n').split('\n')[1:-1])
+        if not body:
+            continue
+        body = (body * (line_count // len(body) + 1))[:line_count]
+        output = '\n'.join([f'World>{command}', *body, 'World>'])
+
+        start = time.perf_counter()
+        parse(output)
+        elapsed = time.perf_counter() - start
+        print(f"{command:>15}: {line_count / elapsed:>12,.0f} lines/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=100000, help='Lines per throughput run')
+    parser.add_argument('--fuzz', type=int, default=2000, help='Damaged transcripts to parse')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = check_corpus(corpus)
+    failures += fuzz(corpus, args.fuzz, args.seed)
+    throughput(corpus, args.lines)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
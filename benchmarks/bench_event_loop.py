@@ -0,0 +1,142 @@
+"""Measure /config latency while a worlds crawl is running.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_event_loop [--worlds 10] [--command-delay 0.3]
+
+The headless console is simulated by a DockerManager whose send_command sleeps
+for `--command-delay` seconds, which is roughly the silence timeout a real
+command costs. Two modes are compared:
+
+- inline: the crawl calls the blocking send_command directly on the event
+  loop, which is how get_worlds used to behave.
+- async: the crawl goes through the DockerManager I/O pool (the current code).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+
+os.environ.setdefault('CONFIG_PATH', os.path.join(tempfile.mkdtemp(), 'Config.json'))
+with open(os.environ['CONFIG_PATH'], 'w') as f:
+    f.write('{"comment": "benchmark config"}')
+
+import server  # noqa: E402
+from docker_manager import DockerManager  # noqa: E402
+
+
+class SimulatedConsoleManager(DockerManager):
+    """DockerManager that answers console commands from canned output after a fixed delay"""
+
+    def __init__(self, world_count, command_delay):
+        super().__init__('benchmark-headless')
+        self.world_count = world_count
+        self.command_delay = command_delay
+
+    def send_command(self, command, timeout=1):
+        time.sleep(self.command_delay)
+        if command == 'worlds':
+            worlds = [f"[{i}] World {i}\tUsers: 1\tPresent: 1\tAccessLevel: Anyone\tMaxUsers: 16"
+                      for i in range(self.world_count)]
+            return '\n'.join(['worlds', *worlds, 'World 0>'])
+        if command == 'status':
+            return '\n'.join([
+                'status',
+                'Name: World',
+                'SessionID: S-benchmark',
+                'Current Users: 1',
+                'Present Users: 1',
+                'Max Users: 16',
+                'Uptime: 01:00:00.0000000',
+                'Access Level: Anyone',
+                'World>'
+            ])
+        if command == 'users':
+            return '\n'.join([
+                'users',
+                'Bench ID: U-Bench Role: Admin Present: True Ping: 12 ms FPS: 60.0 Silenced: False',
+                'World>'
+            ])
+        return f"{command}\nWorld>"
+
+    async def send_command_async(self, command, timeout=5):
+        # Skip the console session and block a pool thread like a real attach would
+        return await self.run_blocking(self.send_command, command, timeout)
+
+    async def send_batch_async(self, commands, timeout=5, check=None):
+        outputs = []
+        for i, command in enumerate(commands):
+            outputs.append(await self.send_command_async(command, timeout))
+            if check is not None and not check(i, outputs[-1]):
+                break
+        return outputs
+
+
+async def inline_crawl(manager):
+    """The old get_worlds behaviour: blocking calls straight on the event loop"""
+    output = manager.send_command('worlds')
+    for i in range(len(output.split('\n')[1:-1])):
+        manager.send_command(f"focus {i}")
+        time.sleep(1)
+        manager.send_command('status')
+        manager.send_command('users')
+
+
+async def measure(mode, headless, interval):
+    if mode == 'inline':
+        crawl = asyncio.create_task(inline_crawl(headless.docker_manager))
+    else:
+        crawl = asyncio.create_task(headless.world_poller.refresh())
+
+    # Requests go out on a fixed schedule and latency is measured from the
+    # scheduled time, so time spent waiting for a blocked loop is counted
+    latencies = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+        started = time.perf_counter()
+        sent = 0
+        while not crawl.done():
+            scheduled = started + sent * interval
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            response = await client.get('/config')
+            latencies.append(time.perf_counter() - scheduled)
+            response.raise_for_status()
+            sent += 1
+    await crawl
+    return latencies
+
+
+def report(mode, latencies):
+    if len(latencies) < 2:
+        print(f"{mode:>7}: {len(latencies)} request(s), worst {max(latencies) * 1000:.1f} ms")
+        return
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    print(f"{mode:>7}: {len(latencies)} requests  "
+          f"p50 {cuts[49] * 1000:.1f} ms  p99 {cuts[98] * 1000:.1f} ms  "
+          f"max {max(latencies) * 1000:.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worlds', type=int, default=10)
+    parser.add_argument('--command-delay', type=float, default=0.3)
+    parser.add_argument('--interval', type=float, default=0.05, help='Pause between /config requests')
+    parser.add_argument('--mode', choices=['inline', 'async', 'both'], default='both')
+    args = parser.parse_args()
+
+    manager = SimulatedConsoleManager(args.worlds, args.command_delay)
+    headless = server.fleet.add(manager.container_name, manager)
+
+    print(f"Crawling {args.worlds} worlds with {args.command_delay * 1000:.0f} ms per command")
+    modes = ['inline', 'async'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        report(mode, await measure(mode, headless, args.interval))
+    manager.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,206 @@
+"""Load-test the manager with many websocket clients against simulated headlesses.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_load [--clients 50] [--duration 10] [--log-rate 100]
+
+The server is started in a subprocess with `HEADLESS_BACKEND=simulator`, so
+the real console session, log monitor, scheduler and websocket code run
+against `headless_simulator` instead of Docker. Then `--clients` websocket
+clients connect, each sending a console command every `--command-interval`
+seconds while reading everything the server pushes. Reported are:
+
+- command latency: p50/p95/p99/max from sending a `command` to its
+  `command_response`.
+- fan-out: console lines delivered per second across all clients, against
+  the log lines the simulated headless printed (echoed commands and their
+  responses come on top, so this can exceed 100%).
+- memory per client: growth of the server's RSS after the clients
+  connected, divided by the number of clients.
+
+Needs the `websockets` package (`pip install websockets`), which uvicorn
+also uses to serve the websocket endpoint.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import psutil
+
+try:
+    import websockets
+except ImportError:
+    sys.exit("bench_load needs the websockets package: pip install websockets")
+
+COMMANDS = ['users', 'status', 'worlds', 'sessionUrl']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, args, workdir):
+    config_path = os.path.join(workdir, 'Config.json')
+    with open(config_path, 'w') as f:
+        f.write('{"comment": "load test config"}')
+    env = {
+        **os.environ,
+        'HEADLESS_BACKEND': 'simulator',
+        'CONTAINER_NAME': 'sim-headless',
+        'CONFIG_PATH': config_path,
+        'LOG_DIR': os.path.join(workdir, 'logs'),
+        'SIMULATOR_WORLDS': str(args.worlds),
+        'SIMULATOR_LATENCY': str(args.latency),
+        'SIMULATOR_LOG_RATE': str(args.log_rate),
+    }
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        env=env
+    )
+
+
+async def wait_ready(base_url, timeout=20):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get('/api/containers')).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server didn't start")
+
+
+class Client:
+    def __init__(self, url, command_interval, stop_at):
+        self.url = url
+        self.command_interval = command_interval
+        self.stop_at = stop_at
+        self.latencies = []
+        self.lines = 0
+        self.dropped = 0  # Lines the server skipped because this client fell behind
+        self.messages = 0
+        self.connected = asyncio.Event()
+        self._sent = {}  # command -> send times waiting for a response, oldest first
+
+    async def run(self):
+        async with websockets.connect(self.url, max_size=None) as ws:
+            self.connected.set()
+            sender = asyncio.create_task(self._send(ws))
+            try:
+                while time.monotonic() < self.stop_at:
+                    try:
+                        raw = await asyncio.wait_for(ws.recv(), self.stop_at - time.monotonic())
+                    except asyncio.TimeoutError:
+                        break
+                    if isinstance(raw, str):
+                        self._handle(json.loads(raw))
+            finally:
+                sender.cancel()
+
+    def _handle(self, message):
+        self.messages += 1
+        if message.get('type') == 'container_output':
+            self.lines += len(message['output']) if isinstance(message.get('output'), list) else 1
+            self.dropped += message.get('dropped', 0)
+        elif message.get('type') == 'command_response':
+            pending = self._sent.get(message.get('command'))
+            if pending:
+                self.latencies.append(time.perf_counter() - pending.pop(0))
+
+    async def _send(self, ws):
+        # Clients start at random offsets so they don't all fire at once
+        await asyncio.sleep(self.command_interval * (hash(id(self)) % 1000) / 1000)
+        i = 0
+        while True:
+            command = COMMANDS[i % len(COMMANDS)]
+            self._sent.setdefault(command, []).append(time.perf_counter())
+            await ws.send(json.dumps({'type': 'command', 'command': command}))
+            i += 1
+            await asyncio.sleep(self.command_interval)
+
+
+def percentile(cuts, p):
+    return cuts[p - 1] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run once every client is connected')
+    parser.add_argument('--command-interval', type=float, default=1.0, help='Seconds between commands per client')
+    parser.add_argument('--log-rate', type=float, default=100, help='Log lines per second from the headless')
+    parser.add_argument('--worlds', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds the console takes per command')
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(port, args, workdir)
+        try:
+            await wait_ready(base_url)
+            process = psutil.Process(server.pid)
+            await asyncio.sleep(1)
+            rss_before = process.memory_info().rss
+
+            stop_at = float('inf')
+            clients = [Client(f'ws://127.0.0.1:{port}/ws', args.command_interval, stop_at) for _ in range(args.clients)]
+            tasks = [asyncio.create_task(client.run()) for client in clients]
+            await asyncio.wait_for(asyncio.gather(*(client.connected.wait() for client in clients)), 30)
+            await asyncio.sleep(1)
+            rss_after = process.memory_info().rss
+
+            started = time.monotonic()
+            for client in clients:
+                client.stop_at = started + args.duration
+                client.lines = 0
+                client.messages = 0
+            await asyncio.gather(*tasks)
+            # Clients stop counting at stop_at; closing the sockets afterwards isn't measured
+            elapsed = min(time.monotonic() - started, args.duration)
+
+            async with httpx.AsyncClient(base_url=base_url) as http:
+                containers = (await http.get('/api/containers')).json()['containers']
+        finally:
+            server.terminate()
+            server.wait(10)
+
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    lines = sum(client.lines for client in clients)
+    expected = args.log_rate * elapsed * args.clients
+
+    print(f"{args.clients} clients for {elapsed:.1f}s, {args.worlds} worlds, {args.log_rate:.0f} log lines/s")
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        print(f"command latency: {len(latencies)} commands  p50 {percentile(cuts, 50):.1f} ms  "
+              f"p95 {percentile(cuts, 95):.1f} ms  p99 {percentile(cuts, 99):.1f} ms  max {latencies[-1] * 1000:.1f} ms")
+    else:
+        print(f"command latency: only {len(latencies)} command(s) answered")
+    print(f"fan-out: {lines / elapsed:,.0f} lines/s delivered  "
+          f"({lines / expected * 100 if expected else 0:.0f}% of ~{expected / elapsed:,.0f} lines/s printed x clients)  "
+          f"{sum(client.messages for client in clients) / elapsed:,.0f} frames/s  "
+          f"{sum(client.dropped for client in clients):,} lines dropped")
+    print(f"memory: {rss_before / 2 ** 20:.1f} MiB before clients, {rss_after / 2 ** 20:.1f} MiB after, "
+          f"{(rss_after - rss_before) / args.clients / 1024:.0f} KiB per client")
+    for container in containers:
+        commands = container.get('commands', {})
+        print(f"console {container['id']}: {commands.get('runs', 0)} locked runs, "
+              f"max lock wait {commands.get('max_wait', 0) * 1000:.1f} ms, "
+              f"{commands.get('focus_skipped', 0)} focus skipped")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,179 @@
+"""Measure the cached read-only REST API with many requests in flight.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rest_api [--in-flight 100] [--duration 10] [--max-age 1]
+
+The server is started in a subprocess with `HEADLESS_BACKEND=simulator`, and
+`REST_*_MAX_AGE` set to `--max-age` so the cached state goes stale several
+times during the run. `--in-flight` requests are kept open at once, spread
+over `/api/status`, `/api/worlds`, `/api/users` and `/api/bans`. Half the
+clients revalidate with the ETag they were last sent, the way a polling bot
+or dashboard would. Reported are, per resource:
+
+- throughput and latency percentiles,
+- how many answers were `304 Not Modified`,
+- how many refreshes the stale state caused, against the requests that found
+  it stale (the rest waited on a refresh already running),
+- and overall, the console commands the headless ran during the run.
+
+The requests go over plain keep-alive HTTP/1.1 connections, one per request
+in flight, because httpx's connection pool costs more CPU than the server
+does at this concurrency and would be what gets measured.
+"""
+import argparse
+import asyncio
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+RESOURCES = ['status', 'worlds', 'users', 'bans']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, args, workdir):
+    config_path = os.path.join(workdir, 'Config.json')
+    with open(config_path, 'w') as f:
+        f.write('{"comment": "rest benchmark config"}')
+    env = {
+        **os.environ,
+        'HEADLESS_BACKEND': 'simulator',
+        'CONTAINER_NAME': 'sim-headless',
+        'CONFIG_PATH': config_path,
+        'LOG_DIR': '',
+        'SIMULATOR_WORLDS': str(args.worlds),
+        'SIMULATOR_LATENCY': str(args.latency),
+        **{f'REST_{resource.upper()}_MAX_AGE': str(args.max_age) for resource in RESOURCES},
+    }
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        env=env
+    )
+
+
+async def wait_ready(client, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get('/api/worlds')).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server didn't start")
+
+
+def scrape(text):
+    """Sample values from /metrics keyed by name and labels"""
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, _, value = line.rpartition(' ')
+            values[name] = float(value)
+    return values
+
+
+def total(values, pattern):
+    return sum(value for name, value in values.items() if re.match(pattern, name))
+
+
+def new_stats():
+    stats = defaultdict(int)  # Responses by status code
+    stats['latencies'] = []
+    return stats
+
+
+async def get(reader, writer, path, etag=None):
+    """One GET on a keep-alive connection; returns (status, etag)"""
+    revalidate = f'If-None-Match: {etag}\r\n' if etag else ''
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: benchmark\r\n{revalidate}\r\n'.encode('ascii'))
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    headers = dict(line.lower().split(': ', 1) for line in head[1:] if ': ' in line)
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(head[0].split()[1]), headers.get('etag')
+
+
+async def worker(port, resource, revalidate, stop_at, stats):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    etag = None
+    try:
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            status, sent_etag = await get(reader, writer, f'/api/{resource}', etag if revalidate else None)
+            stats[resource]['latencies'].append(time.perf_counter() - start)
+            stats[resource][status] += 1
+            etag = sent_etag or etag
+    finally:
+        writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--in-flight', type=int, default=100, help='Requests kept open at once')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--max-age', type=float, default=1, help='REST_*_MAX_AGE for every resource')
+    parser.add_argument('--worlds', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds the console takes per command')
+    args = parser.parse_args()
+
+    port = free_port()
+    stats = defaultdict(new_stats)
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(port, args, workdir)
+        try:
+            async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', timeout=60) as client:
+                await wait_ready(client)
+                for resource in RESOURCES:
+                    await client.get(f'/api/{resource}')
+                before = scrape((await client.get('/metrics')).text)
+
+                stop_at = time.monotonic() + args.duration
+                started = time.monotonic()
+                await asyncio.gather(*(
+                    worker(port, RESOURCES[i % len(RESOURCES)], i // len(RESOURCES) % 2 == 1, stop_at, stats)
+                    for i in range(args.in_flight)
+                ))
+                elapsed = time.monotonic() - started
+                after = scrape((await client.get('/metrics')).text)
+        finally:
+            server.terminate()
+            server.wait(10)
+
+    def delta(pattern):
+        return total(after, pattern) - total(before, pattern)
+
+    requests = sum(len(stats[resource]['latencies']) for resource in RESOURCES)
+    print(f"{args.in_flight} requests in flight for {elapsed:.1f}s, max-age {args.max_age:g}s: "
+          f"{requests / elapsed:,.0f} requests/s")
+    for resource in RESOURCES:
+        latencies = sorted(stats[resource]['latencies'])
+        if len(latencies) < 2:
+            print(f"{resource:>7}: only {len(latencies)} request(s)")
+            continue
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        labels = re.escape(f'{{resource="{resource}"')
+        stale = delta(labels.join(['rest_requests_total', r',cache="(refreshed|joined)"\}']))
+        refreshes = delta(labels.join(['rest_refreshes_total', r'\}']))
+        print(f"{resource:>7}: {len(latencies) / elapsed:>7,.0f} req/s  p50 {cuts[49] * 1000:6.1f} ms  "
+              f"p99 {cuts[98] * 1000:6.1f} ms  {stats[resource][304] / len(latencies) * 100:3.0f}% 304  "
+              f"{refreshes:.0f} refreshes for {stale:.0f} stale requests")
+    commands = delta(r'headless_command_duration_seconds_count')
+    print(f"console: {commands:.0f} commands for {requests:,} requests")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+"""Check the container output decoder against a log spew and measure its throughput.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_stream_decoder [--lines 200000] [--max-chunk 4096]
+
+A Docker log stream of `--lines` timestamped lines is generated the way the
+headless prints them: colour codes, the log line written over the prompt
+with a bare `\\r`, non-ASCII user and world names, and now and then a line
+far longer than a read. It is cut into chunks of random size, so multibyte
+characters, escape sequences and lines are split across reads. Three passes
+are run:
+
+- monitor: `DockerManager._read_log_stream` over the chunks, as the output
+  monitor reads Docker's log stream.
+- framed: `LineDecoder` over the same output multiplexed in Docker's 8-byte
+  frame headers, as the attach socket of a container without a TTY sends it.
+- legacy: the loop the monitor used before, for comparison.
+
+Each pass must produce exactly the expected lines, none lost, cut or
+garbled; legacy is only reported. Exits non-zero when the monitor or framed
+pass gets a line wrong or stays under `--target` lines per second.
+"""
+import argparse
+import codecs
+import random
+import re
+import struct
+import sys
+import time
+
+from docker_manager import DockerManager, parse_docker_timestamp
+from headless_simulator import format_docker_timestamp
+from stream_decoder import LineDecoder, clean_line
+
+MESSAGES = [
+    "[INFO] Running garbage collection",
+    "[INFO] Asset transfer finished: resdb:///{hash}.webp",
+    "[INFO] User Joined Café Ünïcode. Username: 猫のユーザー, UserID: U-{hash}",
+    "[INFO] User Left Ωmega Lounge 🌌. Username: Zoë, UserID: U-{hash}",
+    "[WARN] Slow update in Рабочий мир: {ms} ms",
+    "[DEBUG] Session updated: {hash}",
+]
+COLOURS = ['\x1b[32m', '\x1b[33m', '\x1b[0;1;31m', '']
+
+
+def build_spew(line_count, seed):
+    """The raw log stream as bytes and the lines the manager should make of it"""
+    rng = random.Random(seed)
+    ts = time.time() - line_count / 1000
+    raw = []
+    expected = []
+    for i in range(line_count):
+        ts += rng.random() / 500
+        message = rng.choice(MESSAGES).format(hash=f"{rng.randrange(16 ** 12):012x}", ms=rng.randrange(20, 200))
+        if i % 5000 == 4999:
+            message += ' ' + 'x' * 20000  # A stack trace or asset list on one line
+        colour = rng.choice(COLOURS)
+        reset = '\x1b[0m' if colour else ''
+        # The headless returns to the start of the prompt line and prints over it
+        raw.append(f"{format_docker_timestamp(ts)} World>\r{colour}{message}{reset}\r\n")
+        expected.append((parse_docker_timestamp(format_docker_timestamp(ts)), message))
+    return ''.join(raw).encode('utf-8'), expected
+
+
+def chunks(data, max_chunk, rng):
+    pos = 0
+    out = []
+    while pos < len(data):
+        size = rng.randint(1, max_chunk)
+        out.append(data[pos:pos + size])
+        pos += size
+    return out
+
+
+def frame(data, max_frame, rng):
+    """Multiplex `data` into Docker stdout/stderr frames"""
+    framed = []
+    for part in chunks(data, max_frame, rng):
+        framed.append(struct.pack('>BxxxL', rng.choice((1, 2)), len(part)) + part)
+    return b''.join(framed)
+
+
+def run_monitor(stream_chunks):
+    manager = DockerManager('benchmark-headless')
+    manager._monitor_running = True
+    received = []
+    start = time.perf_counter()
+    manager._read_log_stream(iter(stream_chunks), received.extend, None)
+    elapsed = time.perf_counter() - start
+    manager.shutdown()
+    return received, elapsed
+
+
+def run_framed(stream_chunks):
+    decoder = LineDecoder(framed=None)
+    received = []
+    start = time.perf_counter()
+    for chunk in stream_chunks:
+        for line in decoder.feed(chunk):
+            stamp, _, text = line.partition(' ')
+            text = clean_line(text)
+            if text:
+                received.append((parse_docker_timestamp(stamp), text))
+    elapsed = time.perf_counter() - start
+    return received, elapsed
+
+
+def run_legacy(stream_chunks):
+    """The monitor loop before the streaming decoder, minus the timestamp resume bookkeeping"""
+    ansi_escape = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]|\x1B[()][AB012]')
+
+    def clean_output(text):
+        clean_text = ansi_escape.sub('', text)
+        lines = [line.strip() for line in clean_text.replace('\r\n', '\n').split('\n')]
+        return [line for line in lines if line]
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    received = []
+    buffer = ""
+    start = time.perf_counter()
+    for chunk in stream_chunks:
+        buffer += decoder.decode(chunk)
+        while '\n' in buffer:
+            line, buffer = buffer.split('\n', 1)
+            stamp, _, text = line.partition(' ')
+            try:
+                ts = parse_docker_timestamp(stamp)
+            except ValueError:
+                ts, text = time.time(), line
+            for clean in clean_output(text.strip()):
+                for again in clean_output(clean):  # add_to_buffer cleaned each line a second time
+                    received.append((ts, again))
+        if len(buffer) > 2048:
+            buffer = buffer[-1024:]
+    elapsed = time.perf_counter() - start
+    return received, elapsed
+
+
+def compare(received, expected):
+    """Lines missing or different from what was printed"""
+    wrong = sum(1 for got, want in zip(received, expected) if got != want)
+    return wrong + abs(len(received) - len(expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--max-chunk', type=int, default=4096, help='Largest read from the stream, in bytes')
+    parser.add_argument('--target', type=float, default=10000, help='Lines per second the decoder must reach')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    data, expected = build_spew(args.lines, args.seed)
+    plain = chunks(data, args.max_chunk, rng)
+    framed = chunks(frame(data, args.max_chunk, rng), args.max_chunk, rng)
+    print(f"{args.lines:,} lines, {len(data) / 2 ** 20:.1f} MiB in {len(plain):,} reads")
+
+    failed = False
+    for name, run, stream_chunks, checked in (('monitor', run_monitor, plain, True),
+                                                ('framed', run_framed, framed, True),
+                                                ('legacy', run_legacy, plain, False)):
+        received, elapsed = run(stream_chunks)
+        wrong = compare(received, expected)
+        rate = args.lines / elapsed
+        verdict = ''
+        if checked:
+            ok = wrong == 0 and rate >= args.target
+            failed |= not ok
+            verdict = '  ok' if ok else '  FAIL'
+        print(f"{name:>8}: {rate:>10,.0f} lines/s  {len(data) / elapsed / 2 ** 20:6.1f} MiB/s  "
+              f"{len(received):,} lines out, {wrong:,} lost or wrong{verdict}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
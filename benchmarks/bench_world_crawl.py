@@ -0,0 +1,104 @@
+"""Measure how long a worlds refresh takes against a simulated headless console.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_world_crawl [--worlds 10] [--latency 0.01]
+
+The headless is played by `headless_simulator`, which sits on the other end
+of a socketpair and answers the real ConsoleSession the way the headless
+console does: it echoes the command, prints the response after `--latency`
+seconds and ends with a `World>` prompt. `focus` changes which world
+`status` and `users` describe.
+
+Five refreshes are timed with the real WorldPoller:
+
+- full: the first crawl, which has to fetch every world.
+- unchanged: a crawl right after, where nothing changed.
+- own output: a crawl after the console output of the first two, echoes and
+  `status` bodies naming every world, went through the poller the way the
+  log monitor passes it on. None of it may count as world activity.
+- one changed: a crawl after a user joined one world.
+- named in log: a crawl after console output mentioned one world.
+
+Then a `user_joined` event from the log is applied to the snapshot, and the
+worlds patch clients get for it is checked: the world's user count goes up
+and the new user has every field the web interface's user card reads, with
+ping and FPS left unknown until the next crawl.
+
+The target is a full refresh of 10 worlds in under a second, and no world
+crawled again because of the crawl's own output. Exits non-zero when the
+join isn't patched in as expected.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from console_parser import Event
+from docker_manager import DockerManager
+from headless_simulator import SimulatedBackend
+from stream_decoder import clean_line
+from world_poller import WorldPoller
+
+
+def check_join(poller):
+    """Apply a join from the log and check the patch clients are sent for it"""
+    base_version, base_worlds = poller.version, poller.worlds
+    world = base_worlds[0]
+    event = Event(type='user_joined', world=world["name"], username='Zoë', user_id='U-bench-join')
+    applied = poller.apply_event(event)
+    patch = poller.patch_since(base_version, base_worlds)
+    changed = patch["changed"] if patch else []
+    joined = changed[0].get("users", {}).get("joined", []) if len(changed) == 1 else []
+    user = joined[0] if len(joined) == 1 else {}
+    ok = (applied
+          and changed[0].get("fields", {}).get("users") == world["users"] + 1
+          and user.get("username") == 'Zoë' and user.get("userId") == 'U-bench-join'
+          and {"role", "present", "ping", "fps", "silenced"} <= user.keys()
+          and user["ping"] is None and user["fps"] is None)
+    print(f"{'join event':>12}: {'ok' if ok else f'FAIL  {patch}'}")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worlds', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.01, help='Seconds the console takes per command')
+    args = parser.parse_args()
+
+    backend = SimulatedBackend(worlds=args.worlds, latency=args.latency, seed=0)
+    manager = DockerManager('benchmark-headless', backend=backend)
+    headless = backend.get(manager.container_name).headless
+
+    async def on_update():
+        pass
+
+    poller = WorldPoller(manager, on_update, console_busy=manager.console.busy_at)
+
+    async def timed(label):
+        before = headless.commands
+        await poller.refresh()
+        crawl = poller.crawl_timing()
+        print(f"{label:>12}: {crawl['duration']:.3f}s  {crawl['crawled']}/{crawl['worlds']} worlds crawled"
+              f"  {headless.commands - before} commands")
+
+    await timed('full')
+    await timed('unchanged')
+    for ts, line in list(headless.log.lines):
+        poller.note_output(ts, clean_line(line))
+    await timed('own output')
+    headless.worlds[args.worlds // 2].add_user(headless.rng)
+    await timed('one changed')
+    poller.note_output(time.time(), f"[INFO] Session updated: World {args.worlds - 1}")
+    await timed('named in log')
+
+    failed = not check_join(poller)
+
+    legacy = args.worlds * (1 + 3 * (args.latency + manager.console.prompt_grace))
+    print(f"{'legacy':>12}: ~{legacy:.1f}s  (sequential commands with a 1s sleep per world)")
+    manager.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
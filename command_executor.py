@@ -0,0 +1,139 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from console_parser import parse_status
+
+# Commands that act on the whole headless rather than the focused world
+FOCUS_FREE = {
+    'worlds', 'listbans', 'banbyname', 'unbanbyname', 'banbyid', 'unbanbyid', 'unban',
+    'friendrequests', 'acceptfriendrequest', 'saveconfig', 'login', 'logout', 'message',
+    'gc', 'tickrate', 'version', 'log', 'help'
+}
+
+# Commands after which a different world may be focused
+FOCUS_CHANGING = {'focus', 'startworldurl', 'startworldtemplate', 'close', 'restart', 'shutdown'}
+
+
+def command_name(command):
+    return command.split(maxsplit=1)[0].lower() if command.strip() else ''
+
+
+def is_focus_free(command):
+    return command_name(command) in FOCUS_FREE
+
+
+class CommandExecutor:
+    """Runs console commands for one headless, keeping track of the focused world.
+
+    Commands that depend on the focused world run under an async lock, so a
+    `focus` and the commands meant for that world can't be split by another
+    client's `focus`. Commands listed in FOCUS_FREE skip the lock. The session
+    of the focused world is learned from every `status` response, and a
+    batch for the world that is already focused skips its `focus` and
+    `status`. It has the same `send_command_async`/`send_batch_async` methods
+    as DockerManager, so a worlds crawl can run through it too.
+    """
+
+    def __init__(self, docker_manager):
+        self.docker_manager = docker_manager
+        self.focused = None  # Session id of the focused world, or None when unknown
+        self.waiting = 0  # Callers waiting for the focus lock
+        self.runs = 0  # Runs that held the focus lock
+        self.wait_seconds = 0.0  # Total time callers spent waiting for the lock
+        self.max_wait = 0.0
+        self.focus_sent = 0
+        self.focus_skipped = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def queue_depth(self):
+        """Callers waiting for the focus lock plus commands queued on the console"""
+        return self.waiting + self.docker_manager.console.queue_depth
+
+    def stats(self):
+        return {
+            "focused": self.focused,
+            "queue_depth": self.queue_depth,
+            "waiting": self.waiting,
+            "runs": self.runs,
+            "wait_seconds": self.wait_seconds,
+            "max_wait": self.max_wait,
+            "focus_sent": self.focus_sent,
+            "focus_skipped": self.focus_skipped
+        }
+
+    def forget_focus(self):
+        """The focused world may have changed outside our commands, e.g. a world stopped"""
+        self.focused = None
+
+    async def send_command_async(self, command, timeout=5):
+        """Like DockerManager.send_command_async, errors come back as the output"""
+        try:
+            outputs = await self.send_batch_async([command], timeout)
+        except Exception as e:
+            return f"Error: {str(e)}"
+        return outputs[0] if outputs else ''
+
+    async def send_batch_async(self, commands, timeout=5, check=None):
+        """Run commands back-to-back, holding the focus lock unless all of them are focus-free"""
+        if all(is_focus_free(command) for command in commands):
+            return await self._send(commands, timeout, check)
+        async with self._locked():
+            return await self._send(commands, timeout, check)
+
+    async def run(self, commands, session_id, index, timeout=5):
+        """Run commands on the world with `session_id`, focusing it at `index` unless it already is.
+
+        After a `focus` the world's session is checked with `status` before
+        any of the commands run. Returns their outputs, or None when the world
+        at `index` turned out to be a different one and nothing was run.
+        """
+        async with self._locked():
+            if self.focused == session_id:
+                self.focus_skipped += 1
+                return await self._send(commands, timeout)
+
+            def same_session(i, output):
+                return i != 1 or parse_status(output).session_id == session_id
+
+            self.focus_sent += 1
+            outputs = await self._send([f"focus {index}", "status", *commands], timeout, same_session)
+            if len(outputs) <= 2:
+                return None
+            return outputs[2:]
+
+    @asynccontextmanager
+    async def _locked(self):
+        """Hold the focus lock, counting waiters and the time they waited"""
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._lock.acquire()
+        finally:
+            self.waiting -= 1
+        wait = time.perf_counter() - start
+        self.runs += 1
+        self.wait_seconds += wait
+        self.max_wait = max(self.max_wait, wait)
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    async def _send(self, commands, timeout=5, check=None):
+        def observe(i, output):
+            name = command_name(commands[i])
+            if name == 'status':
+                # `status` always describes the focused world
+                self.focused = parse_status(output).session_id or None
+            elif name in FOCUS_CHANGING:
+                self.focused = None
+            return check is None or check(i, output)
+
+        try:
+            return await self.docker_manager.send_batch_async(commands, timeout, check=observe)
+        except Exception:
+            self.focused = None
+            raise
+
@@ -0,0 +1,312 @@
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# Enough of the headless Config.json layout to catch edits that would stop it from starting.
+# Unknown keys are allowed, so newer headless builds with extra settings still validate.
+WORLD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "isEnabled": {"type": "boolean"},
+        "sessionName": {"type": ["string", "null"]},
+        "customSessionId": {"type": ["string", "null"]},
+        "description": {"type": ["string", "null"]},
+        "maxUsers": {"type": ["integer", "null"], "minimum": 1},
+        "accessLevel": {"type": ["string", "null"],
+                        "enum": ["Private", "LAN", "Contacts", "ContactsPlus", "RegisteredUsers", "Anyone", None]},
+        "hideFromPublicListing": {"type": ["boolean", "null"]},
+        "tags": {"type": ["array", "null"], "items": {"type": "string"}},
+        "mobileFriendly": {"type": "boolean"},
+        "loadWorldURL": {"type": ["string", "null"]},
+        "loadWorldPresetName": {"type": ["string", "null"]},
+        "autoInviteUsernames": {"type": ["array", "null"], "items": {"type": "string"}},
+        "defaultUserRoles": {"type": ["object", "null"]},
+        "awayKickMinutes": {"type": ["number", "null"]},
+        "idleRestartInterval": {"type": ["number", "null"]},
+        "forcedRestartInterval": {"type": ["number", "null"]},
+        "saveOnExit": {"type": "boolean"},
+        "autosaveInterval": {"type": ["number", "null"]},
+        "autoSleep": {"type": "boolean"}
+    }
+}
+
+CONFIG_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "comment": {"type": ["string", "null"]},
+        "universeId": {"type": ["string", "null"]},
+        "tickRate": {"type": "number", "minimum": 1},
+        "maxConcurrentAssetTransfers": {"type": "integer", "minimum": 1},
+        "usernameOverride": {"type": ["string", "null"]},
+        "loginCredential": {"type": ["string", "null"]},
+        "loginPassword": {"type": ["string", "null"]},
+        "startWorlds": {"type": ["array", "null"], "items": WORLD_SCHEMA},
+        "dataFolder": {"type": ["string", "null"]},
+        "cacheFolder": {"type": ["string", "null"]},
+        "logsFolder": {"type": ["string", "null"]},
+        "allowedUrlHosts": {"type": ["array", "null"], "items": {"type": "string"}},
+        "autoSpawnItems": {"type": ["array", "null"], "items": {"type": "string"}}
+    }
+}
+
+JSON_TYPES = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "null": lambda value: value is None
+}
+
+
+class ConfigConflict(Exception):
+    """The file changed since the version the caller based its edit on"""
+
+
+def validate(value, schema, path=''):
+    """Check `value` against a small JSON Schema subset; returns a list of error messages"""
+    errors = []
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        if not any(JSON_TYPES[name](value) for name in types):
+            return [f"{path or '/'}: expected {' or '.join(types)}"]
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path or '/'}: must be one of {', '.join(str(v) for v in schema['enum'] if v is not None)}")
+    if "minimum" in schema and JSON_TYPES["number"](value) and value < schema["minimum"]:
+        errors.append(f"{path or '/'}: must be at least {schema['minimum']}")
+    if isinstance(value, dict):
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate(value[key], subschema, f"{path}/{key}"))
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}/{i}"))
+    return errors
+
+
+def parse_pointer(pointer):
+    """Split a JSON Pointer (RFC 6901) into its unescaped tokens"""
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise ValueError(f"Invalid JSON pointer: {pointer}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def resolve(doc, tokens):
+    """The container holding the last token, and that token as a key or list index"""
+    target = doc
+    for token in tokens[:-1]:
+        target = target[list_index(target, token, False)] if isinstance(target, list) else target[token]
+    return target, tokens[-1]
+
+
+def list_index(target, token, appending):
+    if token == '-' and appending:
+        return len(target)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise ValueError(f"Invalid array index: {token}")
+    index = int(token)
+    if index > len(target) or (index == len(target) and not appending):
+        raise ValueError(f"Array index out of range: {token}")
+    return index
+
+
+def get_value(doc, tokens):
+    if not tokens:
+        return doc
+    parent, key = resolve(doc, tokens)
+    return parent[list_index(parent, key, False)] if isinstance(parent, list) else parent[key]
+
+
+def add_value(doc, tokens, value):
+    if not tokens:
+        return value
+    parent, key = resolve(doc, tokens)
+    if isinstance(parent, list):
+        parent.insert(list_index(parent, key, True), value)
+    else:
+        parent[key] = value
+    return doc
+
+
+def replace_value(doc, tokens, value):
+    """Replace an existing value in place, so object keys keep their order in the saved file"""
+    if not tokens:
+        return value
+    parent, key = resolve(doc, tokens)
+    if isinstance(parent, list):
+        parent[list_index(parent, key, False)] = value
+    else:
+        if key not in parent:
+            raise KeyError(key)
+        parent[key] = value
+    return doc
+
+
+def remove_value(doc, tokens):
+    if not tokens:
+        raise ValueError("Can't remove the whole document")
+    parent, key = resolve(doc, tokens)
+    if isinstance(parent, list):
+        return parent.pop(list_index(parent, key, False))
+    return parent.pop(key)
+
+
+def apply_patch(doc, operations):
+    """Apply a JSON Patch (RFC 6902) to a copy of `doc`; raises ValueError when any operation fails"""
+    if not isinstance(operations, list):
+        raise ValueError("A JSON patch must be a list of operations")
+    doc = copy.deepcopy(doc)
+    for i, operation in enumerate(operations):
+        try:
+            op = operation["op"]
+            tokens = parse_pointer(operation["path"])
+            if op == 'add':
+                doc = add_value(doc, tokens, copy.deepcopy(operation["value"]))
+            elif op == 'remove':
+                remove_value(doc, tokens)
+            elif op == 'replace':
+                doc = replace_value(doc, tokens, copy.deepcopy(operation["value"]))
+            elif op in ('move', 'copy'):
+                source = parse_pointer(operation["from"])
+                if op == 'move' and tokens[:len(source)] == source and tokens != source:
+                    raise ValueError("Can't move a value into itself")
+                value = remove_value(doc, source) if op == 'move' else copy.deepcopy(get_value(doc, source))
+                doc = add_value(doc, tokens, value)
+            elif op == 'test':
+                if get_value(doc, tokens) != operation["value"]:
+                    raise ValueError(f"Test failed at {operation['path']}")
+            else:
+                raise ValueError(f"Unknown operation: {op}")
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            raise ValueError(f"Patch operation {i} failed: {e!r}")
+        except ValueError as e:
+            raise ValueError(f"Patch operation {i} failed: {e}")
+    return doc
+
+
+class ConfigFile:
+    """One headless config file, cached until it changes on disk.
+
+    The parsed file is kept in memory and only read again when its inode,
+    mtime or size changes, so serving it costs one `stat`. Each version has
+    an ETag, and writes can require the version they were based on, so two
+    admins editing at once can't silently overwrite each other. Writes go
+    to a temporary file next to the config, are fsynced, and then renamed
+    over it, so a crash leaves either the old file or the new one. The new
+    file gets the old one's owner and mode. `write` creates the config when
+    there is none yet.
+    """
+
+    def __init__(self, path, schema=CONFIG_SCHEMA):
+        self.path = path
+        self.schema = schema
+        self.raw = None
+        self.data = None  # Parsed config, or None when the file isn't valid JSON
+        self.etag = None
+        self._key = None  # (inode, mtime, size) of the cached version
+        self._lock = threading.Lock()
+
+    def read(self):
+        """Return `(raw content, etag)`, reading the file again only if it changed"""
+        with self._lock:
+            self._refresh()
+            return self.raw, self.etag
+
+    def write(self, data, if_match=None):
+        """Replace the config with `data`, creating the file if needed; returns the new etag"""
+        with self._lock:
+            if os.path.exists(self.path):
+                self._check(if_match)
+                return self._write(data)
+            if if_match is not None:
+                raise ConfigConflict("The config file doesn't exist yet; reload it and try again")
+            return self._write(data, create=True)
+
+    def patch(self, operations, if_match=None):
+        """Apply a JSON Patch to the config; returns the new etag"""
+        with self._lock:
+            self._check(if_match)
+            if self.data is None:
+                raise ValueError("The config file isn't valid JSON, so it can't be patched")
+            return self._write(apply_patch(self.data, operations))
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            raise ValueError(f"Config file not found at {self.path}")
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if key == self._key:
+            return
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        self.raw = content.decode('utf-8')
+        self.etag = f'"{hashlib.sha1(content).hexdigest()[:20]}"'
+        try:
+            self.data = json.loads(self.raw)
+        except json.JSONDecodeError:
+            self.data = None
+        self._key = key
+
+    def _copy_ownership(self, temp_path):
+        """Give the temporary file the original's mode, owner and group before it replaces it"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        os.chmod(temp_path, st.st_mode & 0o7777)
+        temp = os.stat(temp_path)
+        if hasattr(os, 'chown') and (temp.st_uid, temp.st_gid) != (st.st_uid, st.st_gid):
+            try:
+                os.chown(temp_path, st.st_uid, st.st_gid)
+            except PermissionError:
+                print(f"Can't keep the owner of {self.path}; run the manager as that user or as root")
+
+    def _check(self, if_match):
+        self._refresh()
+        if if_match is not None and if_match != '*' and self.etag not in [tag.strip() for tag in if_match.split(',')]:
+            raise ConfigConflict("The config was changed by someone else; reload it and try again")
+
+    def _write(self, data, create=False):
+        errors = validate(data, self.schema)
+        if errors:
+            raise ValueError("Invalid config: " + "; ".join(errors))
+        if create:
+            # Create the file first, so the saved config gets the usual owner and umask mode
+            try:
+                os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            except FileExistsError:
+                pass
+        content = json.dumps(data, indent=2).encode('utf-8')
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            self._copy_ownership(temp_path)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        # Make the rename itself durable
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        self._refresh()
+        return self.etag
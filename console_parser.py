@@ -0,0 +1,329 @@
+import re
+
+
+ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+
+# [0] World Name	Users: 3	Present: 2	AccessLevel: Anyone	MaxUsers: 16
+WORLD_LINE = re.compile(
+    r'\[(?P<index>\d+)\]\s*(?P<name>.*?)\s*'
+    r'(?:Users:\s*(?P<users>\d+)\s*)?'
+    r'(?:Present:\s*(?P<present>\d+)\s*)?'
+    r'(?:AccessLevel:\s*(?P<access_level>\S+)\s*)?'
+    r'(?:MaxUsers:\s*(?P<max_users>\d+)\s*)?$'
+)
+
+# Key: Value
+STATUS_LINE = re.compile(r'(?P<key>[^:]+):\s?(?P<value>.*)')
+
+# Username	ID: U-abc	Role: Admin	Present: True	Ping: 23 ms	FPS: 60.0	Silenced: False
+USER_FIELD = re.compile(r'\s*\b(ID|Role|Present|Ping|FPS|Silenced):\s*(\S+)')
+
+# [0]	Username: name	UserID: U-abc	MachineIds: id1, id2
+BAN_LINE = re.compile(
+    r'\[(?P<index>\d+)\]\s*Username:\s*(?P<username>.*?)\s*'
+    r'UserID:\s*(?P<user_id>\S*)\s*MachineIds:\s*(?P<machine_ids>.*)'
+)
+
+URL = re.compile(r'\S+://\S+')
+
+# Console log lines that announce a change, as (event type, pattern). Patterns
+# are searched anywhere in the line so timestamp and FPS prefixes don't matter.
+EVENT_PATTERNS = [
+    ('user_joined', re.compile(
+        r'User Joined:?\s+(?P<world>.+?)\.\s+Username:\s*(?P<username>[^,]+?),\s*UserID:\s*(?P<user_id>[\w:-]+)',
+        re.IGNORECASE)),
+    ('user_left', re.compile(
+        r'User Left:?\s+(?P<world>.+?)\.\s+Username:\s*(?P<username>[^,]+?),\s*UserID:\s*(?P<user_id>[\w:-]+)',
+        re.IGNORECASE)),
+    ('user_joined', re.compile(
+        r'(?P<username>\S[^()]*?)\s+\((?P<user_id>U-[\w-]+)\)\s+joined(?:\s+world)?\s+(?P<world>.+?)\.?$',
+        re.IGNORECASE)),
+    ('user_left', re.compile(
+        r'(?P<username>\S[^()]*?)\s+\((?P<user_id>U-[\w-]+)\)\s+left(?:\s+world)?\s+(?P<world>.+?)\.?$',
+        re.IGNORECASE)),
+    ('world_started', re.compile(
+        r'(?:World running|World started|Session started)(?:\.\.\.)?(?::\s*(?P<world>.+?))?\s*$',
+        re.IGNORECASE)),
+    ('world_stopped', re.compile(
+        r'(?:World|Session) (?:shut ?down|closed|stopped)(?:\.\.\.)?(?::\s*(?P<world>.+?))?\s*$',
+        re.IGNORECASE)),
+]
+
+# Cheap first pass so ordinary log lines skip the event patterns entirely
+EVENT_HINT = re.compile(r'joined|left|running|started|shut ?down|closed|stopped', re.IGNORECASE)
+
+# .NET TimeSpan: [d.]hh:mm:ss[.fffffff]
+TIMESPAN = re.compile(r'(?:(\d+)\.)?(\d+):(\d+):(\d+)(?:\.\d+)?')
+
+
+def response_lines(output):
+    """Body lines of a console response, without the command echo and the prompt"""
+    lines = ANSI_ESCAPE.sub('', output).replace('\r\n', '\n').split('\n')[1:]
+    if lines and lines[-1].rstrip().endswith('>'):
+        lines.pop()
+    return [line.strip() for line in lines if line.strip()]
+
+
+def to_bool(value):
+    return value.strip().lower() == 'true'
+
+
+def to_int(value):
+    try:
+        return int(value.strip().removesuffix('ms'))
+    except ValueError:
+        return None
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def format_uptime(uptime_str):
+    """Convert .NET TimeSpan format to human readable format"""
+    match = TIMESPAN.fullmatch(uptime_str.strip())
+    if not match:
+        return uptime_str
+
+    days = int(match.group(1) or 0)
+    hours, minutes = int(match.group(2)), int(match.group(3))
+    # Older headless builds report days as hours past 24
+    days += hours // 24
+    hours %= 24
+
+    components = []
+    if days > 0:
+        components.append(f"{days} {'day' if days == 1 else 'days'}")
+    if hours > 0:
+        components.append(f"{hours} {'hour' if hours == 1 else 'hours'}")
+    if not days and minutes > 0:  # Only show minutes if less than a day
+        components.append(f"{minutes} {'minute' if minutes == 1 else 'minutes'}")
+
+    return ' '.join(components) if components else "just started"
+
+
+class Record:
+    """Base for parsed records; `fields` maps attribute names to JSON keys"""
+
+    __slots__ = ()
+    fields = {}
+
+    def __init__(self, **values):
+        for attr in self.__slots__:
+            setattr(self, attr, values.get(attr))
+
+    def to_dict(self):
+        return {key: getattr(self, attr) for attr, key in self.fields.items()}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        values = ', '.join(f"{attr}={getattr(self, attr)!r}" for attr in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+class WorldEntry(Record):
+    """One line of the `worlds` listing"""
+
+    __slots__ = ('index', 'name', 'users', 'present', 'access_level', 'max_users')
+    fields = {
+        'index': 'index',
+        'name': 'name',
+        'users': 'users',
+        'present': 'present',
+        'access_level': 'accessLevel',
+        'max_users': 'maxUsers'
+    }
+
+
+class WorldStatus(Record):
+    """The `status` of the focused world"""
+
+    __slots__ = ('name', 'session_id', 'users', 'present', 'max_users', 'uptime', 'access_level',
+                 'hidden', 'mobile_friendly', 'description', 'tags', 'user_names')
+    fields = {
+        'name': 'name',
+        'session_id': 'sessionId',
+        'users': 'users',
+        'present': 'present',
+        'max_users': 'maxUsers',
+        'uptime': 'uptime',
+        'access_level': 'accessLevel',
+        'hidden': 'hidden',
+        'mobile_friendly': 'mobileFriendly',
+        'description': 'description',
+        'tags': 'tags',
+        'user_names': 'userNames'
+    }
+
+
+class User(Record):
+    """One line of `users` for the focused world"""
+
+    __slots__ = ('username', 'user_id', 'role', 'present', 'ping', 'fps', 'silenced')
+    fields = {
+        'username': 'username',
+        'user_id': 'userId',
+        'role': 'role',
+        'present': 'present',
+        'ping': 'ping',
+        'fps': 'fps',
+        'silenced': 'silenced'
+    }
+
+
+class Ban(Record):
+    """One entry of `listbans`"""
+
+    __slots__ = ('username', 'user_id', 'machine_ids')
+    fields = {
+        'username': 'username',
+        'user_id': 'userId',
+        'machine_ids': 'machineIds'
+    }
+
+
+class Event(Record):
+    """A join, leave, world start or world stop announced in the console log"""
+
+    __slots__ = ('type', 'world', 'username', 'user_id')
+    fields = {
+        'type': 'type',
+        'world': 'world',
+        'username': 'username',
+        'user_id': 'userId'
+    }
+
+
+# Console label -> (attribute, converter)
+STATUS_FIELDS = {
+    'Name': ('name', str),
+    'SessionID': ('session_id', str),
+    'Current Users': ('users', to_int),
+    'Present Users': ('present', to_int),
+    'Max Users': ('max_users', to_int),
+    'Uptime': ('uptime', str),
+    'Access Level': ('access_level', str),
+    'Hidden from listing': ('hidden', to_bool),
+    'Mobile Friendly': ('mobile_friendly', to_bool),
+    'Description': ('description', str),
+    'Tags': ('tags', str),
+    'Users': ('user_names', lambda value: [name.strip() for name in value.split(',') if name.strip()])
+}
+
+USER_FIELDS = {
+    'ID': ('user_id', str),
+    'Role': ('role', str),
+    'Present': ('present', to_bool),
+    'Ping': ('ping', to_int),
+    'FPS': ('fps', to_float),
+    'Silenced': ('silenced', to_bool)
+}
+
+
+def parse_worlds(output):
+    """Parse `worlds` into a list of WorldEntry"""
+    worlds = []
+    for line in response_lines(output):
+        match = WORLD_LINE.match(line)
+        if not match:
+            continue
+        worlds.append(WorldEntry(
+            index=int(match['index']),
+            name=match['name'],
+            users=int(match['users']) if match['users'] else None,
+            present=int(match['present']) if match['present'] else None,
+            access_level=match['access_level'],
+            max_users=int(match['max_users']) if match['max_users'] else None
+        ))
+    return worlds
+
+
+def parse_status(output):
+    """Parse `status` into a WorldStatus; missing fields get the same defaults the UI expects"""
+    status = WorldStatus(
+        name='', session_id='', users=0, present=0, max_users=0, uptime='', access_level='',
+        hidden=False, mobile_friendly=False, description='', tags='', user_names=[]
+    )
+    for line in response_lines(output):
+        match = STATUS_LINE.match(line)
+        if not match:
+            continue
+        field = STATUS_FIELDS.get(match['key'])
+        if field is not None:
+            attr, convert = field
+            value = convert(match['value'])
+            if value is not None:
+                setattr(status, attr, value)
+    return status
+
+
+def parse_users(output):
+    """Parse `users` into a list of User"""
+    users = []
+    for line in response_lines(output):
+        user = User()
+        username_end = None
+        for match in USER_FIELD.finditer(line):
+            if username_end is None:
+                username_end = match.start()
+            attr, convert = USER_FIELDS[match.group(1)]
+            setattr(user, attr, convert(match.group(2)))
+        user.username = line[:username_end].strip() if username_end is not None else line.split()[0]
+        users.append(user)
+    return users
+
+
+def parse_bans(output):
+    """Parse `listbans` into a list of Ban"""
+    bans = []
+    for line in response_lines(output):
+        match = BAN_LINE.match(line)
+        if match:
+            bans.append(Ban(
+                username=match['username'],
+                user_id=match['user_id'],
+                machine_ids=[machine_id for machine_id in re.split(r'[,\s]+', match['machine_ids']) if machine_id]
+            ))
+    return bans
+
+
+def parse_friend_requests(output):
+    """Parse `friendRequests` into a list of usernames"""
+    return response_lines(output)
+
+
+def parse_session_url(output):
+    """Parse `sessionUrl` into the URL, or None when the world has none"""
+    for line in response_lines(output):
+        match = URL.search(line)
+        if match:
+            return match.group(0)
+    return None
+
+
+def parse_event(line):
+    """Parse one console log line into an Event, or None when it announces nothing"""
+    if not EVENT_HINT.search(line):
+        return None
+    line = ANSI_ESCAPE.sub('', line)
+    for event_type, pattern in EVENT_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            values = match.groupdict()
+            return Event(
+                type=event_type,
+                world=values.get('world'),
+                username=values.get('username'),
+                user_id=values.get('user_id')
+            )
+    return None
+
+
+def parse_events(output):
+    """Parse a block of console log lines into a list of Event"""
+    return [event for event in map(parse_event, output.replace('\r\n', '\n').split('\n')) if event is not None]
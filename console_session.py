@@ -0,0 +1,254 @@
+import codecs
+import queue
+import select
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from instrumentation import COMMAND_ERRORS, COMMAND_SECONDS, COMMAND_TIMEOUTS, docker_call
+from stream_decoder import ANSI_ESCAPE, DockerFrameReader
+
+
+class ConsoleSession:
+    """One long-lived attach connection to a headless console.
+
+    Commands are queued and written one at a time by a worker thread. A reader
+    thread drains the socket continuously, and the output that follows a
+    command is framed by the console prompt (a line ending in `>` with no
+    newline after it), so each response is matched to the command that was
+    written before it and returns as soon as the prompt comes back. When the
+    prompt differs from the one the command was echoed at (after `focus`, for
+    example) a short grace period catches any output still in flight. Until
+    the command's echo has been seen, a prompt is most likely the end of log
+    output printed before the command was read, so the console has to stay
+    quiet for the longer `echo_grace` before that counts as the end. A batch
+    is written back-to-back with nothing from other callers in between, so
+    commands like `focus` keep their effect for the rest of the batch.
+    """
+
+    def __init__(self, get_container, prompt_grace=0.02, echo_grace=0.25, name=None):
+        self._get_container = get_container  # Callable returning the docker container
+        self.name = name  # Container name used to label the command metrics
+        self.prompt_grace = prompt_grace  # Quiet time after a prompt before a response is final
+        self.echo_grace = echo_grace  # Quiet time needed instead when the command's echo hasn't been seen
+        self.ansi_escape = ANSI_ESCAPE
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._socket = None
+        self._pending = None  # Output collected for the command in flight
+        self._prompt = ''  # Prompt the last response ended with, where the next command is typed
+        self._busy = deque(maxlen=32)  # [start, end] wall-clock times of recent commands and batches
+        self._worker = None
+        self._closed = False
+
+    def submit(self, command, timeout=5):
+        """Queue a command and return a Future resolving to its raw output"""
+        future = Future()
+        self._queue.put((command, timeout, None, future))
+        self._ensure_worker()
+        return future
+
+    def submit_batch(self, commands, timeout=5, check=None):
+        """Queue commands to run back-to-back; the Future resolves to a list of raw outputs.
+
+        `check` is called with the position and raw output of each command as
+        it completes, and returning False stops the batch there, so the list
+        can be shorter than `commands`.
+        """
+        future = Future()
+        self._queue.put((list(commands), timeout, check, future))
+        self._ensure_worker()
+        return future
+
+    def execute(self, command, timeout=5):
+        """Run a command and block until its response is complete"""
+        return self.submit(command, timeout).result()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Drop the attach connection; the next command reconnects"""
+        with self._cond:
+            socket, self._socket = self._socket, None
+            self._cond.notify_all()
+        if socket is not None:
+            try:
+                socket.close()
+            except Exception:
+                pass
+
+    def shutdown(self):
+        self._closed = True
+        self._queue.put(None)
+        self.close()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._work, name='console-session', daemon=True)
+            self._worker.start()
+
+    def _work(self):
+        while not self._closed:
+            item = self._queue.get()
+            if item is None:
+                break
+            command, timeout, check, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            window = [time.time(), None]
+            self._busy.append(window)
+            try:
+                if isinstance(command, list):
+                    result = self._run_batch(command, timeout, check)
+                else:
+                    result = self._run(command, timeout)
+            except Exception as e:
+                window[1] = time.time()
+                future.set_exception(e)
+                continue
+            # Close the window before the caller wakes up, so output after it counts as the console's own
+            window[1] = time.time()
+            future.set_result(result)
+
+    def busy_at(self, ts):
+        """True when a command was in flight at wall-clock time `ts`, so output written then is its echo or response"""
+        for start, end in list(self._busy):
+            if start <= ts and (end is None or ts <= end):
+                return True
+        return False
+
+    def _connect(self):
+        with self._cond:
+            if self._socket is not None:
+                return self._socket
+        container = self._get_container()
+        with docker_call('attach'):
+            socket = container.attach_socket(params={
+                'stdin': True,
+                'stdout': True,
+                'stderr': True,
+                'stream': True,
+                'logs': False
+            })
+        with self._cond:
+            self._socket = socket
+        threading.Thread(target=self._read, args=(socket,), name='console-reader', daemon=True).start()
+        return socket
+
+    def _read(self, socket):
+        """Drain the attach socket so the container never blocks on this connection"""
+        # A container without a TTY multiplexes stdout and stderr in frames on the raw socket
+        frames = DockerFrameReader()
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            while self._socket is socket:
+                ready = select.select([socket._sock], [], [], 1.0)
+                if not ready[0]:
+                    continue
+                data = socket._sock.recv(4096)
+                if not data:
+                    break
+                text = decoder.decode(frames.feed(data))
+                with self._cond:
+                    if self._pending is not None:
+                        self._pending.append(text)
+                        self._cond.notify_all()
+        except Exception as e:
+            if self._socket is socket:  # Otherwise the socket was closed on purpose
+                print(f"Console session read error: {e}")
+        finally:
+            with self._cond:
+                if self._socket is socket:
+                    self._socket = None
+                self._cond.notify_all()
+
+    def _run_batch(self, commands, timeout, check):
+        outputs = []
+        for i, command in enumerate(commands):
+            outputs.append(self._run(command, timeout))
+            if check is not None and not check(i, outputs[-1]):
+                break
+        return outputs
+
+    def _run(self, command, timeout):
+        start = time.perf_counter()
+        try:
+            socket = self._connect()
+        except Exception:
+            COMMAND_ERRORS.labels(container=self.name).inc()
+            raise
+        with self._cond:
+            self._pending = []
+        try:
+            socket._sock.sendall(f"{command}\r".encode('utf-8'))
+            deadline = time.monotonic() + timeout
+            with self._cond:
+                seen = 0
+                settle_at = None
+                while True:
+                    text = ''.join(self._pending)
+                    if self._is_complete(text):
+                        if len(text) == seen or self._is_echo_prompt(command, text):
+                            break
+                        seen = len(text)
+                        if self._has_echo(command, text):
+                            # Give any output still in flight a moment to arrive, counted from the first
+                            # prompt so a console busy printing logs can't keep the response open
+                            settle_at = settle_at or time.monotonic() + self.prompt_grace
+                            if time.monotonic() >= settle_at:
+                                break
+                            self._cond.wait(settle_at - time.monotonic())
+                        else:
+                            self._cond.wait(self.echo_grace)
+                        continue
+                    seen = len(text)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        COMMAND_TIMEOUTS.labels(container=self.name).inc()
+                        break
+                    if self._socket is not socket:
+                        break
+                    self._cond.wait(remaining)
+        except Exception:
+            COMMAND_ERRORS.labels(container=self.name).inc()
+            raise
+        finally:
+            with self._cond:
+                self._pending = None
+        if self._is_complete(text):
+            self._prompt = self.ansi_escape.sub('', text.rpartition('\n')[2]).strip()
+        name = command.split(maxsplit=1)[0].lower() if command.strip() else ''
+        COMMAND_SECONDS.labels(container=self.name, command=name).observe(time.perf_counter() - start)
+        return self._frame(command, text)
+
+    def _is_complete(self, text):
+        """A response is complete once the unterminated last line is a prompt"""
+        head, newline, tail = text.rpartition('\n')
+        if not newline:
+            return False
+        return self.ansi_escape.sub('', tail).rstrip().endswith('>')
+
+    def _has_echo(self, command, text):
+        return any(self.ansi_escape.sub('', line).strip().endswith(command) for line in text.split('\n')[:-1])
+
+    def _is_echo_prompt(self, command, text):
+        """True when the final prompt is the one our command was typed at, so nothing more is coming"""
+        head, newline, tail = text.rpartition('\n')
+        prompt = self.ansi_escape.sub('', tail).strip()
+        for line in head.split('\n'):
+            line = self.ansi_escape.sub('', line).strip()
+            if line.endswith(command):
+                # The echo is only the command when it was typed at the prompt ending the last response
+                return (line[:-len(command)].strip() or self._prompt) == prompt
+        return False
+
+    def _frame(self, command, text):
+        """Drop anything that arrived before the echo of our command"""
+        lines = text.replace('\r\n', '\n').split('\n')
+        for i, line in enumerate(lines):
+            if self.ansi_escape.sub('', line).strip().endswith(command):
+                return '\n'.join(lines[i:])
+        return text
@@ -1,27 +1,141 @@
 import docker
-import select
+import asyncio
+import calendar
 import time
-import re
 from collections import deque
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from threading import Event, Lock
+from console_session import ConsoleSession
+from instrumentation import docker_call
+from stream_decoder import LineDecoder, clean_line
+
+def parse_container_stats(stats):
+    """Turn a raw Docker stats sample into CPU, memory and network figures"""
+    cpu_stats = stats.get('cpu_stats', {})
+    precpu_stats = stats.get('precpu_stats', {})
+    cpu_delta = cpu_stats.get('cpu_usage', {}).get('total_usage', 0) - \
+        precpu_stats.get('cpu_usage', {}).get('total_usage', 0)
+    system_delta = cpu_stats.get('system_cpu_usage', 0) - precpu_stats.get('system_cpu_usage', 0)
+    online_cpus = cpu_stats.get('online_cpus') or len(cpu_stats.get('cpu_usage', {}).get('percpu_usage') or []) or 1
+    cpu_percent = (cpu_delta / system_delta) * online_cpus * 100 if cpu_delta > 0 and system_delta > 0 else 0.0
+
+    memory_stats = stats.get('memory_stats', {})
+    # Page cache doesn't count against the container, matching `docker stats`
+    cache = memory_stats.get('stats', {}).get('inactive_file', memory_stats.get('stats', {}).get('cache', 0))
+    memory_bytes = max(memory_stats.get('usage', 0) - cache, 0)
+    memory_limit = memory_stats.get('limit', 0)
+
+    networks = stats.get('networks', {}) or {}
+    return {
+        'cpu_percent': cpu_percent,
+        'memory_bytes': memory_bytes,
+        'memory_limit': memory_limit,
+        'memory_percent': memory_bytes / memory_limit * 100 if memory_limit else 0.0,
+        'network_rx_bytes': sum(n.get('rx_bytes', 0) for n in networks.values()),
+        'network_tx_bytes': sum(n.get('tx_bytes', 0) for n in networks.values())
+    }
+
+def parse_docker_timestamp(value):
+    """Seconds since the epoch from a timestamp as Docker writes them, e.g. 2024-05-01T12:00:00.123456789Z"""
+    base, _, fraction = value.rstrip('Z').partition('.')
+    if not fraction.isdigit() and fraction:
+        raise ValueError(f"Invalid timestamp: {value}")
+    return _parse_docker_second(base) + float(f"0.{fraction or 0}")
+
+@lru_cache(maxsize=64)
+def _parse_docker_second(base):
+    # Lines printed in the same second share this, and strptime is the slow part
+    return calendar.timegm(time.strptime(base, '%Y-%m-%dT%H:%M:%S'))
+
+class DockerBackend:
+    """Where containers come from: the local Docker daemon.
+
+    A backend has `get(name)`, returning a container, and `list(label)`,
+    returning all containers with that label (or every container). The
+    containers need the parts of docker-py's Container that the manager
+    uses: `name`, `id`, `status`, `attach_socket`, `logs`, `stats`, `stop`,
+    `kill`, `wait`, `restart` and `reload`. `headless_simulator.SimulatedBackend`
+    is the other implementation.
+    """
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        """Docker client, created on first use so importing doesn't require a running daemon"""
+        if self._client is None:
+            self._client = docker.from_env()
+        return self._client
+
+    def get(self, name):
+        return self.client.containers.get(name)
+
+    def list(self, label=None):
+        filters = {'label': label} if label else {}
+        return self.client.containers.list(all=True, filters=filters)
+
 
 class DockerManager:
-    def __init__(self, container_name):
-        self.client = docker.from_env()
+    def __init__(self, container_name, max_workers=4, backend=None, executor=None,
+                 reconnect_min_delay=0.5, reconnect_max_delay=10):
+        self.backend = backend or DockerBackend()  # Lets a fleet share one backend
         self.container_name = container_name
+        # Bounded pool for the blocking Docker/console calls so they never run on the event loop
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='docker-io')
         self.output_buffer = deque(maxlen=25)  # Rolling buffer of last 25 lines
         self.buffer_lock = Lock()  # Thread-safe access to buffer
-        # Regex pattern for ANSI escape sequences
-        self.ansi_escape = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]|\x1B[()][AB012]')
         self._monitor_running = False
+        self._monitor_stop = Event()  # Set by stop_monitor to end a reconnect wait early
+        self._monitor_stream = None  # Log stream being read, closed by stop_monitor
+        self.reconnect_min_delay = reconnect_min_delay  # Seconds before the first reconnect attempt
+        self.reconnect_max_delay = reconnect_max_delay
+        # Long-lived attach connection shared by every console command
+        self.console = ConsoleSession(self.get_container, name=container_name)
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Run a blocking call on the Docker I/O pool and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def send_command_async(self, command, timeout=5):
+        """Async version of send_command; waits on the console queue without holding a pool thread"""
+        try:
+            result = await asyncio.wrap_future(self.console.submit(command, timeout))
+            clean_lines = self.clean_output(result.strip())
+            return '\n'.join(clean_lines)
+        except docker.errors.NotFound:
+            return f"Container {self.container_name} not found"
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    async def send_batch_async(self, commands, timeout=5, check=None):
+        """Run commands back-to-back on the console with nothing interleaved; returns their cleaned outputs.
+
+        `check(i, output)` can stop the batch early by returning False, see ConsoleSession.submit_batch.
+        """
+        results = await asyncio.wrap_future(self.console.submit_batch(commands, timeout, check))
+        return ['\n'.join(self.clean_output(result.strip())) for result in results]
+
+    async def get_container_status_async(self):
+        """Async version of get_container_status that runs on the Docker I/O pool"""
+        return await self.run_blocking(self.get_container_status)
+
+    async def restart_container_async(self, progress=None):
+        """Async version of restart_container that runs on the Docker I/O pool"""
+        return await self.run_blocking(self.restart_container, progress)
+
+    def shutdown(self):
+        """Stop accepting work on the Docker I/O pool and close the console session"""
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self.console.shutdown()
 
     def clean_output(self, text):
         """Clean and format output text by removing ANSI sequences and handling line breaks"""
-        # Remove all ANSI escape sequences
-        clean_text = self.ansi_escape.sub('', text)
-
-        # Split on both \r\n and \n, and filter out empty lines
-        lines = [line.strip() for line in clean_text.replace('\r\n', '\n').split('\n')]
+        lines = [clean_line(line) for line in text.split('\n')]
         return [line for line in lines if line]  # Return only non-empty lines
 
 
@@ -35,45 +149,14 @@ class DockerManager:
         with self.buffer_lock:
             return list(self.output_buffer)[-count:]
 
-    def send_command(self, command, timeout=1):
+    def get_container(self):
+        with docker_call('get'):
+            return self.backend.get(self.container_name)
+
+    def send_command(self, command, timeout=5):
         """Send a command to the container and return the output"""
         try:
-            container = self.client.containers.get(self.container_name)
-
-            # Get raw connection to container without logs
-            socket = container.attach_socket(params={
-                'stdin': True,
-                'stdout': True,
-                'stderr': True,
-                'stream': True,
-                'logs': False
-            })
-
-            # Send the command with a carriage return
-            cmd_bytes = f"{command}\r".encode('utf-8')
-            socket._sock.send(cmd_bytes)
-
-            # Read the response with timeout
-            output = []
-            start_time = time.time()
-            no_data_count = 0  # Counter for consecutive no-data readings
-
-            while True:
-                ready = select.select([socket._sock], [], [], 0.1)
-                if ready[0]:
-                    chunk = socket._sock.recv(4096).decode('utf-8')
-                    if chunk:
-                        output.append(chunk)
-                        no_data_count = 0  # Reset counter when we get data
-                        continue
-
-                no_data_count += 1
-                # Break if we've had no data for 3 consecutive reads or exceeded timeout
-                if no_data_count >= 3 or (time.time() - start_time > timeout):
-                    break
-
-            socket.close()
-            result = ''.join(output).strip()
+            result = self.console.execute(command, timeout).strip()
             # Use clean_output instead of direct ANSI escape removal
             clean_lines = self.clean_output(result)
             return '\n'.join(clean_lines)
@@ -83,76 +166,133 @@ class DockerManager:
         except Exception as e:
             return f"Error: {str(e)}"
 
-    def monitor_output(self, callback):
-        """Monitor container output continuously"""
+    def monitor_output(self, callback, on_status=None):
+        """Read the container's output until stop_monitor, reconnecting whenever the stream ends.
+
+        Output comes from Docker's log stream with timestamps, so after the
+        socket drops or the container restarts the stream is reopened with
+        `since` set to the last line delivered: lines printed in between
+        arrive late instead of being lost, and lines at or before that point
+        are skipped as duplicates. Reconnects back off from
+        `reconnect_min_delay` to `reconnect_max_delay`.
+
+        `callback(lines)` gets the cleaned lines of each chunk read, as a list
+        of `(ts, line)` with their Docker timestamps.
+        `on_status(state, details)` hears about `disconnected` and `reconnected`;
+        a reconnect carries `gap` when output may be missing, e.g. after the
+        container was recreated and its old logs went with it.
+        """
+        self._monitor_stop.clear()
         self._monitor_running = True
-        buffer = ""
+        last_ts = None  # Docker timestamp of the last line delivered
+        at_last_ts = 0  # Lines delivered with exactly that timestamp
+        container_id = None  # Resuming only works within the same container
+        disconnected_at = None
+        delay = self.reconnect_min_delay
         try:
-            container = self.client.containers.get(self.container_name)
-            # Completely disable historical logs and only get new output
-            socket = container.attach_socket(params={
-                'stdin': False,
-                'stdout': True,
-                'stderr': True,
-                'stream': True,
-                'logs': False,  # Disable historical logs
-                'since': 0,     # Ignore any historical logs
-            })
-
-            # Send initial carriage returns to get prompt
-            cmd_socket = container.attach_socket(params={
-                'stdin': True,
-                'stdout': True,
-                'stderr': True,
-                'stream': True,
-                'logs': False  # Also disable logs for command socket
-            })
-            cmd_socket._sock.send(b'\r')
-            cmd_socket.close()
-
             while self._monitor_running:
-                ready = select.select([socket._sock], [], [], 0.1)
-                if ready[0]:
-                    try:
-                        chunk = socket._sock.recv(2048).decode('utf-8')
-                        if chunk:
-                            # Append chunk to buffer
-                            buffer += chunk
-
-                            # Process complete lines
-                            while '\n' in buffer:
-                                line, buffer = buffer.split('\n', 1)
-                                line = line.strip()
-                                if line:
-                                    # Use clean_output for single line
-                                    clean_lines = self.clean_output(line)
-                                    for clean_line in clean_lines:
-                                        self.add_to_buffer(clean_line)
-                                        callback(clean_line + '\n')
-
-                            # If buffer gets too large, clear it
-                            if len(buffer) > 2048:
-                                buffer = buffer[-1024:]
-
-                    except Exception as e:
-                        print(f"Error reading from socket: {e}")
-                        break
+                connected_at = time.monotonic()
+                error = None
+                try:
+                    container = self.get_container()
+                    if last_ts is None:
+                        # Only output from now on; later reconnects resume from here
+                        last_ts = time.time()
+                    since = last_ts
+                    with docker_call('logs'):
+                        stream = container.logs(stdout=True, stderr=True, stream=True, follow=True,
+                                                timestamps=True, since=since)
+                    self._monitor_stream = stream
+                    if disconnected_at is not None and on_status is not None:
+                        details = {"since": last_ts, "disconnected_at": disconnected_at}
+                        if container_id is not None and container.id != container_id:
+                            details["gap"] = {"start": last_ts, "end": None,
+                                              "reason": "The container was recreated"}
+                        on_status('reconnected', details)
+                    disconnected_at = None
+                    container_id = container.id
+                    last_ts, at_last_ts = self._read_log_stream(stream, callback, last_ts, at_last_ts)
+                except docker.errors.NotFound:
+                    error = f"Container {self.container_name} not found"
+                except Exception as e:
+                    error = str(e)
+                finally:
+                    stream, self._monitor_stream = self._monitor_stream, None
+                    if stream is not None:
+                        try:
+                            stream.close()
+                        except Exception:
+                            pass
+                if not self._monitor_running:
+                    break
 
-        except docker.errors.NotFound:
-            print(f"Container {self.container_name} not found")
-        except Exception as e:
-            print(f"Error: {str(e)}")
+                if disconnected_at is None:
+                    disconnected_at = time.time()
+                    if error is not None:
+                        print(f"Output stream of {self.container_name} failed: {error}")
+                    if on_status is not None:
+                        on_status('disconnected', {"since": last_ts, "error": error})
+                if time.monotonic() - connected_at > self.reconnect_max_delay:
+                    # The last connection was healthy for a while, so start over with short delays
+                    delay = self.reconnect_min_delay
+                if self._monitor_stop.wait(delay):
+                    break
+                delay = min(delay * 2, self.reconnect_max_delay)
         finally:
             self._monitor_running = False
+
+    def _read_log_stream(self, stream, callback, last_ts, at_last_ts=0):
+        """Deliver the lines of one log stream after `last_ts`.
+
+        `since` includes lines at exactly `last_ts`, so the first `at_last_ts`
+        of those are skipped as already delivered. Returns the new
+        `(last_ts, at_last_ts)`.
+        """
+        # docker-py already strips the frame headers from a log stream, so this only decodes and splits
+        decoder = LineDecoder()
+        resume_after, skip = last_ts, at_last_ts  # Lines up to here were delivered before the reconnect
+        for chunk in stream:
+            if not self._monitor_running:
+                break
+            batch = []
+            for line in decoder.feed(chunk):
+                stamp, _, text = line.partition(' ')
+                try:
+                    ts = parse_docker_timestamp(stamp)
+                except ValueError:
+                    ts, text = time.time(), line
+                if resume_after is not None:
+                    if ts < resume_after or (ts == resume_after and skip > 0):
+                        skip -= ts == resume_after
+                        continue
+                    resume_after = None
+                at_last_ts = at_last_ts + 1 if ts == last_ts else 1
+                last_ts = ts
+                text = clean_line(text)
+                if text:
+                    batch.append((ts, text))
+            if batch:
+                with self.buffer_lock:
+                    self.output_buffer.extend(line for ts, line in batch)
+                callback(batch)
+        return last_ts, at_last_ts
+
+    def stop_monitor(self):
+        """Ask the running monitor_output loop to exit"""
+        self._monitor_running = False
+        self._monitor_stop.set()
+        stream = self._monitor_stream
+        if stream is not None:
+            # Unblocks the read waiting on the stream
             try:
-                socket.close()
-            except:
+                stream.close()
+            except Exception:
                 pass
 
     def get_container_status(self):
         """Get container status information"""
         try:
-            container = self.client.containers.get(self.container_name)
+            container = self.get_container()
             return {
                 'status': container.status,
                 'name': container.name,
@@ -161,43 +301,72 @@ class DockerManager:
         except Exception as e:
             return {'error': str(e)}
 
-    def restart_container(self):
-        """Safely restart the Docker container"""
+    def stream_container_stats(self):
+        """Yield parsed CPU, memory and network samples from Docker's stats stream (about one per second)"""
+        container = self.get_container()
+        with docker_call('stats'):
+            stream = container.stats(stream=True, decode=True)
+        for stats in stream:
+            yield parse_container_stats(stats)
+
+    def restart_container(self, progress=None):
+        """Safely restart the Docker container.
+
+        `progress(stage, message)` is called as the restart moves through
+        `stopping`, `killing` (only when a graceful stop fails), `starting`
+        and `running`. The output monitor keeps going and resumes once the
+        container is back.
+        """
+        def report(stage, message):
+            if progress is not None:
+                progress(stage, message)
+
         try:
-            container = self.client.containers.get(self.container_name)
+            container = self.get_container()
 
-            # Stop monitoring if it's running
-            self._monitor_running = False
+            # The console connection dies with the container; reconnect on next command
+            self.console.close()
 
             # First try to gracefully stop the container
+            report('stopping', f"Stopping {self.container_name}")
             try:
-                container.stop(timeout=30)  # Give it 30 seconds to stop gracefully
+                with docker_call('stop'):
+                    container.stop(timeout=30)  # Give it 30 seconds to stop gracefully
             except Exception as e:
                 print(f"Warning: Failed to stop container gracefully: {e}")
                 # Try to force kill if graceful stop fails
-                container.kill()
+                report('killing', f"Graceful stop failed ({e}), killing {self.container_name}")
+                with docker_call('kill'):
+                    container.kill()
 
             # Wait for container to fully stop
             try:
-                container.wait(timeout=35)
+                with docker_call('wait'):
+                    container.wait(timeout=35)
             except Exception as e:
                 print(f"Warning: Container wait timeout: {e}")
 
             # Restart the container
-            container.restart()
+            report('starting', f"Starting {self.container_name}")
+            with docker_call('restart'):
+                container.restart()
 
             # Wait for container to be running
             retries = 0
             while retries < 10:
-                container.reload()
+                with docker_call('reload'):
+                    container.reload()
                 if container.status == 'running':
                     break
                 time.sleep(1)
                 retries += 1
+            if container.status != 'running':
+                raise Exception(f"Container is {container.status} after the restart")
 
+            report('running', f"{self.container_name} is running")
             return True
 
         except docker.errors.NotFound:
             raise Exception(f"Container {self.container_name} not found")
         except Exception as e:
-            raise Exception(f"Failed to restart container: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to restart container: {str(e)}")
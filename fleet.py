@@ -0,0 +1,302 @@
+import asyncio
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from command_executor import CommandExecutor
+from console_parser import parse_event
+from docker_manager import DockerBackend, DockerManager
+from instrumentation import docker_call
+from log_monitor import LogMonitor
+from log_store import LogStore
+from user_index import UserIndex
+from world_poller import WorldPoller
+
+
+class Headless:
+    """Everything the manager keeps for one headless container"""
+
+    def __init__(self, container_id, docker_manager, publish_worlds, max_age=5, detail_max_age=60, queue_size=500, log_store=None, broadcast=None, user_index=None):
+        self.id = container_id
+        self.docker_manager = docker_manager
+        self.broadcast = broadcast  # async callable taking a message for this container's clients
+        self.publish_worlds = partial(publish_worlds, container_id)
+        self.user_index = user_index  # Shared UserIndex kept up to date with this container's worlds
+        self._indexed_version = None  # Worlds snapshot version last fed to the user index
+        # Every console command goes through the executor so it always knows the focused world
+        self.executor = CommandExecutor(docker_manager)
+        self.world_poller = WorldPoller(
+            self.executor,
+            self.on_worlds_update,
+            max_age=max_age,
+            detail_max_age=detail_max_age,
+            name=container_id,
+            console_busy=docker_manager.console.busy_at
+        )
+        self.log_store = log_store
+        self.log_monitor = LogMonitor(docker_manager, queue_size=queue_size, log_store=log_store)
+        # Log output naming a world marks it for the next crawl
+        self.log_monitor.listeners.append(self.world_poller.note_output)
+        self.log_monitor.listeners.append(self.on_output)
+        self.log_monitor.status_listeners.append(self.on_stream_status)
+        self.restart_task = None
+
+    async def on_worlds_update(self):
+        """World poller callback: index the users in a changed snapshot, then send it to clients"""
+        poller = self.world_poller
+        if self.user_index is not None and poller.version != self._indexed_version:
+            self._indexed_version = poller.version
+            self.user_index.update_worlds(self.id, poller.worlds)
+        await self.publish_worlds()
+
+    def on_output(self, ts, line):
+        """Log monitor listener: turn joins, leaves and world starts/stops into events"""
+        event = parse_event(line)
+        if event is None:
+            return
+        if event.type in ('world_started', 'world_stopped'):
+            self.executor.forget_focus()
+        if self.world_poller.apply_event(event):
+            self.world_poller.publish_soon()
+        if self.broadcast is not None:
+            asyncio.create_task(self.broadcast({**event.to_dict(), "ts": ts}))
+
+    def on_stream_status(self, state, details):
+        """Log monitor status listener: tell clients the output stream dropped or came back"""
+        if state == 'reconnected':
+            # The container may have restarted, so its worlds and focus are unknown
+            self.executor.forget_focus()
+            self.world_poller.invalidate()
+            self.world_poller.request_refresh()
+        if self.broadcast is not None:
+            asyncio.create_task(self.broadcast({"type": "log_stream", "state": state, **details}))
+
+    @property
+    def is_restarting(self):
+        return self.restart_task is not None and not self.restart_task.done()
+
+    def restart(self):
+        """Restart the container in the background, sending each step to clients as `restart_progress`"""
+        if self.is_restarting:
+            raise RuntimeError("A restart is already in progress")
+        self.restart_task = asyncio.create_task(self._restart())
+        return self.restart_task
+
+    async def _restart(self):
+        loop = asyncio.get_running_loop()
+
+        def progress(stage, message):
+            # Called from the Docker I/O thread
+            loop.call_soon_threadsafe(self._send_restart_progress, stage, message)
+
+        try:
+            await self.docker_manager.restart_container_async(progress)
+        except Exception as e:
+            print(f"Error restarting {self.id}: {e}")
+            self._send_restart_progress('failed', str(e))
+        finally:
+            self.executor.forget_focus()
+
+    def _send_restart_progress(self, stage, message):
+        if self.broadcast is not None:
+            asyncio.create_task(self.broadcast({"type": "restart_progress", "stage": stage, "message": message,
+                                                "ts": time.time()}))
+
+    async def run_batch(self, commands, session_id=None, timeout=5):
+        """Run console commands back-to-back, on the world with `session_id` when one is given.
+
+        The executor focuses the world, unless it already is, and checks with
+        `status` that it really has that session, so none of the commands run
+        on the wrong world when the listing shifted since the last crawl. A
+        mismatch recrawls the worlds and tries once more. The focus lock is
+        held for the whole batch, so other callers can't refocus in between.
+
+        Returns a `{"command", "output"}` dict for each command.
+        """
+        commands = list(commands)
+        if not commands:
+            return []
+        if session_id is None:
+            outputs = await self.executor.send_batch_async(commands, timeout)
+            return [{"command": c, "output": o} for c, o in zip(commands, outputs)]
+
+        for attempt in range(2):
+            index = self.world_poller.world_index(session_id)
+            if index is not None:
+                outputs = await self.executor.run(commands, session_id, index, timeout)
+                if outputs is not None:
+                    # The commands may have changed the world, so pick the changes up right away
+                    self.world_poller.invalidate(session_id)
+                    self.world_poller.request_refresh(again=True)
+                    return [{"command": c, "output": o} for c, o in zip(commands, outputs)]
+            if attempt == 0:
+                # The cached details are what pointed us at the wrong index, so refetch them all
+                self.world_poller.invalidate()
+                await self.world_poller.refresh(again=True)
+        raise KeyError(f"Unknown world: {session_id}")
+
+    def start(self):
+        self.log_monitor.start()
+
+    async def stop(self):
+        if self.restart_task is not None:
+            self.restart_task.cancel()
+        await self.world_poller.stop()
+        self.log_monitor.stop()
+        self.docker_manager.shutdown()
+
+
+class Fleet:
+    """Registry of the headless containers managed by this process.
+
+    Containers are found by Docker label, by a regex on the container name,
+    or from a fixed list of names. All of them share one backend and
+    one I/O thread pool, so each extra headless only costs its own console
+    session and monitor thread.
+    """
+
+    def __init__(self, broadcast, publish_worlds, names=(), label=None, pattern=None, max_workers=8,
+                 discovery_interval=60, max_age=5, detail_max_age=60, queue_size=500,
+                 log_dir=None, log_segment_size=4 * 1024 * 1024, log_max_segments=32,
+                 on_added=None, on_removed=None, backend=None):
+        self.backend = backend or DockerBackend()  # Shared by every DockerManager in the fleet
+        self.broadcast = broadcast  # async callable taking (container_id, message)
+        self.publish_worlds = publish_worlds  # async callable taking container_id after each crawl
+        self.on_added = on_added  # callable taking each new Headless
+        self.on_removed = on_removed  # callable taking the id of each removed container
+        self.names = [name for name in names if name]
+        self.label = label
+        self.pattern = re.compile(pattern) if pattern else None
+        self.discovery_interval = discovery_interval
+        self.max_age = max_age
+        self.detail_max_age = detail_max_age
+        self.queue_size = queue_size
+        self.log_dir = log_dir  # Container output is kept under log_dir/<container> when set
+        self.log_segment_size = log_segment_size
+        self.log_max_segments = log_max_segments
+        self.headlesses = {}
+        self.user_index = UserIndex()  # Users and bans across every container
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='docker-io')
+        self._discovery_task = None
+
+    @property
+    def is_dynamic(self):
+        return self.label is not None or self.pattern is not None
+
+    @property
+    def default_id(self):
+        """Container used when a message doesn't name one"""
+        for name in self.names:
+            if name in self.headlesses:
+                return name
+        return next(iter(self.headlesses), None)
+
+    def get(self, container_id=None):
+        """Look up a headless by container id, falling back to the default one"""
+        container_id = container_id or self.default_id
+        if container_id not in self.headlesses:
+            raise KeyError(f"Unknown container: {container_id}")
+        return self.headlesses[container_id]
+
+    def add(self, container_id, docker_manager=None):
+        """Start managing a container and return its Headless"""
+        if container_id in self.headlesses:
+            return self.headlesses[container_id]
+        if docker_manager is None:
+            docker_manager = DockerManager(
+                container_id,
+                backend=self.backend,
+                executor=self._executor
+            )
+        log_store = None
+        if self.log_dir:
+            log_store = LogStore(
+                os.path.join(self.log_dir, container_id),
+                segment_size=self.log_segment_size,
+                max_segments=self.log_max_segments
+            )
+        headless = Headless(
+            container_id,
+            docker_manager,
+            self.publish_worlds,
+            max_age=self.max_age,
+            detail_max_age=self.detail_max_age,
+            queue_size=self.queue_size,
+            log_store=log_store,
+            broadcast=partial(self.broadcast, container_id),
+            user_index=self.user_index
+        )
+        self.headlesses[container_id] = headless
+        if self.on_added is not None:
+            self.on_added(headless)
+        return headless
+
+    async def remove(self, container_id):
+        headless = self.headlesses.pop(container_id, None)
+        if headless is not None:
+            if self.on_removed is not None:
+                self.on_removed(container_id)
+            self.user_index.remove_container(container_id)
+            await headless.stop()
+
+    def discover(self):
+        """Return the names of the containers this fleet should manage"""
+        if not self.is_dynamic:
+            return list(self.names)
+
+        with docker_call('list'):
+            containers = self.backend.list(self.label)
+        found = [c.name for c in containers if self.pattern is None or self.pattern.search(c.name)]
+        # Explicitly named containers are always kept
+        return list(dict.fromkeys(self.names + sorted(found)))
+
+    async def refresh(self):
+        """Sync the registry with the containers currently on the host"""
+        loop = asyncio.get_running_loop()
+        try:
+            names = await loop.run_in_executor(self._executor, self.discover)
+        except Exception as e:
+            print(f"Error discovering containers: {e}")
+            return
+
+        for name in names:
+            if name not in self.headlesses:
+                self.add(name).start()
+        for name in list(self.headlesses):
+            if name not in names:
+                await self.remove(name)
+
+    async def _discover_loop(self):
+        while True:
+            await asyncio.sleep(self.discovery_interval)
+            await self.refresh()
+
+    async def start(self):
+        await self.refresh()
+        if self.is_dynamic and self._discovery_task is None:
+            self._discovery_task = asyncio.create_task(self._discover_loop())
+
+    async def stop(self):
+        if self._discovery_task is not None:
+            self._discovery_task.cancel()
+            self._discovery_task = None
+        for name in list(self.headlesses):
+            await self.remove(name)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def statuses(self):
+        """Container status for every headless, queried in parallel"""
+        ids = list(self.headlesses)
+        results = await asyncio.gather(
+            *(self.headlesses[i].docker_manager.get_container_status_async() for i in ids)
+        )
+        return dict(zip(ids, results))
+
+    def describe(self):
+        """Summary of the managed containers for the `containers_update` message"""
+        return [
+            {"id": container_id, "default": container_id == self.default_id}
+            for container_id in self.headlesses
+        ]
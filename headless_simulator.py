@@ -0,0 +1,400 @@
+import itertools
+import queue
+import random
+import socket
+import threading
+import time
+
+from collections import deque
+from datetime import datetime, timezone
+
+import docker
+
+# Lines the simulated headless prints between command responses
+LOG_LINES = [
+    "[INFO] Running garbage collection",
+    "[INFO] Asset transfer finished: resdb:///{hash}.webp",
+    "[INFO] World save completed for {world}",
+    "[DEBUG] Session updated: {world}",
+    "[INFO] Cloud sync complete, 0 records pending",
+    "[WARN] Slow update in {world}: {ms} ms"
+]
+
+
+class SimulatedWorld:
+    def __init__(self, index, name, users_per_world, rng):
+        self.name = name
+        self.session_id = f"S-sim-{index}-{rng.randrange(16 ** 8):08x}"
+        self.access_level = "Anyone"
+        self.max_users = 16
+        self.hidden = False
+        self.mobile_friendly = False
+        self.description = f"Simulated world {index}"
+        self.tags = "sim"
+        self.started = time.time()
+        self.users = []
+        for _ in range(users_per_world):
+            self.add_user(rng)
+
+    def add_user(self, rng):
+        n = rng.randrange(10 ** 6)
+        user = {"username": f"Sim{n}", "user_id": f"U-sim-{n}", "role": "Guest", "present": True,
+                "ping": rng.randrange(10, 120), "fps": 60.0, "silenced": False}
+        self.users.append(user)
+        return user
+
+    def find_user(self, username):
+        return next((user for user in self.users if user["username"] == username), None)
+
+
+def format_docker_timestamp(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f') + '000Z'
+
+
+class SimulatedLog:
+    """A container's stored output, like Docker's json-file log: it outlives restarts of the headless"""
+
+    def __init__(self, max_lines=10000):
+        self.lines = deque(maxlen=max_lines)  # (timestamp, line) for every complete line
+        self._partial = ''
+        self._followers = set()
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            self._partial += text
+            *complete, self._partial = self._partial.split('\n')
+            for line in complete:
+                item = (time.time(), line + '\n')
+                self.lines.append(item)
+                for follower in self._followers:
+                    follower.put(item)
+
+    def stream(self, since=None, follow=True):
+        """A LogStream of the lines at or after `since`, then new ones until closed or end_streams"""
+        with self._lock:
+            stream = LogStream(self)
+            for ts, line in self.lines:
+                if since is None or ts >= since:
+                    stream.queue.put((ts, line))
+            if follow:
+                self._followers.add(stream.queue)
+            else:
+                stream.queue.put(None)
+        return stream
+
+    def end_streams(self):
+        """End every following stream, as Docker does when the container stops"""
+        with self._lock:
+            followers, self._followers = self._followers, set()
+        for follower in followers:
+            follower.put(None)
+
+    def unfollow(self, follower):
+        with self._lock:
+            self._followers.discard(follower)
+
+
+class LogStream:
+    """The parts of docker-py's CancellableStream the manager uses; yields timestamped lines as bytes"""
+
+    def __init__(self, log):
+        self.log = log
+        self.queue = queue.Queue()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.queue.get()
+        if item is None:
+            raise StopIteration
+        ts, line = item
+        return f"{format_docker_timestamp(ts)} {line}".encode('utf-8')
+
+    def close(self):
+        self.log.unfollow(self.queue)
+        self.queue.put(None)
+
+
+class SimulatedHeadless:
+    """A stand-in for one headless process, speaking its console protocol.
+
+    Every attached socket sees all output, like `docker attach`. Commands
+    written to a socket attached with stdin are echoed after the prompt,
+    answered after `latency` seconds and followed by a fresh `World>`
+    prompt. `focus`, `worlds`, `status`, `users`, `listbans`,
+    `friendRequests`, `sessionUrl` and the user and world property commands
+    are understood; anything else gets an empty response. With a
+    `log_rate`, that many log lines per second are printed between
+    responses, including the occasional user joining or leaving a world.
+    Everything printed also goes to `log`, which `SimulatedContainer.logs`
+    reads like Docker's log stream.
+    """
+
+    def __init__(self, name, worlds=3, users_per_world=4, latency=0.01, log_rate=0.0, seed=None, log=None):
+        self.name = name
+        self.log = log if log is not None else SimulatedLog()  # Everything printed, for `docker logs`
+        self.latency = latency
+        self.log_rate = log_rate
+        self.rng = random.Random(seed)
+        self.worlds = [SimulatedWorld(i, f"World {i}", users_per_world, self.rng) for i in range(worlds)]
+        self.bans = [{"username": "Griefer", "user_id": "U-griefer", "machine_ids": ["m-1", "m-2"]}]
+        self.friend_requests = ["SimFriend"]
+        self.focused = 0
+        self.commands = 0  # Commands answered so far
+        self.log_lines = 0  # Log lines printed so far
+        self._sockets = set()
+        self._lock = threading.Lock()  # One response or log line written at a time
+        self._running = True
+        self._prompted = False  # Whether a prompt is showing for the echo to follow
+        if log_rate > 0:
+            threading.Thread(target=self._spew, name=f'sim-{name}-log', daemon=True).start()
+
+    @property
+    def prompt(self):
+        world = self.focused_world
+        return f"{world.name}>" if world is not None else ">"
+
+    @property
+    def focused_world(self):
+        return self.worlds[self.focused] if 0 <= self.focused < len(self.worlds) else None
+
+    def attach(self, stdin=True):
+        """Return the client end of a new attach connection"""
+        server, client = socket.socketpair()
+        with self._lock:
+            self._sockets.add(server)
+        if stdin:
+            threading.Thread(target=self._serve, args=(server,), name=f'sim-{self.name}-console', daemon=True).start()
+        return client
+
+    def stop(self):
+        self._running = False
+        with self._lock:
+            sockets, self._sockets = self._sockets, set()
+        for sock in sockets:
+            sock.close()
+
+    def respond(self, command):
+        """Apply a command and return its response lines"""
+        name, _, arg = command.partition(' ')
+        name = name.lower()
+        world = self.focused_world
+        if name == 'worlds':
+            return [f"[{i}] {w.name}\tUsers: {len(w.users)}\tPresent: {sum(u['present'] for u in w.users)}"
+                    f"\tAccessLevel: {w.access_level}\tMaxUsers: {w.max_users}" for i, w in enumerate(self.worlds)]
+        if name == 'focus':
+            if arg.strip().isdigit() and int(arg) < len(self.worlds):
+                self.focused = int(arg)
+                return []
+            return ["World with this index doesn't exist"]
+        if name == 'listbans':
+            return [f"[{i}]\tUsername: {b['username']}\tUserID: {b['user_id']}\tMachineIds: {', '.join(b['machine_ids'])}"
+                    for i, b in enumerate(self.bans)]
+        if name == 'friendrequests':
+            return list(self.friend_requests)
+        if world is None:
+            return ["No world is focused"]
+        if name == 'status':
+            uptime = int(time.time() - world.started)
+            return [
+                f"Name: {world.name}",
+                f"SessionID: {world.session_id}",
+                f"Current Users: {len(world.users)}",
+                f"Present Users: {sum(u['present'] for u in world.users)}",
+                f"Max Users: {world.max_users}",
+                f"Uptime: {uptime // 3600:02}:{uptime // 60 % 60:02}:{uptime % 60:02}.0000000",
+                f"Access Level: {world.access_level}",
+                f"Hidden from listing: {world.hidden}",
+                f"Mobile Friendly: {world.mobile_friendly}",
+                f"Description: {world.description}",
+                f"Tags: {world.tags}",
+                f"Users: {', '.join(u['username'] for u in world.users)}"
+            ]
+        if name == 'users':
+            return [f"{u['username']}\tID: {u['user_id']}\tRole: {u['role']}\tPresent: {u['present']}"
+                    f"\tPing: {u['ping']} ms\tFPS: {u['fps']}\tSilenced: {u['silenced']}" for u in world.users]
+        if name == 'sessionurl':
+            return [f"http://sim.invalid/session/{world.session_id}"]
+        if name == 'name':
+            world.name = arg
+        elif name == 'description':
+            world.description = arg
+        elif name == 'accesslevel':
+            world.access_level = arg
+        elif name == 'maxusers' and arg.isdigit():
+            world.max_users = int(arg)
+        elif name == 'hidefromlisting':
+            world.hidden = arg.strip().lower() == 'true'
+        elif name in ('kick', 'ban'):
+            user = world.find_user(arg)
+            if user is None:
+                return ["User not found"]
+            world.users.remove(user)
+            if name == 'ban':
+                self.bans.append({"username": user["username"], "user_id": user["user_id"], "machine_ids": []})
+        elif name in ('silence', 'unsilence'):
+            user = world.find_user(arg)
+            if user is None:
+                return ["User not found"]
+            user["silenced"] = name == 'silence'
+        elif name == 'role':
+            username, _, role = arg.rpartition(' ')
+            user = world.find_user(username)
+            if user is None:
+                return ["User not found"]
+            user["role"] = role
+        return []
+
+    def _write(self, text):
+        self._prompted = True  # Everything written ends with a prompt
+        self.log.write(text)
+        data = text.encode('utf-8')
+        for sock in list(self._sockets):
+            try:
+                sock.sendall(data)
+            except OSError:
+                self._sockets.discard(sock)
+
+    def _serve(self, sock):
+        buffer = b''
+        while self._running:
+            try:
+                data = sock.recv(4096)
+            except OSError:
+                break
+            if not data:
+                break
+            buffer += data
+            while b'\r' in buffer:
+                raw, buffer = buffer.split(b'\r', 1)
+                command = raw.decode('utf-8', errors='replace').strip()
+                time.sleep(self.latency)
+                with self._lock:
+                    # Like a terminal, the typed command is echoed after the prompt already on screen
+                    echo = command if self._prompted else f"{self.prompt}{command}"
+                    lines = self.respond(command) if command else []
+                    self.commands += 1
+                    self._write('\r\n'.join([echo, *lines]) + f"\r\n{self.prompt}")
+        with self._lock:
+            self._sockets.discard(sock)
+        sock.close()
+
+    def _spew(self):
+        for n in itertools.count():
+            if not self._running:
+                return
+            time.sleep(self.rng.expovariate(self.log_rate))
+            with self._lock:
+                line = self._log_line(n)
+                # Reprint the prompt after the line, like the headless console does
+                self._write(f"\r{line}\r\n{self.prompt}")
+                self.log_lines += 1
+
+    def _log_line(self, n):
+        world = self.rng.choice(self.worlds) if self.worlds else None
+        if world is not None and n % 50 == 49:
+            # Now and then somebody joins or leaves
+            if world.users and self.rng.random() < 0.5:
+                user = world.users.pop(self.rng.randrange(len(world.users)))
+                return f"[INFO] User Left: {world.name}. Username: {user['username']}, UserID: {user['user_id']}"
+            user = world.add_user(self.rng)
+            return f"[INFO] User Joined {world.name}. Username: {user['username']}, UserID: {user['user_id']}"
+        template = self.rng.choice(LOG_LINES)
+        return template.format(hash=f"{self.rng.randrange(16 ** 12):012x}", ms=self.rng.randrange(20, 200),
+                               world=world.name if world else "Userspace")
+
+
+class AttachedSocket:
+    """The parts of docker-py's attach socket the manager uses"""
+
+    def __init__(self, sock):
+        self._sock = sock
+
+    def close(self):
+        self._sock.close()
+
+
+class SimulatedContainer:
+    """The parts of docker-py's Container the manager uses, backed by a SimulatedHeadless"""
+
+    def __init__(self, name, headless_factory):
+        self.name = name
+        self.id = f"sim-{name}"
+        self.labels = {}
+        self.status = 'running'
+        self._headless_factory = headless_factory  # Callable taking (name, log)
+        self.log = SimulatedLog()
+        self.headless = headless_factory(name, self.log)
+
+    def attach_socket(self, params=None):
+        if self.status != 'running':
+            raise docker.errors.APIError(f"Container {self.name} is not running")
+        return AttachedSocket(self.headless.attach(stdin=bool((params or {}).get('stdin'))))
+
+    def logs(self, stdout=True, stderr=True, stream=False, follow=False, timestamps=False, since=None):
+        """Docker's log stream; only the streaming, timestamped form the manager uses is supported"""
+        if not (stream and timestamps):
+            raise NotImplementedError("Simulated logs are only available as a timestamped stream")
+        return self.log.stream(since, follow=follow and self.status == 'running')
+
+    def stats(self, stream=True, decode=True):
+        """Docker-style stats samples, one a second"""
+        cpu = system = 0
+        rx = tx = 0
+        while self.status == 'running':
+            cpu += random.randrange(10 ** 7, 5 * 10 ** 7)
+            system += 10 ** 9
+            rx += random.randrange(10 ** 4, 10 ** 5)
+            tx += random.randrange(10 ** 4, 10 ** 5)
+            yield {
+                "cpu_stats": {"cpu_usage": {"total_usage": cpu}, "system_cpu_usage": system, "online_cpus": 4},
+                "precpu_stats": {"cpu_usage": {"total_usage": cpu - 2 * 10 ** 7}, "system_cpu_usage": system - 10 ** 9},
+                "memory_stats": {"usage": 900 * 2 ** 20, "limit": 8 * 2 ** 30, "stats": {"inactive_file": 0}},
+                "networks": {"eth0": {"rx_bytes": rx, "tx_bytes": tx}}
+            }
+            time.sleep(1)
+
+    def stop(self, timeout=10):
+        self.status = 'exited'
+        self.headless.stop()
+        self.log.end_streams()
+
+    def kill(self):
+        self.stop()
+
+    def wait(self, timeout=None):
+        return {"StatusCode": 0}
+
+    def restart(self, timeout=10):
+        self.stop()
+        self.headless = self._headless_factory(self.name, self.log)
+        self.status = 'running'
+
+    def reload(self):
+        pass
+
+
+class SimulatedBackend:
+    """Backend of simulated headless containers, for load tests and development without Docker.
+
+    Containers are created on first use, so any CONTAINER_NAME works; the
+    keyword arguments are passed to each SimulatedHeadless.
+    """
+
+    def __init__(self, **headless_options):
+        self.headless_options = headless_options
+        self.containers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            if name not in self.containers:
+                self.containers[name] = SimulatedContainer(
+                    name, lambda n, log: SimulatedHeadless(n, log=log, **self.headless_options))
+            return self.containers[name]
+
+    def list(self, label=None):
+        with self._lock:
+            return list(self.containers.values())
@@ -0,0 +1,269 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; console commands answer in milliseconds, worlds crawls can take several seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric family with one child per label combination.
+
+    `labels(**values)` returns the child to update; callers on a hot path can
+    keep the child instead of looking it up each time. Once `max_children`
+    combinations exist, new ones are folded into a single child with every
+    label set to "other", so commands typed into the console can't grow the
+    registry without bound.
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), max_children=500):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.max_children = max_children
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **values):
+        key = tuple(str(values[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                if key not in self._children and len(self._children) >= self.max_children:
+                    key = ('other',) * len(self.labelnames)
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, **values):
+        """Forget the child for these labels, e.g. when a container goes away"""
+        with self._lock:
+            self._children = {key: child for key, child in self._children.items()
+                              if any(key[self.labelnames.index(name)] != str(value) for name, value in values.items())}
+
+    def samples(self):
+        """Yield (suffix, label values, extra label, value) for the exposition"""
+        for key, child in list(self._children.items()):
+            yield from child.samples(key)
+
+
+class CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, key):
+        yield '_total', key, None, self.value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, key):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), counts):
+            cumulative += count
+            yield '_bucket', key, ('le', format_value(float(bound))), cumulative
+        yield '_count', key, None, cumulative
+        yield '_sum', key, None, total
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, max_children=500):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, max_children)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+
+class GaugeFunction:
+    """A gauge or counter whose values are read from the application when scraped.
+
+    `func` returns a number, or a list of `(label values, number)` pairs
+    when the metric has labels. Nothing is updated between scrapes, so
+    figures the manager already keeps (queue sizes, dropped lines, open
+    websockets) cost nothing extra on the paths that change them.
+    """
+
+    def __init__(self, name, help, func, labelnames=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def samples(self):
+        suffix = '_total' if self.kind == 'counter' else ''
+        values = self.func()
+        if not self.labelnames:
+            yield suffix, (), None, values
+            return
+        for key, value in values:
+            yield suffix, tuple(str(v) for v in key), None, value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def remove(self, **values):
+        """Forget these label values in every metric labelled by them, e.g. a container that went away"""
+        for metric in list(self.metrics.values()):
+            if isinstance(metric, Metric) and set(values) <= set(metric.labelnames):
+                metric.remove(**values)
+
+    def counter(self, name, help, labelnames=(), **kwargs):
+        return self.register(Counter(name, help, labelnames, **kwargs))
+
+    def histogram(self, name, help, labelnames=(), **kwargs):
+        return self.register(Histogram(name, help, labelnames, **kwargs))
+
+    def gauge_function(self, name, help, func, labelnames=(), kind='gauge'):
+        return self.register(GaugeFunction(name, help, func, labelnames, kind))
+
+    def render(self, openmetrics=False):
+        """The text exposition of every metric, in Prometheus or OpenMetrics format"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+                continue
+            # OpenMetrics names a counter family without its _total suffix
+            family = metric.name if openmetrics or metric.kind != 'counter' else metric.name + '_total'
+            lines.append(f'# HELP {family} {metric.help}')
+            lines.append(f'# TYPE {family} {metric.kind}')
+            for suffix, key, extra, value in samples:
+                if value is None:
+                    continue
+                lines.append(f'{metric.name}{suffix}{format_labels(metric.labelnames, key, extra)} {format_value(value)}')
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry served at /metrics
+REGISTRY = Registry()
+
+COMMAND_SECONDS = REGISTRY.histogram(
+    'headless_command_duration_seconds',
+    'Time from writing a console command to the end of its response',
+    ('container', 'command'))
+COMMAND_TIMEOUTS = REGISTRY.counter(
+    'headless_command_timeouts',
+    'Console commands whose response did not finish before the timeout',
+    ('container',))
+COMMAND_ERRORS = REGISTRY.counter(
+    'headless_command_errors',
+    'Console commands that failed with an exception',
+    ('container',))
+WORLD_CRAWL_SECONDS = REGISTRY.histogram(
+    'headless_world_crawl_duration_seconds',
+    'Time taken by each worlds crawl',
+    ('container',))
+DOCKER_CALLS = REGISTRY.counter(
+    'docker_api_calls',
+    'Calls made to the Docker API',
+    ('call',))
+DOCKER_ERRORS = REGISTRY.counter(
+    'docker_api_errors',
+    'Docker API calls that raised an error',
+    ('call',))
+WEBSOCKET_SEND_ERRORS = REGISTRY.counter(
+    'websocket_send_errors',
+    'Messages that could not be sent to a websocket client',
+    ('message',))
+
+
+@contextmanager
+def docker_call(call):
+    """Count a Docker API call, and count it as an error if the block raises"""
+    DOCKER_CALLS.labels(call=call).inc()
+    try:
+        yield
+    except Exception:
+        DOCKER_ERRORS.labels(call=call).inc()
+        raise
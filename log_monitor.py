@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+
+class OutputQueue(asyncio.Queue):
+    """A subscriber's queue of output lines, counting the lines dropped because it was full"""
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.dropped = 0  # Reset by the consumer once it has reported them
+
+
+class LogMonitor:
+    """Reads a container's output once and fans the lines out to subscribers.
+
+    A single thread runs `DockerManager.monitor_output` no matter how many
+    clients are watching. Lines come in batches, one per chunk read, and cost
+    one hop onto the event loop per batch. Each subscriber gets a bounded
+    asyncio queue; when a client falls behind, the oldest lines in its queue
+    are dropped so memory stays flat. Queue items are `(timestamp, line)` tuples, and every line is
+    also appended to `log_store` when one is given and passed to each of
+    `listeners` on the event loop. The reader reconnects by itself when the
+    stream drops or the container restarts; `status_listeners` are called
+    with `(state, details)` on the event loop when that happens.
+    """
+
+    def __init__(self, docker_manager, queue_size=500, log_store=None):
+        self.docker_manager = docker_manager
+        self.queue_size = queue_size
+        self.log_store = log_store
+        self.subscribers = set()
+        self.listeners = []  # Callables taking (timestamp, line)
+        self.status_listeners = []  # Callables taking (state, details) when the stream drops or reconnects
+        self.lines = 0  # Lines published so far
+        self.dropped_lines = 0
+        self._loop = None
+        self._thread = None
+
+    def start(self, loop=None):
+        """Start the monitor thread if it isn't already running"""
+        self._loop = loop or asyncio.get_running_loop()
+        if self.is_running:
+            return
+        self._thread = threading.Thread(
+            target=self.docker_manager.monitor_output,
+            args=(self._on_lines, self._on_status),
+            name=f"monitor-{self.docker_manager.container_name}",
+            daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def queued_lines(self):
+        """Lines waiting in subscriber queues, summed over every subscriber"""
+        return sum(queue.qsize() for queue in list(self.subscribers))
+
+    def stop(self):
+        self.docker_manager.stop_monitor()
+        if self.log_store is not None:
+            self.log_store.close()
+
+    def subscribe(self):
+        """Register a new subscriber and return its queue of output lines"""
+        queue = OutputQueue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        # Restart the reader if it exited since the last subscriber joined
+        self.start()
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def _on_lines(self, batch):
+        """Called from the monitor thread with a list of (timestamp, line) for each chunk of output"""
+        if self.log_store is not None:
+            try:
+                self.log_store.append_batch(batch)
+            except Exception as e:
+                print(f"Error writing log store: {e}")
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._publish, batch)
+
+    def _on_status(self, state, details):
+        """Called from the monitor thread when the stream drops or reconnects"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._publish_status, state, details)
+
+    def _publish_status(self, state, details):
+        for listener in self.status_listeners:
+            try:
+                listener(state, details)
+            except Exception as e:
+                print(f"Error in stream status listener: {e}")
+
+    def _publish(self, batch):
+        self.lines += len(batch)
+        for listener in self.listeners:
+            for item in batch:
+                try:
+                    listener(*item)
+                except Exception as e:
+                    print(f"Error in output listener: {e}")
+        for queue in self.subscribers:
+            for item in batch:
+                if queue.full():
+                    # Drop the oldest line rather than letting a slow client grow the queue
+                    queue.get_nowait()
+                    queue.dropped += 1
+                    self.dropped_lines += 1
+                queue.put_nowait(item)
@@ -0,0 +1,256 @@
+import os
+import re
+import threading
+from bisect import bisect_right
+
+
+class Segment:
+    """One append-only log file and its sparse timestamp index"""
+
+    __slots__ = ('seq', 'path', 'index_path', 'index_ts', 'index_offsets', 'size')
+
+    def __init__(self, directory, seq):
+        self.seq = seq
+        self.path = os.path.join(directory, f"{seq:08d}.log")
+        self.index_path = os.path.join(directory, f"{seq:08d}.idx")
+        self.index_ts = []  # Timestamps of the indexed lines
+        self.index_offsets = []  # Byte offsets of the indexed lines
+        self.size = 0
+
+    @property
+    def first_ts(self):
+        return self.index_ts[0] if self.index_ts else None
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                for entry in f:
+                    ts, offset = entry.split()
+                    self.index_ts.append(float(ts))
+                    self.index_offsets.append(int(offset))
+        except FileNotFoundError:
+            pass
+        try:
+            self.size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            self.size = 0
+
+    def start_offset(self, start):
+        """Offset of the last indexed line at or before `start`"""
+        if start is None:
+            return 0
+        i = bisect_right(self.index_ts, start) - 1
+        return self.index_offsets[i] if i >= 0 else 0
+
+
+class LogStore:
+    """On-disk ring of size-capped log segments for one container.
+
+    Each line is stored as `<unix timestamp>\\t<text>`. Every segment keeps a
+    sparse `(timestamp, offset)` index in a sidecar file so time range reads
+    can seek straight to the right place. When the ring is full the oldest
+    segment is deleted. Reads are generators that stream from disk, so
+    callers never hold a whole segment in memory.
+    """
+
+    def __init__(self, directory, segment_size=4 * 1024 * 1024, max_segments=32, index_every=64 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.index_every = index_every  # Bytes between index entries
+        self.lock = threading.Lock()
+        self.segments = []
+        self._file = None
+        self._index_file = None
+        self._last_indexed = None  # Offset of the last index entry in the active segment
+        self._closed = False  # Set by close; appends from a monitor thread still finishing are dropped
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.log'):
+                segment = Segment(self.directory, int(name[:-4]))
+                segment.load_index()
+                self.segments.append(segment)
+        if self.segments:
+            self._drop_partial_line(self.segments[-1])
+
+    def _drop_partial_line(self, segment):
+        """Cut a line left half-written by a crash off the end of the active segment"""
+        if not segment.size:
+            return
+        end = segment.size
+        with open(segment.path, 'r+b') as f:
+            while end > 0:
+                start = max(0, end - 64 * 1024)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b'\n')
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end == segment.size:
+                return
+            f.truncate(end)
+        segment.size = end
+
+        # Index entries past the cut point at lines that no longer exist
+        kept = bisect_right(segment.index_offsets, end)
+        if kept < len(segment.index_offsets):
+            del segment.index_ts[kept:]
+            del segment.index_offsets[kept:]
+            with open(segment.index_path, 'w') as f:
+                f.writelines(f"{ts:.6f} {offset}\n" for ts, offset in zip(segment.index_ts, segment.index_offsets))
+
+    def _open_segment(self):
+        seq = self.segments[-1].seq + 1 if self.segments else 0
+        segment = Segment(self.directory, seq)
+        self.segments.append(segment)
+        self._open_files(segment)
+
+        # Drop the oldest segments once the ring is full
+        while len(self.segments) > self.max_segments:
+            oldest = self.segments.pop(0)
+            for path in (oldest.path, oldest.index_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return segment
+
+    def _open_files(self, segment):
+        self._file = open(segment.path, 'ab')
+        self._index_file = open(segment.index_path, 'a')
+        self._last_indexed = segment.index_offsets[-1] if segment.index_offsets else None
+
+    def _close_files(self):
+        for f in (self._file, self._index_file):
+            if f is not None:
+                f.close()
+        self._file = None
+        self._index_file = None
+
+    def append(self, lines, ts):
+        """Append lines received at unix time `ts`"""
+        if isinstance(lines, str):
+            lines = [lines]
+        self.append_batch([(ts, line) for line in lines])
+
+    def append_batch(self, items):
+        """Append `(timestamp, line)` pairs in one write"""
+        if not items:
+            return
+        ts = items[0][0]
+        with self.lock:
+            if self._closed:
+                return
+            if not self.segments or self.segments[-1].size >= self.segment_size:
+                self._close_files()
+                self._open_segment()
+            elif self._file is None:
+                self._open_files(self.segments[-1])
+
+            segment = self.segments[-1]
+            data = ''.join(f"{line_ts:.6f}\t{line}\n" for line_ts, line in items).encode('utf-8')
+
+            if self._last_indexed is None or segment.size - self._last_indexed >= self.index_every:
+                segment.index_ts.append(ts)
+                segment.index_offsets.append(segment.size)
+                self._last_indexed = segment.size
+                self._index_file.write(f"{ts:.6f} {segment.size}\n")
+                self._index_file.flush()
+
+            self._file.write(data)
+            self._file.flush()
+            segment.size += len(data)
+
+    def close(self):
+        """Close the active segment for good; reads still work, later appends are ignored"""
+        with self.lock:
+            self._closed = True
+            self._close_files()
+
+    def _segments_for(self, start, end):
+        """Segments that may hold lines in [start, end], oldest first"""
+        with self.lock:
+            segments = list(self.segments)
+        selected = []
+        for i, segment in enumerate(segments):
+            if segment.first_ts is None:
+                continue
+            next_first = segments[i + 1].first_ts if i + 1 < len(segments) else None
+            if start is not None and next_first is not None and next_first < start:
+                continue
+            if end is not None and segment.first_ts > end:
+                break
+            selected.append((segment, segment.start_offset(start), segment.size))
+        return selected
+
+    def read_range(self, start=None, end=None, limit=None):
+        """Yield `(timestamp, line)` for lines between two unix times, oldest first"""
+        count = 0
+        for segment, offset, size in self._segments_for(start, end):
+            for ts, line in self._read_segment(segment, offset, size):
+                if start is not None and ts < start:
+                    continue
+                if end is not None and ts > end:
+                    return
+                yield ts, line
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    def search(self, query, regex=False, start=None, end=None, limit=None):
+        """Yield `(timestamp, line)` for lines matching a substring or regex"""
+        if regex:
+            matches = re.compile(query).search
+        else:
+            needle = query.lower()
+            matches = lambda line: needle in line.lower()
+
+        count = 0
+        for ts, line in self.read_range(start, end):
+            if matches(line):
+                yield ts, line
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    def tail(self, count):
+        """The last `count` lines as `(timestamp, line)`, oldest first"""
+        with self.lock:
+            segments = list(self.segments)
+
+        lines = []
+        for segment in reversed(segments):
+            # Walk back through the index until this segment's slice has enough lines
+            for i in range(len(segment.index_offsets) - 1, -1, -1):
+                chunk = list(self._read_segment(segment, segment.index_offsets[i], segment.size))
+                if len(chunk) + len(lines) >= count or i == 0:
+                    lines = chunk + lines
+                    break
+            if len(lines) >= count:
+                break
+        return lines[-count:] if count else []
+
+    def _read_segment(self, segment, offset, size):
+        """Yield `(timestamp, line)` from one segment between two byte offsets"""
+        try:
+            f = open(segment.path, 'rb')
+        except FileNotFoundError:
+            return  # Rotated out while we were reading
+        with f:
+            f.seek(offset)
+            position = offset
+            for raw in f:
+                position += len(raw)
+                # Stop at what was written when the read started, and skip partial lines
+                if position > size or not raw.endswith(b'\n'):
+                    break
+                ts_text, _, text = raw.partition(b'\t')
+                try:
+                    ts = float(ts_text)
+                except ValueError:
+                    continue  # Damaged by a crash mid-write
+                yield ts, text[:-1].decode('utf-8', errors='replace')
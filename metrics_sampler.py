@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from metrics_store import CRAWL_TIERS
+
+
+class MetricsSampler:
+    """Background task that records host, container and world metrics.
+
+    Host CPU and memory are recorded every `interval` seconds and container
+    stats every `container_interval` seconds, both read from the
+    `StatusSampler` cache so nothing here waits on psutil or Docker. World
+    user counts plus per-user ping/FPS are recorded whenever a worlds crawl
+    finishes, along with how long the crawl took. The console command queue
+    depth and the average wait for the focus lock are recorded every
+    `interval` seconds.
+    """
+
+    def __init__(self, fleet, status_sampler, store, interval=1, container_interval=10, prune_after=24 * 3600):
+        self.fleet = fleet
+        self.status_sampler = status_sampler
+        self.store = store
+        self.interval = interval
+        self.container_interval = container_interval
+        self.prune_after = prune_after  # Series idle this long are dropped
+        self._task = None
+        self._worlds_seen = {}  # container id -> updated_at of the last recorded crawl
+        self._stats_seen = {}  # container id -> stats_at of the last recorded sample
+        self._waits_seen = {}  # container id -> (locked runs, wait seconds) at the last sample
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        last_containers = 0
+        last_prune = time.time()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.time()
+            try:
+                self.sample_host()
+                if now - last_containers >= self.container_interval:
+                    last_containers = now
+                    self.sample_containers()
+                self.sample_worlds()
+                self.sample_commands()
+            except Exception as e:
+                print(f"Error sampling metrics: {e}")
+
+            if now - last_prune >= 3600:
+                last_prune = now
+                self.store.prune(self.prune_after)
+
+    def sample_host(self):
+        host = self.status_sampler.host
+        ts = self.status_sampler.host_sampled_at
+        if ts is None:
+            return
+        self.store.record('host_cpu_percent', host.get("cpu_usage"), ts)
+        self.store.record('host_memory_percent', host.get("memory_percent"), ts)
+        self.store.record('host_memory_used_bytes', host.get("memory_used_bytes"), ts)
+
+    def sample_containers(self):
+        """Record the latest streamed stats sample of every container, once each"""
+        for container_id, cached in list(self.status_sampler.containers.items()):
+            stats = cached.get("stats")
+            ts = cached.get("stats_at")
+            if stats is None or self._stats_seen.get(container_id) == ts:
+                continue
+            self._stats_seen[container_id] = ts
+            for field in ('cpu_percent', 'memory_bytes', 'memory_percent', 'network_rx_bytes', 'network_tx_bytes'):
+                self.store.record(f'container_{field}', stats.get(field), ts, container=container_id)
+
+    def sample_commands(self):
+        """Record each container's command queue depth and the average focus lock wait since the last sample"""
+        ts = time.time()
+        for container_id, headless in list(self.fleet.headlesses.items()):
+            executor = headless.executor
+            self.store.record('command_queue_depth', executor.queue_depth, ts, container=container_id)
+            runs, waited = self._waits_seen.get(container_id, (0, 0.0))
+            self._waits_seen[container_id] = (executor.runs, executor.wait_seconds)
+            if executor.runs > runs:
+                self.store.record('command_wait_seconds', (executor.wait_seconds - waited) / (executor.runs - runs),
+                                  ts, container=container_id)
+
+    def sample_worlds(self):
+        """Record crawl time, user counts and per-user ping/FPS from any crawl we haven't seen yet"""
+        for container_id, headless in list(self.fleet.headlesses.items()):
+            poller = headless.world_poller
+            if poller.updated_at is None or self._worlds_seen.get(container_id) == poller.updated_at:
+                continue
+            self._worlds_seen[container_id] = ts = poller.updated_at
+            self.store.record('world_crawl_seconds', poller.crawl_duration, ts, container=container_id)
+
+            for world in poller.worlds:
+                world_id = world.get("sessionId") or world.get("name")
+                labels = {"container": container_id, "world": world_id}
+                self.store.record('world_users', world.get("users"), ts, CRAWL_TIERS, **labels)
+                self.store.record('world_present_users', world.get("present"), ts, CRAWL_TIERS, **labels)
+                for user in world.get("users_list", []):
+                    user_id = user.get("userId") or user.get("username")
+                    labels = {"container": container_id, "world": world_id, "user": user_id}
+                    self.store.record('user_ping_ms', user.get("ping"), ts, CRAWL_TIERS, **labels)
+                    self.store.record('user_fps', user.get("fps"), ts, CRAWL_TIERS, **labels)
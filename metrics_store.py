@@ -0,0 +1,171 @@
+import time
+from array import array
+
+
+# (name, bucket width in seconds, points kept)
+DEFAULT_TIERS = (
+    ('1s', 1, 3600),      # One hour at full resolution
+    ('1m', 60, 1440),     # One day of one-minute averages
+    ('1h', 3600, 720),    # Thirty days of hourly averages
+)
+# For series sampled once per worlds crawl, like per-world user counts and per-user ping/FPS:
+# a 1s tier would hold no more than the 1m one, at 16 bytes for each of its 3600 slots
+CRAWL_TIERS = DEFAULT_TIERS[1:]
+
+
+class Ring:
+    """Fixed-capacity circular buffer of (timestamp, value) pairs.
+
+    Backed by two `array('d')`s that grow on demand up to `capacity`, so a
+    series that is only sampled now and then costs only the points it holds.
+    """
+
+    __slots__ = ('capacity', 'times', 'values', 'head')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d')
+        self.values = array('d')
+        self.head = 0  # Index of the oldest point once the ring is full
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, ts, value):
+        if len(self.times) < self.capacity:
+            self.times.append(ts)
+            self.values.append(value)
+            return
+        self.times[self.head] = ts
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+
+    def oldest(self):
+        return self.times[self.head] if self.times else None
+
+    def points(self, start=None, end=None):
+        """Yield (timestamp, value) oldest first, limited to [start, end]"""
+        size = len(self.times)
+        for i in range(size):
+            j = (self.head + i) % size
+            ts = self.times[j]
+            if start is not None and ts < start:
+                continue
+            if end is not None and ts > end:
+                break
+            yield ts, self.values[j]
+
+
+class Tier:
+    """One resolution of a series: averages samples into fixed-width buckets"""
+
+    __slots__ = ('name', 'width', 'ring', 'bucket', 'total', 'count')
+
+    def __init__(self, name, width, capacity):
+        self.name = name
+        self.width = width
+        self.ring = Ring(capacity)
+        self.bucket = None  # Start time of the bucket being filled
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, ts, value):
+        bucket = ts - ts % self.width
+        if bucket != self.bucket:
+            self.flush()
+            self.bucket = bucket
+        self.total += value
+        self.count += 1
+
+    def flush(self):
+        if self.count:
+            self.ring.append(self.bucket, self.total / self.count)
+        self.total = 0.0
+        self.count = 0
+
+    def points(self, start=None, end=None):
+        yield from self.ring.points(start, end)
+        # Include the partially filled bucket so charts reach the present
+        if self.count and (start is None or self.bucket >= start) and (end is None or self.bucket <= end):
+            yield self.bucket, self.total / self.count
+
+
+class Series:
+    """A named metric kept at several resolutions"""
+
+    __slots__ = ('name', 'tiers', 'updated_at')
+
+    def __init__(self, name, tiers=DEFAULT_TIERS):
+        self.name = name
+        self.tiers = [Tier(*tier) for tier in tiers]
+        self.updated_at = None
+
+    def add(self, ts, value):
+        for tier in self.tiers:
+            tier.add(ts, value)
+        self.updated_at = ts
+
+    def tier_for(self, start, resolution=None):
+        """The named tier, or the finest one that still reaches back to `start`"""
+        if resolution is not None:
+            for tier in self.tiers:
+                if tier.name == resolution:
+                    return tier
+            raise KeyError(f"Unknown resolution: {resolution}")
+        for tier in self.tiers:
+            oldest = tier.ring.oldest()
+            if start is None or len(tier.ring) < tier.ring.capacity or (oldest is not None and oldest <= start):
+                return tier
+        return self.tiers[-1]
+
+
+class TimeSeriesStore:
+    """In-process store of metric series, keyed by name.
+
+    Names follow the Prometheus style of `metric{label="value"}` so one
+    metric can be split by container, world or user.
+    """
+
+    def __init__(self, tiers=DEFAULT_TIERS, max_series=2000):
+        self.tiers = tiers
+        self.max_series = max_series
+        self.series = {}
+
+    @staticmethod
+    def key(metric, **labels):
+        if not labels:
+            return metric
+        label_text = ','.join(f'{name}="{value}"' for name, value in sorted(labels.items()))
+        return f"{metric}{{{label_text}}}"
+
+    def record(self, metric, value, ts=None, tiers=None, **labels):
+        """Add a sample to a series, creating the series on first use with `tiers` or the store's"""
+        if value is None:
+            return
+        name = self.key(metric, **labels)
+        series = self.series.get(name)
+        if series is None:
+            if len(self.series) >= self.max_series:
+                return
+            series = self.series[name] = Series(name, tiers or self.tiers)
+        series.add(ts if ts is not None else time.time(), float(value))
+
+    def names(self, prefix=None):
+        return sorted(name for name in self.series if prefix is None or name.startswith(prefix))
+
+    def query(self, name, start=None, end=None, resolution=None):
+        """Points for one series as `{"resolution": ..., "points": [[ts, value], ...]}`"""
+        series = self.series.get(name)
+        if series is None:
+            raise KeyError(f"Unknown series: {name}")
+        tier = series.tier_for(start, resolution)
+        return {
+            "resolution": tier.name,
+            "points": [[ts, value] for ts, value in tier.points(start, end)]
+        }
+
+    def prune(self, idle_seconds):
+        """Forget series that haven't had a sample in `idle_seconds`, like users who left"""
+        cutoff = time.time() - idle_seconds
+        for name in [name for name, series in self.series.items() if series.updated_at < cutoff]:
+            del self.series[name]
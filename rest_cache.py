@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import json
+import time
+
+from instrumentation import REGISTRY
+
+REST_REQUESTS = REGISTRY.counter(
+    'rest_requests',
+    'Read-only REST requests, by how the cached state answered them',
+    ('resource', 'cache'))
+REST_REFRESHES = REGISTRY.counter(
+    'rest_refreshes',
+    'Refreshes of cached state started because a REST request found it stale',
+    ('resource',))
+
+
+class CachedResource:
+    """One read-only resource served from the manager's cached state.
+
+    `read(headless)` returns the data from what the manager already keeps,
+    without touching the console, and `updated_at(headless)` says when that
+    was last brought up to date. When it is older than `max_age` seconds and
+    there is a `refresh(headless)`, the request waits for a refresh first;
+    every request arriving meanwhile waits for the same one, so N concurrent
+    requests for stale data cost one refresh. The JSON
+    body and its ETag are built once per update and shared by every request
+    until the data changes again.
+    """
+
+    def __init__(self, name, read, updated_at, refresh=None, max_age=5):
+        self.name = name
+        self.read = read  # async callable taking a Headless, returning the data to serve
+        self.updated_at = updated_at  # callable taking a Headless, returning a wall-clock time or None
+        self.refresh = refresh  # async callable taking a Headless, bringing its state up to date
+        self.max_age = max_age
+        self._refreshing = {}  # container id -> refresh task in flight
+        self._bodies = {}  # container id -> (updated_at, body, etag)
+
+    async def get(self, headless):
+        """`(body, etag, age)` for a container, refreshed first when stale"""
+        updated_at = self.updated_at(headless)
+        cache = 'fresh'
+        if self.refresh is not None and (updated_at is None or time.time() - updated_at >= self.max_age):
+            cache = await self._refresh(headless)
+            updated_at = self.updated_at(headless)
+        REST_REQUESTS.labels(resource=self.name, cache=cache).inc()
+
+        cached = self._bodies.get(headless.id)
+        if cached is None or updated_at is None or cached[0] != updated_at:
+            data = await self.read(headless)
+            body = json.dumps({"container": headless.id, self.name: data}, separators=(',', ':')).encode('utf-8')
+            cached = self._bodies[headless.id] = (updated_at, body, f'"{hashlib.sha1(body).hexdigest()[:20]}"')
+        age = time.time() - updated_at if updated_at is not None else None
+        return cached[1], cached[2], age
+
+    async def _refresh(self, headless):
+        task = self._refreshing.get(headless.id)
+        if task is not None and not task.done():
+            cache = 'joined'
+        else:
+            cache = 'refreshed'
+            REST_REFRESHES.labels(resource=self.name).inc()
+            task = self._refreshing[headless.id] = asyncio.create_task(self.refresh(headless))
+        try:
+            # Shield so a client hanging up doesn't cancel the refresh for everyone else
+            await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error refreshing {self.name} for {headless.id}: {e}")
+        return cache
+
+    def forget(self, container_id):
+        self._bodies.pop(container_id, None)
+        self._refreshing.pop(container_id, None)
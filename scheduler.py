@@ -0,0 +1,191 @@
+import asyncio
+import random
+import time
+
+
+class ScheduledTask:
+    """One recurring job: what to run, how often, and how its recent runs went"""
+
+    def __init__(self, name, func, interval, jitter=0.1, container_id=None, kind=None):
+        self.name = name
+        self.func = func  # async callable returning the task's result
+        self.interval = interval  # Seconds between runs
+        self.jitter = jitter  # Fraction of the interval each run may move by
+        self.container_id = container_id
+        self.kind = kind
+        self.result = None  # Result of the last successful run
+        self.updated_at = None  # Wall-clock time of the last successful run
+        self.runs = 0
+        self.errors = 0
+        self.skipped = 0  # Runs merged into others because the task was still running or late
+        self.last_error = None
+        self.last_duration = None
+        self.last_lag = None  # Seconds the last scheduled run started after it was due
+        self.next_run = None  # Wall-clock time of the next scheduled run
+        self._loop_task = None
+        self._run_task = None
+
+    @property
+    def is_running(self):
+        return self._run_task is not None and not self._run_task.done()
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "container": self.container_id,
+            "kind": self.kind,
+            "interval": self.interval,
+            "jitter": self.jitter,
+            "runs": self.runs,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "last_error": self.last_error,
+            "last_duration": self.last_duration,
+            "last_lag": self.last_lag,
+            "updated_at": self.updated_at,
+            "next_run": self.next_run,
+            "running": self.is_running
+        }
+
+
+class Scheduler:
+    """Runs recurring tasks on the event loop, for every client at once.
+
+    Each task sleeps until it is due, with a random jitter so tasks sharing
+    an interval don't all hit the headless at the same moment. A run that is
+    requested while the task is already running joins that run, and runs
+    missed while the loop was busy collapse into one. Every run's duration
+    and lag are kept on the task and passed to `on_run`, and `on_result` is
+    called with each successful result.
+    """
+
+    def __init__(self, on_result=None, on_run=None, startup_spread=2.0):
+        self.on_result = on_result  # async callable taking the task after each successful run
+        self.on_run = on_run  # callable taking the task after every run
+        self.startup_spread = startup_spread  # Longest a new task waits for its first run
+        self.tasks = {}
+        self._started = False
+
+    def add(self, name, func, interval, jitter=0.1, container_id=None, kind=None, run_now=True):
+        """Register a task, replacing any task with the same name"""
+        self.remove(name)
+        task = ScheduledTask(name, func, interval, jitter, container_id, kind)
+        self.tasks[name] = task
+        if self._started:
+            self._start_task(task, run_now)
+        return task
+
+    def remove(self, name):
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            for running in (task._loop_task, task._run_task):
+                if running is not None:
+                    running.cancel()
+        return task
+
+    def remove_container(self, container_id):
+        for name, task in list(self.tasks.items()):
+            if task.container_id == container_id:
+                self.remove(name)
+
+    def get(self, name):
+        if name not in self.tasks:
+            raise KeyError(f"Unknown task: {name}")
+        return self.tasks[name]
+
+    def set_interval(self, name, interval):
+        """Change a task's interval; the new interval applies from the next run"""
+        task = self.get(name)
+        task.interval = interval
+        # Restart the loop so a long sleep on the old interval doesn't hold it back
+        if task._loop_task is not None:
+            task._loop_task.cancel()
+            self._start_task(task, run_now=False)
+        return task
+
+    def run_now(self, name):
+        """Run a task outside its schedule, or join the run already in progress"""
+        task = self.get(name)
+        if task.is_running:
+            task.skipped += 1
+        else:
+            task._run_task = asyncio.create_task(self._run(task, lag=0.0))
+        return asyncio.shield(task._run_task)
+
+    def start(self):
+        self._started = True
+        for task in self.tasks.values():
+            self._start_task(task, run_now=True)
+
+    async def stop(self):
+        self._started = False
+        for task in self.tasks.values():
+            for running in (task._loop_task, task._run_task):
+                if running is not None:
+                    running.cancel()
+            task._loop_task = None
+            task._run_task = None
+
+    def describe(self):
+        return [task.describe() for task in self.tasks.values()]
+
+    def _start_task(self, task, run_now):
+        task._loop_task = asyncio.create_task(self._loop(task, run_now))
+
+    def _delay(self, task):
+        spread = task.interval * task.jitter
+        return max(task.interval + random.uniform(-spread, spread), 0.0)
+
+    async def _loop(self, task, run_now):
+        loop = asyncio.get_running_loop()
+        # Spread the first runs over a few seconds too, so a restart doesn't fire everything at once
+        first = random.uniform(0, min(task.interval * task.jitter, self.startup_spread))
+        due = loop.time() + (first if run_now else self._delay(task))
+        while True:
+            task.next_run = time.time() + max(due - loop.time(), 0.0)
+            await asyncio.sleep(max(due - loop.time(), 0.0))
+            lag = loop.time() - due
+            if task.is_running:
+                # Still busy with a run somebody asked for; this one is covered by it
+                task.skipped += 1
+            else:
+                task._run_task = asyncio.create_task(self._run(task, lag))
+                try:
+                    await asyncio.shield(task._run_task)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    pass
+            due += self._delay(task)
+            if due < loop.time():
+                # Fell a whole interval or more behind; run once now instead of catching up
+                task.skipped += 1
+                due = loop.time()
+
+    async def _run(self, task, lag):
+        start = time.perf_counter()
+        task.last_lag = lag
+        try:
+            result = await task.func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            task.errors += 1
+            task.last_error = str(e)
+            print(f"Error running scheduled task {task.name}: {e}")
+            return None
+        finally:
+            task.runs += 1
+            task.last_duration = time.perf_counter() - start
+            if self.on_run is not None:
+                self.on_run(task)
+
+        task.result = result
+        task.updated_at = time.time()
+        task.last_error = None
+        if self.on_result is not None:
+            try:
+                await self.on_result(task)
+            except Exception as e:
+                print(f"Error publishing scheduled task {task.name}: {e}")
+        return result
@@ -1,16 +1,25 @@
-from fastapi import FastAPI, WebSocket, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, WebSocket, HTTPException, Query, Header, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import asyncio
-from docker_manager import DockerManager
+from contextlib import asynccontextmanager
+from command_executor import command_name, is_focus_free
+from config_store import ConfigConflict, ConfigFile
+from console_parser import parse_bans, parse_friend_requests
+from fleet import Fleet
+from instrumentation import OPENMETRICS_CONTENT_TYPE, PROMETHEUS_CONTENT_TYPE, REGISTRY
+from metrics_store import TimeSeriesStore
+from metrics_sampler import MetricsSampler
+from rest_cache import CachedResource
+from scheduler import Scheduler
+from status_sampler import StatusSampler
+from ws_transport import ClientConnection
 import json
 import threading
-from functools import partial
-import time
+from itertools import islice
 from dotenv import load_dotenv
 import os
-from typing import Dict, Any
-import psutil  # Add this import
+from typing import Dict, Any, List, Optional
 import re
 import logging
 
@@ -20,107 +29,344 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await fleet.start()
+    status_sampler.start()
+    metrics_sampler.start()
+    scheduler.start()
+    yield
+    await scheduler.stop()
+    await metrics_sampler.stop()
+    await status_sampler.stop()
+    await fleet.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Serve static files (if you have any CSS/JS files)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Store active WebSocket connections
-active_connections = []
+# Store active WebSocket connections, mapped to the container each one is viewing
+active_connections = {}
+
+# Output batching, per-client send budget and slow client cutoff for every WebSocket
+transport_options = {
+    "flush_interval": float(os.getenv('WS_FLUSH_INTERVAL', '0.05')),
+    "max_batch_lines": int(os.getenv('WS_MAX_BATCH_LINES', '500')),
+    "budget_bytes": int(os.getenv('WS_BUDGET_BYTES', str(256 * 1024))),
+    "send_timeout": float(os.getenv('WS_SEND_TIMEOUT', '10'))
+}
+
+async def broadcast(container_id, message):
+    """Queue a message for every WebSocket viewing the given container"""
+    message = {**message, "container": container_id}
+    for connection, viewing in list(active_connections.items()):
+        if viewing == container_id:
+            connection.send(message)
+
+# Last worlds snapshot sent to each WebSocket as (container_id, version, worlds)
+worlds_sent = {}
+
+def send_worlds(connection, headless, full=False):
+    """Bring a WebSocket up to date with a container's worlds, as a patch when possible"""
+    poller = headless.world_poller
+    sent = worlds_sent.get(connection)
+    message = None
+    if not full and sent is not None and sent[0] == headless.id:
+        message = poller.patch_since(sent[1], sent[2])
+    if message is None:
+        message = poller.snapshot()
+    worlds_sent[connection] = (headless.id, poller.version, poller.worlds)
+    connection.send({**message, "container": headless.id})
+
+async def publish_worlds(container_id):
+    """Send a finished crawl to every WebSocket viewing the container"""
+    headless = fleet.get(container_id)
+    for connection, viewing in list(active_connections.items()):
+        if viewing == container_id:
+            send_worlds(connection, headless)
+
+def task_message(task):
+    """The message clients get for a scheduled task's latest result, if any"""
+    if task.kind == 'status':
+        return {"type": "status_update", "status": task.result}
+    if task.kind == 'bans':
+        return {"type": "bans_update", "bans": task.result}
+    if task.kind == 'friend_requests':
+        return {"type": "friend_requests_update", "requests": task.result}
+    if task.kind == 'command':
+        return {"type": "command_response", "command": task.name.split(':', 2)[2], "output": task.result,
+                "scheduled": True}
+    return None  # Worlds crawls publish their own patches
+
+async def publish_task(task):
+    """Send a scheduled task's fresh result to every client viewing its container"""
+    message = task_message(task)
+    if message is not None and task.container_id is not None:
+        await broadcast(task.container_id, message)
+
+def record_task_run(task):
+    metrics_store.record('task_duration_seconds', task.last_duration, task=task.name)
+    metrics_store.record('task_lag_seconds', task.last_lag, task=task.name)
+
+# Recurring work for every container runs here once, however many tabs are open
+scheduler = Scheduler(on_result=publish_task, on_run=record_task_run)
+schedule_jitter = float(os.getenv('SCHEDULE_JITTER', '0.1'))
+schedule_intervals = {
+    "status": float(os.getenv('STATUS_PUSH_INTERVAL', '5')),
+    "worlds": float(os.getenv('WORLDS_POLL_INTERVAL', '300')),
+    "bans": float(os.getenv('BANS_INTERVAL', '300')),
+    "friend_requests": float(os.getenv('FRIEND_REQUESTS_INTERVAL', '300'))
+}
+
+def parse_scheduled_commands(value):
+    """SCHEDULED_COMMANDS is a `;` separated list of `seconds:command`, e.g. `3600:saveconfig`"""
+    commands = []
+    for entry in (value or '').split(';'):
+        if not entry.strip():
+            continue
+        interval, _, command = entry.partition(':')
+        try:
+            interval = float(interval)
+        except ValueError:
+            logger.warning(f"Skipping scheduled command {entry.strip()!r}: interval must be a number of seconds")
+            continue
+        if not command.strip():
+            logger.warning(f"Skipping scheduled command {entry.strip()!r}: command is required")
+        elif not 1 <= interval < float('inf'):
+            logger.warning(f"Skipping scheduled command {entry.strip()!r}: interval must be at least 1 second")
+        else:
+            commands.append((interval, command.strip()))
+    return commands
+
+scheduled_commands = parse_scheduled_commands(os.getenv('SCHEDULED_COMMANDS'))
+
+def schedule_command(container_id, command, interval):
+    """Run a console command on a container every `interval` seconds"""
+    headless = fleet.get(container_id)
+
+    async def run():
+        return await headless.executor.send_command_async(command)
+
+    return scheduler.add(f"{container_id}:command:{command}", run, interval, schedule_jitter,
+                         container_id=container_id, kind='command', run_now=False)
+
+def schedule_container(headless):
+    """Register the recurring tasks for a newly managed container"""
+    executor = headless.executor
+
+    async def status():
+        return await status_sampler.get_status(headless)
+
+    async def worlds():
+        await headless.world_poller.refresh()
+        return headless.world_poller.version
+
+    last_bans = [None, []]  # Last `listbans` output and what it parsed to
+
+    async def bans():
+        output = await executor.send_command_async("listbans")
+        if output != last_bans[0]:
+            # Only a changed ban list is parsed and indexed again
+            last_bans[:] = [output, [ban.to_dict() for ban in parse_bans(output)]]
+            fleet.user_index.update_bans(headless.id, last_bans[1])
+        return last_bans[1]
+
+    async def friend_requests():
+        return parse_friend_requests(await executor.send_command_async("friendRequests"))
+
+    for kind, func in (("status", status), ("worlds", worlds), ("bans", bans), ("friend_requests", friend_requests)):
+        scheduler.add(f"{headless.id}:{kind}", func, schedule_intervals[kind], schedule_jitter,
+                      container_id=headless.id, kind=kind)
+    for interval, command in scheduled_commands:
+        schedule_command(headless.id, command, interval)
+
+def container_removed(container_id):
+    """Drop the scheduled tasks, cached REST responses and metric series of a container that went away"""
+    scheduler.remove_container(container_id)
+    REGISTRY.remove(container=container_id)
+    for resource in rest_resources.values():
+        resource.forget(container_id)
+
+# Containers are found by label or name pattern, or fall back to CONTAINER_NAME from .env
+container_label = os.getenv('CONTAINER_LABEL')
+container_pattern = os.getenv('CONTAINER_PATTERN')
+default_names = '' if container_label or container_pattern else 'resonite-headless'
+
+# HEADLESS_BACKEND=simulator swaps Docker for simulated headlesses, for load tests and development
+backend = None
+if os.getenv('HEADLESS_BACKEND', 'docker') == 'simulator':
+    from headless_simulator import SimulatedBackend
+    backend = SimulatedBackend(
+        worlds=int(os.getenv('SIMULATOR_WORLDS', '3')),
+        users_per_world=int(os.getenv('SIMULATOR_USERS', '4')),
+        latency=float(os.getenv('SIMULATOR_LATENCY', '0.01')),
+        log_rate=float(os.getenv('SIMULATOR_LOG_RATE', '5'))
+    )
 
-# Initialize DockerManager with container name from .env
-docker_manager = DockerManager(os.getenv('CONTAINER_NAME', 'resonite-headless'))  # Fallback to 'resonite-headless' if not set
+# One registry for every headless; each gets a shared worlds crawl and a single output reader
+fleet = Fleet(
+    broadcast,
+    publish_worlds,
+    names=os.getenv('CONTAINER_NAME', default_names).split(','),
+    label=container_label,
+    pattern=container_pattern,
+    max_workers=int(os.getenv('DOCKER_IO_WORKERS', '8')),
+    discovery_interval=int(os.getenv('DISCOVERY_INTERVAL', '60')),
+    max_age=int(os.getenv('WORLDS_MAX_AGE', '5')),
+    detail_max_age=int(os.getenv('WORLDS_DETAIL_MAX_AGE', '60')),
+    queue_size=int(os.getenv('OUTPUT_QUEUE_SIZE', '500')),
+    log_dir=os.getenv('LOG_DIR', 'logs'),
+    log_segment_size=int(os.getenv('LOG_SEGMENT_SIZE', str(4 * 1024 * 1024))),
+    log_max_segments=int(os.getenv('LOG_MAX_SEGMENTS', '32')),
+    on_added=schedule_container,
+    on_removed=container_removed,
+    backend=backend
+)
+
+# Latest host and container status, kept fresh in the background for get_status
+status_sampler = StatusSampler(
+    fleet,
+    interval=float(os.getenv('STATUS_INTERVAL', '1')),
+    status_interval=float(os.getenv('CONTAINER_STATUS_INTERVAL', '5'))
+)
+
+# Host, container and world history for charts, recorded from the status cache
+metrics_store = TimeSeriesStore(max_series=int(os.getenv('METRICS_MAX_SERIES', '2000')))
+metrics_sampler = MetricsSampler(
+    fleet,
+    status_sampler,
+    metrics_store,
+    interval=float(os.getenv('METRICS_INTERVAL', '1')),
+    container_interval=float(os.getenv('METRICS_CONTAINER_INTERVAL', '10'))
+)
+
+def status_updated_at(headless):
+    cached = status_sampler.containers.get(headless.id, {})
+    times = [t for t in (status_sampler.host_sampled_at, cached.get("status_at"), cached.get("stats_at")) if t]
+    return max(times) if times and "status" in cached else None
+
+async def read_users(headless):
+    """Everyone in the container's worlds, from the worlds snapshot"""
+    return [{**user, "world": world.get("name"), "sessionId": world.get("sessionId")}
+            for world in headless.world_poller.worlds for user in world.get("users_list", [])]
+
+async def read_worlds(headless):
+    return headless.world_poller.worlds
+
+async def refresh_worlds(headless):
+    await headless.world_poller.refresh()
+
+def bans_task(headless):
+    return scheduler.tasks.get(f"{headless.id}:bans")
+
+async def read_bans(headless):
+    task = bans_task(headless)
+    return task.result if task is not None and task.result is not None else []
+
+async def refresh_bans(headless):
+    if bans_task(headless) is not None:
+        await scheduler.run_now(f"{headless.id}:bans")
+
+# Read-only REST resources for dashboards and bots, served from the state kept above. Stale
+# state is refreshed once for all waiting requests; the status sampler keeps itself fresh
+rest_resources = {
+    "status": CachedResource(
+        "status", status_sampler.get_status, status_updated_at,
+        max_age=float(os.getenv('REST_STATUS_MAX_AGE', '5'))),
+    "worlds": CachedResource(
+        "worlds", read_worlds, lambda headless: headless.world_poller.updated_at, refresh_worlds,
+        max_age=float(os.getenv('REST_WORLDS_MAX_AGE', '30'))),
+    "users": CachedResource(
+        "users", read_users, lambda headless: headless.world_poller.updated_at, refresh_worlds,
+        max_age=float(os.getenv('REST_USERS_MAX_AGE', '30'))),
+    "bans": CachedResource(
+        "bans", read_bans, lambda headless: getattr(bans_task(headless), 'updated_at', None), refresh_bans,
+        max_age=float(os.getenv('REST_BANS_MAX_AGE', '300')))
+}
+
+# Figures the manager already keeps, read only when /metrics is scraped
+def per_container(func):
+    return lambda: [((headless.id,), func(headless)) for headless in list(fleet.headlesses.values())]
+
+REGISTRY.gauge_function('websocket_connections', 'Open websocket connections', lambda: len(active_connections))
+REGISTRY.gauge_function('log_monitor_threads', 'Container output reader threads running',
+                        lambda: sum(headless.log_monitor.is_running for headless in list(fleet.headlesses.values())))
+REGISTRY.gauge_function('log_subscribers', 'Clients subscribed to a container\'s output',
+                        per_container(lambda headless: len(headless.log_monitor.subscribers)), ('container',))
+REGISTRY.gauge_function('log_queued_lines', 'Output lines waiting to be sent, summed over subscribers',
+                        per_container(lambda headless: headless.log_monitor.queued_lines), ('container',))
+REGISTRY.gauge_function('log_lines', 'Output lines read from the container',
+                        per_container(lambda headless: headless.log_monitor.lines), ('container',), kind='counter')
+REGISTRY.gauge_function('log_dropped_lines', 'Output lines dropped because a client fell behind',
+                        per_container(lambda headless: headless.log_monitor.dropped_lines), ('container',), kind='counter')
+REGISTRY.gauge_function('command_queue_depth', 'Commands waiting for the focus lock or the console',
+                        per_container(lambda headless: headless.executor.queue_depth), ('container',))
+REGISTRY.gauge_function('command_focus_lock_wait_seconds', 'Time spent waiting for the focus lock',
+                        per_container(lambda headless: headless.executor.wait_seconds), ('container',), kind='counter')
+REGISTRY.gauge_function('process_threads', 'Threads in the manager process', threading.active_count)
+
+# Lines of stored output sent to a client when it starts viewing a container
+scrollback_lines = int(os.getenv('SCROLLBACK_LINES', '200'))
+
+# Access levels accepted by the headless `accessLevel` command
+ACCESS_LEVELS = ('Private', 'LAN', 'Contacts', 'ContactsPlus', 'RegisteredUsers', 'Anyone')
+
+def validate_commands(commands):
+    """Check a batch is a non-empty list of single-line console commands"""
+    if not isinstance(commands, list) or not commands:
+        raise ValueError("Commands must be a non-empty list")
+    for command in commands:
+        if not isinstance(command, str) or not command.strip():
+            raise ValueError("Commands must be non-empty strings")
+        if '\r' in command or '\n' in command:
+            # A line break would be read by the console as a second command
+            raise ValueError("Commands can't contain line breaks")
+    return [command.strip() for command in commands]
+
+def world_property_commands(data):
+    """Console commands applying the world properties present in `data`"""
+    commands = []
+    if data.get('name') is not None:
+        commands.append(f"name {data['name']}")
+    if data.get('hidden') is not None:
+        commands.append(f"hideFromListing {str(bool(data['hidden'])).lower()}")
+    if data.get('description') is not None:
+        commands.append(f"description {data['description']}")
+    if data.get('accessLevel') is not None:
+        if data['accessLevel'] not in ACCESS_LEVELS:
+            raise ValueError(f"Access level must be one of {', '.join(ACCESS_LEVELS)}")
+        commands.append(f"accessLevel {data['accessLevel']}")
+    if data.get('maxUsers') is not None:
+        try:
+            max_users = int(data['maxUsers'])
+        except (TypeError, ValueError):
+            raise ValueError("Max users must be a number")
+        if not 1 <= max_users <= 256:
+            raise ValueError("Max users must be between 1 and 256")
+        commands.append(f"maxUsers {max_users}")
+    return commands
 
 # Add config file handling
-def load_config() -> Dict[Any, Any]:
-    """Load the headless config file"""
+def get_config_path(container_id=None):
+    """CONFIG_PATH for a container; a {container} placeholder is filled with its id"""
     config_path = os.getenv('CONFIG_PATH')
     if not config_path:
-        logger.error("CONFIG_PATH environment variable is not set")
-        raise ValueError("CONFIG_PATH not set in environment variables")
+        return None
+    return config_path.replace('{container}', container_id or fleet.default_id or '')
 
-    logger.info(f"Attempting to load config from: {config_path}")
+# Parsed config files, cached until they change on disk
+config_files = {}
 
-    try:
-        with open(config_path, 'r') as f:
-            raw_content = f.read()
-            return {
-                "content": raw_content
-            }
-    except FileNotFoundError:
-        logger.error(f"Config file not found at path: {config_path}")
-        raise ValueError(f"Config file not found at {config_path}")
-    except Exception as e:
-        logger.error(f"Unexpected error loading config: {str(e)}")
-        raise ValueError(f"Error loading config: {str(e)}")
-
-def save_config(config_data: Dict[Any, Any]) -> None:
-    """Save the headless config file"""
-    config_path = os.getenv('CONFIG_PATH')
+def get_config_file(container_id=None) -> ConfigFile:
+    """The cached ConfigFile for a container's CONFIG_PATH"""
+    config_path = get_config_path(container_id)
     if not config_path:
+        logger.error("CONFIG_PATH environment variable is not set")
         raise ValueError("CONFIG_PATH not set in environment variables")
-
-    # Validate JSON before saving
-    try:
-        # Test if the data can be serialized
-        json.dumps(config_data)
-    except (TypeError, json.JSONDecodeError):
-        raise ValueError("Invalid JSON data")
-
-    with open(config_path, 'w') as f:
-        json.dump(config_data, f, indent=2)
-
-def format_uptime(uptime_str):
-    """Convert .NET TimeSpan format to human readable format"""
-    try:
-        # Split into days, hours, minutes, seconds
-        parts = uptime_str.split('.')
-        if len(parts) != 2:
-            return uptime_str
-
-        days = 0
-        time_parts = parts[0].split(':')
-        if len(time_parts) != 3:
-            return uptime_str
-
-        hours, minutes, seconds = map(int, time_parts)
-
-        # Handle days if present
-        if hours >= 24:
-            days = hours // 24
-            hours = hours % 24
-
-        # Build readable string
-        components = []
-        if days > 0:
-            components.append(f"{days} {'day' if days == 1 else 'days'}")
-        if hours > 0:
-            components.append(f"{hours} {'hour' if hours == 1 else 'hours'}")
-        if not days and minutes > 0:  # Only show minutes if less than a day
-            components.append(f"{minutes} {'minute' if minutes == 1 else 'minutes'}")
-
-        return ' '.join(components) if components else "just started"
-    except:
-        return uptime_str
-
-def parse_bans(output):
-    """Parse the ban list output into structured data"""
-    bans = []
-    # Remove the first line
-    lines = output.split('\n')[1:]
-
-    for line in lines:
-        line = line.strip()
-        line = line.replace('\t', '')
-        if line and not line.endswith('>'):  # Skip empty lines and command prompt
-            # Match the format: [index]Username:nameUserID:idMachineIds:
-            match = re.match(r'\[\d+\]Username:(.+?)UserID:(.+?)MachineIds:', line)
-            if match:
-                bans.append({
-                    'username': match.group(1).strip(),
-                    'userId': match.group(2).strip()
-                })
-    return bans
+    if config_path not in config_files:
+        config_files[config_path] = ConfigFile(config_path)
+    return config_files[config_path]
 
 @app.get("/")
 async def get():
@@ -130,269 +376,515 @@ async def get():
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    active_connections.append(websocket)
+    connection = ClientConnection(websocket, **transport_options)
+    active_connections[connection] = None
+    subscription = None  # (headless, output queue)
+    client_world = None  # Session this client last typed `focus` for; its console commands run there
+
+    async def select_container(container_id):
+        """Point this client at a container's output and worlds broadcasts"""
+        nonlocal subscription, client_world
+        headless = fleet.get(container_id)
+        client_world = None
+        if subscription is not None:
+            previous, output_queue = subscription
+            previous.log_monitor.unsubscribe(output_queue)
+            connection.unfollow()
+        active_connections[connection] = headless.id
+
+        # Subscribe before reading the scrollback so no line falls in between
+        output_queue = headless.log_monitor.subscribe()
+        last_sent = None
+        if headless.log_store is not None and scrollback_lines:
+            history = await headless.docker_manager.run_blocking(headless.log_store.tail, scrollback_lines)
+            connection.send({
+                "type": "log_history",
+                "container": headless.id,
+                "lines": history
+            })
+            if history:
+                last_sent = history[-1][0]
+
+        # The connection's writer forwards the shared Docker output to this client in batches
+        connection.follow(output_queue, last_sent)
+        subscription = (headless, output_queue)
+
+        # Give the client the cached worlds and scheduled results right away
+        if headless.world_poller.updated_at is not None:
+            send_worlds(connection, headless, full=True)
+        for kind in ("bans", "friend_requests"):
+            task = scheduler.tasks.get(f"{headless.id}:{kind}")
+            if task is not None and task.updated_at is not None:
+                connection.send({**task_message(task), "container": headless.id})
 
     try:
-        # Start monitoring Docker output in a separate task
-        monitor_task = asyncio.create_task(monitor_docker_output(websocket))
+        connection.send({
+            "type": "containers_update",
+            "containers": fleet.describe(),
+            "selected": fleet.default_id
+        })
+        if fleet.default_id is not None:
+            await select_container(fleet.default_id)
 
         # Handle incoming messages
         while True:
             message = await websocket.receive_text()
             try:
                 data = json.loads(message)
-                if data["type"] == "command":
-                    # Execute command and send response
-                    output = docker_manager.send_command(data["command"])
+                if data["type"] == "select_container":
+                    await select_container(data.get("container"))
+                    continue
+
+                # Messages act on the container this client is viewing unless they name one
+                headless = fleet.get(data.get("container") or active_connections[connection])
+                world_poller = headless.world_poller
 
-                    # Special handling for listbans command
+                if data["type"] == "command":
+                    # Ban and friend request lists are shared, so refresh them for every viewer
+                    # through the scheduler; a refresh already in progress is joined
                     if data["command"] == "listbans":
-                        bans = parse_bans(output)
-                        await websocket.send_json({
-                            "type": "bans_update",
-                            "bans": bans
-                        })
+                        await scheduler.run_now(f"{headless.id}:bans")
+                        continue
+                    if data["command"] == "friendRequests":
+                        await scheduler.run_now(f"{headless.id}:friend_requests")
+                        continue
+
+                    # Execute command and send response
+                    command = data["command"]
+                    if command_name(command) == 'focus':
+                        # Remember the world by session, since other clients move the console's focus
+                        index = command.split(maxsplit=1)[1:]
+                        if index and index[0].strip().isdigit() and int(index[0]) < len(world_poller.worlds):
+                            client_world = world_poller.worlds[int(index[0])].get("sessionId") or None
+                        output = await headless.executor.send_command_async(command)
+                    elif client_world is not None and not is_focus_free(command):
+                        try:
+                            output = (await headless.run_batch([command], client_world))[0]["output"]
+                        except KeyError:
+                            client_world = None
+                            raise
                     else:
-                        await websocket.send_json({
-                            "type": "command_response",
-                            "command": data["command"],
-                            "output": output
-                        })
-                elif data["type"] == "get_status":
-                    # Get container status and system metrics
-                    status = docker_manager.get_container_status()
-
-                    # Get system metrics
-                    cpu_percent = psutil.cpu_percent(interval=1)
-                    memory = psutil.virtual_memory()
-                    memory_percent = memory.percent
-                    memory_used = f"{memory.used / (1024 * 1024 * 1024):.1f}GB"
-                    memory_total = f"{memory.total / (1024 * 1024 * 1024):.1f}GB"
-
-                    # Add metrics to status response
-                    status.update({
-                        "cpu_usage": cpu_percent,
-                        "memory_percent": memory_percent,
-                        "memory_used": memory_used,
-                        "memory_total": memory_total
+                        output = await headless.executor.send_command_async(command)
+                    connection.send({
+                        "type": "command_response",
+                        "container": headless.id,
+                        "command": data["command"],
+                        "output": output
                     })
+                elif data["type"] == "batch":
+                    # Multi-step actions on one world run as one batch so other clients can't refocus in between
+                    try:
+                        commands = validate_commands(data.get("commands"))
+                    except ValueError as e:
+                        connection.send({"type": "error", "message": str(e)})
+                        continue
+                    results = await headless.run_batch(commands, data.get("sessionId"))
+                    connection.send({
+                        "type": "batch_response",
+                        "container": headless.id,
+                        "id": data.get("id"),
+                        "sessionId": data.get("sessionId"),
+                        "results": results
+                    })
+                elif data["type"] == "get_status":
+                    # Served from the background sampler, so this never waits on Docker or psutil
+                    status = await status_sampler.get_status(headless)
 
-                    await websocket.send_json({
+                    connection.send({
                         "type": "status_update",
+                        "container": headless.id,
                         "status": status
                     })
+                elif data["type"] == "set_interval":
+                    # Changes the shared schedule, so it applies to every client
+                    if data.get("task") not in schedule_intervals:
+                        raise KeyError(f"Unknown task: {data.get('task')}")
+                    try:
+                        interval = max(float(data.get("interval")), 1.0)
+                    except (TypeError, ValueError):
+                        connection.send({
+                            "type": "error",
+                            "message": "Interval must be a number of seconds"
+                        })
+                        continue
+                    scheduler.set_interval(f"{headless.id}:{data['task']}", interval)
+                elif data["type"] == "get_logs":
+                    await stream_logs(connection, headless, data)
                 elif data["type"] == "get_worlds":
-                    worlds_output = docker_manager.send_command("worlds")
-
-                    # Remove the command and the command prompt
-                    worlds_output = worlds_output.split('\n')[1:-1]
-
-                    worlds = []
-                    for i, world in enumerate(worlds_output):
-                        # First focus on this world
-                        docker_manager.send_command(f"focus {i}")
-                        # Add delay to prevent overwhelming the container
-                        time.sleep(1)
-
-                        # Get detailed status
-                        status_output = docker_manager.send_command("status")
-                        status_lines = status_output.split('\n')[1:-1]  # Remove command and prompt
-
-                        # Get the focused world name
-                        focused_world_name = status_lines[-1][:-1]
-
-                        # Parse status output
-                        status_data = {}
-                        for line in status_lines:
-                            if ': ' in line:
-                                key, value = line.split(': ', 1)
-                                status_data[key] = value
-
-                        # Split by tabs to separate the main sections (from original worlds command)
-                        parts = world.split('\t')
-
-                        # Extract name and index from the first part
-                        name_part = parts[0]
-                        users_index = name_part.find("Users:")
-                        name = name_part[name_part.find(']') + 2:users_index].strip()
-
-                        # Create world data combining both outputs
-                        world_data = {
-                            "name": name,
-                            "sessionId": status_data.get("SessionID", ""),
-                            "users": int(status_data.get("Current Users", 0)),
-                            "present": int(status_data.get("Present Users", 0)),
-                            "maxUsers": int(status_data.get("Max Users", 0)),
-                            "uptime": format_uptime(status_data.get("Uptime", "")),
-                            "accessLevel": status_data.get("Access Level", ""),
-                            "hidden": status_data.get("Hidden from listing", "False") == "True",
-                            "mobileFriendly": status_data.get("Mobile Friendly", "False") == "True",
-                            "description": status_data.get("Description", ""),
-                            "tags": status_data.get("Tags", "")
-                        }
-
-                        # Send the users command to the focused world
-                        users_output = docker_manager.send_command(f"users")
-                        # Remove command and prompt lines
-                        users_lines = users_output.split('\n')[1:-1]
-
-                        # Parse users
-                        users_data = []
-                        for user_line in users_lines:
-                            if user_line.strip():  # Skip empty lines
-                                user_info = {}
-
-                                # Split the line by spaces but handle the special case of ID field
-                                parts = user_line.split()
-
-                                # First part is always the username
-                                user_info["username"] = parts[0]
-
-                                # Look for "ID:" and get the next part
-                                for i, part in enumerate(parts):
-                                    if part == "ID:":
-                                        if i + 1 < len(parts):
-                                            user_info["userId"] = parts[i + 1]
-                                        break
-
-                                # Parse the rest of the key-value pairs
-                                for i in range(len(parts)):
-                                    if parts[i].endswith(":") and i + 1 < len(parts):
-                                        key = parts[i][:-1].lower()  # Remove colon and convert to lowercase
-                                        value = parts[i + 1]
-                                        if key == "present":
-                                            value = value.lower() == "true"
-                                        elif key == "ping":
-                                            try:
-                                                value = int(value)
-                                            except ValueError:
-                                                # Handle case where ping has "ms" suffix
-                                                value = int(value.replace("ms", ""))
-                                        elif key == "fps":
-                                            value = float(value)
-                                        elif key == "silenced":
-                                            value = value.lower() == "true"
-                                        user_info[key] = value
-
-                                users_data.append(user_info)
-
-                        # Add users data to world_data
-                        world_data["users_list"] = users_data
-
-                        worlds.append(world_data)
-
-                    await websocket.send_json({
-                        "type": "worlds_update",
-                        "output": worlds
-                    })
+                    if data.get("full"):
+                        # Client lost track of its version; the next send is a full resync
+                        worlds_sent.pop(connection, None)
+                    if world_poller.is_fresh():
+                        # Serve the shared snapshot instead of crawling again
+                        send_worlds(connection, headless)
+                    else:
+                        # The finished crawl is broadcast to every client viewing this container
+                        world_poller.request_refresh()
             except json.JSONDecodeError:
-                await websocket.send_json({
+                connection.send({
                     "type": "error",
                     "message": "Invalid message format"
                 })
+            except KeyError as e:
+                connection.send({
+                    "type": "error",
+                    "message": str(e).strip("'")
+                })
 
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        active_connections.remove(websocket)
-        monitor_task.cancel()
-
-async def is_websocket_connected(websocket: WebSocket) -> bool:
-    """Check if the websocket is still connected"""
+        del active_connections[connection]
+        worlds_sent.pop(connection, None)
+        if subscription is not None:
+            headless, output_queue = subscription
+            headless.log_monitor.unsubscribe(output_queue)
+        await connection.close()
+
+def query_logs(log_store, query=None, regex=False, start=None, end=None, limit=None):
+    """Generator over stored log lines, filtered by a search query when given"""
+    if query:
+        return log_store.search(query, regex=regex, start=start, end=end, limit=limit)
+    return log_store.read_range(start=start, end=end, limit=limit)
+
+async def stream_logs(connection, headless, data):
+    """Stream stored log lines to a WebSocket in chunks, without loading whole segments"""
+    request_id = data.get("request_id")
+    if headless.log_store is None:
+        connection.send({"type": "error", "message": "Log storage is disabled"})
+        return
     try:
-        # Try sending a ping frame
-        await websocket.send_bytes(b'')
-        return True
-    except:
-        return False
-
-async def monitor_docker_output(websocket: WebSocket):
-    """Monitor Docker output and send to WebSocket"""
-    loop = asyncio.get_running_loop()
-
-    async def async_callback(output):
-        if await is_websocket_connected(websocket):
-            await send_output(websocket, output)
-
-    def sync_callback(output):
-        asyncio.run_coroutine_threadsafe(async_callback(output), loop)
-
-    # Run the monitoring in a separate thread
-    thread = threading.Thread(
-        target=docker_manager.monitor_output,
-        args=(sync_callback,),
-        daemon=True
-    )
-    thread.start()
-
+        rows = query_logs(
+            headless.log_store,
+            query=data.get("query"),
+            regex=bool(data.get("regex")),
+            start=data.get("start"),
+            end=data.get("end"),
+            limit=data.get("limit")
+        )
+        total = 0
+        while True:
+            chunk = await headless.docker_manager.run_blocking(lambda: list(islice(rows, 500)))
+            if not chunk:
+                break
+            total += len(chunk)
+            connection.send({
+                "type": "logs_result",
+                "container": headless.id,
+                "request_id": request_id,
+                "lines": chunk
+            })
+            # Don't read further ahead than the client is receiving
+            await connection.flush()
+    except re.error as e:
+        connection.send({"type": "error", "message": f"Invalid regex: {e}"})
+        return
+    connection.send({
+        "type": "logs_end",
+        "container": headless.id,
+        "request_id": request_id,
+        "count": total
+    })
+
+def log_response(container, query=None, regex=False, start=None, end=None, limit=None):
+    """NDJSON response streaming stored log lines for a container"""
     try:
-        while await is_websocket_connected(websocket):
-            await asyncio.sleep(1)  # Keep the monitoring alive
-    except asyncio.CancelledError:
-        # Cleanup when the task is cancelled
-        pass
-
-async def send_output(websocket: WebSocket, output):
-    """Send output to WebSocket"""
+        headless = fleet.get(container)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'"))
+    if headless.log_store is None:
+        raise HTTPException(status_code=404, detail="Log storage is disabled")
+    if regex and query:
+        try:
+            re.compile(query)
+        except re.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid regex: {e}")
+
+    rows = query_logs(headless.log_store, query, regex, start, end, limit)
+    lines = (json.dumps({"ts": ts, "line": line}) + "\n" for ts, line in rows)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@app.get("/api/logs")
+async def get_logs(container: Optional[str] = None, start: Optional[float] = None,
+                   end: Optional[float] = None, limit: Optional[int] = None):
+    """Stream stored container output between two unix timestamps"""
+    return log_response(container, start=start, end=end, limit=limit)
+
+@app.get("/api/logs/search")
+async def search_logs(q: str, container: Optional[str] = None, regex: bool = False,
+                      start: Optional[float] = None, end: Optional[float] = None,
+                      limit: Optional[int] = None):
+    """Stream stored container output matching a substring or regex"""
+    return log_response(container, q, regex, start, end, limit)
+
+@app.get("/api/metrics")
+async def get_metrics(series: Optional[List[str]] = Query(None), prefix: Optional[str] = None,
+                      start: Optional[float] = None, end: Optional[float] = None,
+                      resolution: Optional[str] = None):
+    """List the recorded series, or return points for the requested ones"""
+    if not series:
+        return JSONResponse(content={"series": metrics_store.names(prefix)})
     try:
-        if await is_websocket_connected(websocket):
-            # Ensure the output is properly encoded
-            if not isinstance(output, str):
-                output = str(output)
-
-            await websocket.send_json({
-                "type": "container_output",
-                "output": output
-            })
-    except Exception as e:
-        print(f"Error sending output: {e}")
+        return JSONResponse(content={
+            "series": {name: metrics_store.query(name, start, end, resolution) for name in series}
+        })
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'"))
+
+@app.get("/api/schedule")
+async def get_schedule():
+    """List the scheduled tasks with their interval, last run time, lag and errors"""
+    return JSONResponse(content={"tasks": scheduler.describe()})
+
+@app.post("/api/schedule")
+async def add_scheduled_command(data: dict, container: Optional[str] = None):
+    """Run a console command periodically, e.g. {"command": "saveconfig", "interval": 3600}"""
+    command = (data.get("command") or '').strip()
+    if not command:
+        raise HTTPException(status_code=400, detail="Command is required")
+    try:
+        interval = float(data.get("interval", 0))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Interval must be a number of seconds")
+    if not 1 <= interval < float('inf'):
+        raise HTTPException(status_code=400, detail="Interval must be at least 1 second")
+    try:
+        headless = fleet.get(container)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'"))
+    task = schedule_command(headless.id, command, interval)
+    return JSONResponse(content=task.describe())
+
+@app.delete("/api/schedule/{name:path}")
+async def remove_scheduled_command(name: str):
+    """Stop a scheduled command"""
+    task = scheduler.tasks.get(name)
+    if task is None or task.kind != 'command':
+        raise HTTPException(status_code=404, detail=f"Unknown scheduled command: {name}")
+    scheduler.remove(name)
+    return JSONResponse(content={"message": "Scheduled command removed"})
+
+@app.get("/api/containers")
+async def list_containers():
+    """List the managed containers with their status, queried in parallel"""
+    statuses = await fleet.statuses()
+    return JSONResponse(content={
+        "containers": [
+            {**container, "status": statuses.get(container["id"], {}),
+             "commands": fleet.get(container["id"]).executor.stats()}
+            for container in fleet.describe()
+        ]
+    })
+
+@app.get("/metrics")
+async def get_prometheus_metrics(request: Request):
+    """Manager instrumentation in the Prometheus text format, or OpenMetrics when the scraper asks for it"""
+    openmetrics = 'application/openmetrics-text' in request.headers.get('accept', '')
+    return Response(REGISTRY.render(openmetrics),
+                    media_type=OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
 
 @app.get("/config")
-async def get_config():
-    """Get the current headless config"""
+async def get_config(container: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    """Get the current headless config, or 304 when the client's ETag is still current"""
     try:
-        result = load_config()
-        return JSONResponse(content=result)
+        config_file = get_config_file(container)
+        content, etag = await run_in_threadpool(config_file.read)
     except ValueError as e:
         logger.error(f"Error in get_config endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         logger.error(f"Unexpected error in get_config endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content={"content": content}, headers={"ETag": etag})
 
 @app.post("/config")
-async def update_config(config_data: Dict[Any, Any]):
-    """Update the headless config"""
+async def update_config(config_data: Dict[Any, Any], container: Optional[str] = None,
+                        if_match: Optional[str] = Header(None)):
+    """Replace the headless config; with If-Match, only if nobody changed it since"""
     try:
-        save_config(config_data)
-        return JSONResponse(content={"message": "Config updated successfully"})
+        etag = await run_in_threadpool(get_config_file(container).write, config_data, if_match)
+        return JSONResponse(content={"message": "Config updated successfully"}, headers={"ETag": etag})
+    except ConfigConflict as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/api/world-properties")
-async def update_world_properties(data: dict):
-    """Update world properties"""
+@app.patch("/config")
+async def patch_config(operations: List[Dict[str, Any]], container: Optional[str] = None,
+                       if_match: Optional[str] = Header(None)):
+    """Apply a JSON Patch to the headless config, e.g. [{"op": "replace", "path": "/tickRate", "value": 60}]"""
     try:
-        session_id = data.get('sessionId')
-        if not session_id:
-            raise HTTPException(status_code=400, detail="Session ID is required")
+        etag = await run_in_threadpool(get_config_file(container).patch, operations, if_match)
+        return JSONResponse(content={"message": "Config updated successfully"}, headers={"ETag": etag})
+    except ConfigConflict as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # TODO: Implement the actual property updates using docker_manager
-        # You'll need to send the appropriate commands to update each property
+@app.post("/api/batch")
+async def run_batch(data: dict, container: Optional[str] = None):
+    """Run console commands back-to-back, e.g. {"sessionId": "S-...", "commands": ["kick Bob", "saveConfig"]}
 
-        return JSONResponse(content={"message": "Properties updated successfully"})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    With a sessionId the commands run on that world, with nothing from other
+    clients in between. Returns each command's output.
+    """
+    try:
+        commands = validate_commands(data.get('commands'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        headless = fleet.get(container)
+        results = await headless.run_batch(commands, data.get('sessionId'))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'"))
+    return JSONResponse(content={"results": results})
+
+# Console commands acting on a user by name, and whether they have to run in the user's world
+USER_ACTIONS = {
+    "kick": ("kick", True),
+    "respawn": ("respawn", True),
+    "silence": ("silence", True),
+    "unsilence": ("unsilence", True),
+    "ban": ("banByName", False),
+    "unban": ("unbanByName", False)
+}
+
+async def cached_response(resource, container, if_none_match):
+    """A REST resource from the cache, or 304 when the client's ETag is still current"""
+    try:
+        headless = fleet.get(container)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'"))
+    body, etag, age = await rest_resources[resource].get(headless)
+    max_age = rest_resources[resource].max_age
+    headers = {"ETag": etag, "Cache-Control": f"max-age={max(int(max_age - (age or 0)), 0)}"}
+    if age is not None:
+        headers["Age"] = str(int(age))
+    if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/api/status")
+async def rest_status(container: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    """Host and container status from the background sampler"""
+    return await cached_response("status", container, if_none_match)
+
+@app.get("/api/worlds")
+async def rest_worlds(container: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    """The shared worlds snapshot, recrawled first when older than REST_WORLDS_MAX_AGE"""
+    return await cached_response("worlds", container, if_none_match)
+
+@app.get("/api/users")
+async def rest_users(container: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    """Everyone in the container's worlds, with the world they are in"""
+    return await cached_response("users", container, if_none_match)
+
+@app.get("/api/bans")
+async def rest_bans(container: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    """The ban list from the last scheduled `listbans`"""
+    return await cached_response("bans", container, if_none_match)
+
+@app.get("/api/users/search")
+async def search_users(q: str, container: Optional[str] = None, limit: int = 20, fuzzy: bool = True):
+    """Find users in any world or ban list by userId, name, name prefix or a close spelling"""
+    results = fleet.user_index.search(q, max(1, min(limit, 200)), container, fuzzy)
+    return JSONResponse(content={"users": [{**user.to_dict(), "match": match} for user, match in results]})
+
+@app.post("/api/users/action")
+async def user_action(data: dict, container: Optional[str] = None):
+    """Moderate a user by name or userId, e.g. {"user": "Bob", "action": "kick"}
+
+    The worlds the user is in come from the user index, so nothing is
+    crawled to find them. World actions run in each of those worlds, only on
+    `container` when it is given; ban and unban run on `container`.
+    """
+    action = USER_ACTIONS.get(data.get("action"))
+    if action is None:
+        raise HTTPException(status_code=400, detail=f"Action must be one of {', '.join(USER_ACTIONS)}")
+    name = str(data.get("user") or '').strip()
+    users = fleet.user_index.get(name) if name else []
+    if not users:
+        raise HTTPException(status_code=404, detail=f"Unknown user: {name}")
+    if len(users) > 1:
+        raise HTTPException(status_code=409, detail=f"Several users are called {name}, use their userId")
+    user = users[0]
+    command, in_world = action
+    try:
+        commands = validate_commands([f"{command} {user.username}"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not in_world:
+        try:
+            headless = fleet.get(container)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e).strip("'"))
+        results = [{"container": headless.id, "results": await headless.run_batch(commands)}]
+        return JSONResponse(content={"user": user.to_dict(history=False), "results": results})
+
+    worlds = [world for world in user.worlds.values()
+              if world["sessionId"] and (container is None or world["container"] == container)]
+    if not worlds:
+        raise HTTPException(status_code=404, detail=f"{user.username} isn't in any world")
+    results = []
+    for world in worlds:
+        result = {"container": world["container"], "sessionId": world["sessionId"]}
+        try:
+            result["results"] = await fleet.get(world["container"]).run_batch(commands, world["sessionId"])
+        except KeyError as e:
+            result["error"] = str(e).strip("'")
+        results.append(result)
+    return JSONResponse(content={"user": user.to_dict(history=False), "results": results})
+
+@app.post("/api/world-properties")
+async def update_world_properties(data: dict, container: Optional[str] = None):
+    """Update world properties, e.g. {"sessionId": "S-...", "name": "My World", "maxUsers": 16}
+
+    Only the properties present are changed, all in one batch on that world,
+    and the config is saved afterwards unless "save" is false.
+    """
+    session_id = data.get('sessionId')
+    if not session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+    try:
+        commands = world_property_commands(data)
+        if not commands:
+            raise ValueError("No properties to update")
+        if data.get('save', True):
+            commands.append("saveConfig")
+        commands = validate_commands(commands)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        headless = fleet.get(container)
+        results = await headless.run_batch(commands, session_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'"))
+    return JSONResponse(content={"message": "Properties updated successfully", "results": results})
 
 @app.post("/api/restart-container")
-async def restart_container():
-    """Restart the Docker container"""
+async def restart_container(container: Optional[str] = None):
+    """Start restarting the Docker container; progress is pushed to clients as `restart_progress` messages"""
     try:
-        docker_manager.restart_container()
-        return JSONResponse(content={"message": "Container restart initiated"})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        headless = fleet.get(container)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e).strip("'"))
+    try:
+        headless.restart()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(status_code=202, content={"message": "Container restart initiated"})
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Protocol pings find dead connections; deflate compresses the batched output frames
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        ws_ping_interval=float(os.getenv('WS_PING_INTERVAL', '20')),
+        ws_ping_timeout=float(os.getenv('WS_PING_TIMEOUT', '20')),
+        ws_per_message_deflate=True
+    )
\ No newline at end of file
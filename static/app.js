@@ -3,12 +3,10 @@ const output = document.getElementById('output');
 const commandInput = document.getElementById('command-input');
 const statusDiv = document.getElementById('status');
 
-let friendRequestsInterval = 5 * 60 * 1000; // Default 5 minutes
-let friendRequestsTimer = null;
 let deniedFriendRequests = new Set(JSON.parse(localStorage.getItem('deniedFriendRequests') || '[]'));
 
-let bannedUsersInterval = 5 * 60 * 1000; // Default 5 minutes
-let bannedUsersTimer = null;
+// Container this tab is viewing; the server routes our messages to it
+let currentContainer = null;
 
 // Add this constant at the top of the file with other constants
 const AVAILABLE_ROLES = [
@@ -29,50 +27,11 @@ function connect() {
     statusDiv.classList.add('status-connecting');
     statusText.textContent = 'Connected - Checking Status...';
 
-    // Request initial status and worlds
+    // Request initial status and worlds. Everything after that, including the
+    // ban and friend request lists, is pushed by the server's scheduler
     ws.send(JSON.stringify({ type: 'get_status' }));
     ws.send(JSON.stringify({ type: 'get_worlds' }));
 
-    // Initial friend requests check
-    ws.send(JSON.stringify({
-      type: 'command',
-      command: 'friendRequests'
-    }));
-
-    // Initial banned users check
-    ws.send(JSON.stringify({
-      type: 'command',
-      command: 'listbans'
-    }));
-
-    // Set up periodic status updates with the configurable interval
-    refreshTimer = setInterval(() => {
-      if (ws.readyState === WebSocket.OPEN) {
-        ws.send(JSON.stringify({ type: 'get_status' }));
-        ws.send(JSON.stringify({ type: 'get_worlds' }));
-      }
-    }, refreshInterval);
-
-    // Set up periodic friend requests updates
-    friendRequestsTimer = setInterval(() => {
-      if (ws.readyState === WebSocket.OPEN) {
-        ws.send(JSON.stringify({
-          type: 'command',
-          command: 'friendRequests'
-        }));
-      }
-    }, friendRequestsInterval);
-
-    // Set up periodic banned users updates
-    bannedUsersTimer = setInterval(() => {
-      if (ws.readyState === WebSocket.OPEN) {
-        ws.send(JSON.stringify({
-          type: 'command',
-          command: 'listbans'
-        }));
-      }
-    }, bannedUsersInterval);
-
     // Initialize card states
     initializeCardStates();
   };
@@ -139,6 +98,18 @@ function appendOutput(text, className = '') {
   output.scrollTop = output.scrollHeight;
 }
 
+// Append a batch of lines with a single layout pass
+function appendOutputLines(lines) {
+  const fragment = document.createDocumentFragment();
+  lines.forEach(text => {
+    const div = document.createElement('div');
+    div.textContent = text;
+    fragment.appendChild(div);
+  });
+  output.appendChild(fragment);
+  output.scrollTop = output.scrollHeight;
+}
+
 function updateStatus(status) {
   const statusDiv = document.getElementById('status');
   const statusText = statusDiv.querySelector('.status-text');
@@ -146,9 +117,9 @@ function updateStatus(status) {
   const cpuUsage = document.getElementById('cpu-usage');
   const memoryUsage = document.getElementById('memory-usage');
 
-  // Update last-updated timestamp
-  const now = new Date();
-  const timeString = now.toLocaleTimeString();
+  // Show when the server took the sample, not when it arrived
+  const sampledAt = status.host_sampled_at ? new Date(status.host_sampled_at * 1000) : new Date();
+  const timeString = sampledAt.toLocaleTimeString();
   lastUpdated.textContent = `Last updated: ${timeString}`;
 
   // Remove all existing status classes
@@ -169,6 +140,16 @@ function updateStatus(status) {
     memoryUsage.textContent = `${status.memory_percent.toFixed(1)}% (${status.memory_used}/${status.memory_total})`;
   }
 
+  const stats = status.container_stats;
+  if (stats) {
+    const memory = `${(stats.memory_bytes / (1024 * 1024 * 1024)).toFixed(1)}GB`;
+    let text = `${stats.cpu_percent.toFixed(1)}% CPU, ${memory}`;
+    if (stats.network_rx_rate !== undefined) {
+      text += `, ${(stats.network_rx_rate / 1024).toFixed(0)}/${(stats.network_tx_rate / 1024).toFixed(0)} KB/s`;
+    }
+    document.getElementById('container-usage').textContent = text;
+  }
+
   switch (status.status.toLowerCase()) {
     case 'running':
       statusDiv.classList.add('status-running');
@@ -184,11 +165,30 @@ function updateStatus(status) {
   statusText.textContent = `${status.status} (${status.name})`;
 }
 
-function updateWorlds(worlds) {
+// Worlds as last received from the server, in display order, and their version
+let worldsState = [];
+let worldsVersion = null;
+
+function worldKey(world) {
+  return world.sessionId || world.name;
+}
+
+function userKey(user) {
+  return user.userId || user.username;
+}
+
+// Replace the whole worlds list (full snapshot from the server)
+function updateWorlds(worlds, version) {
+  worldsState = worlds || [];
+  worldsVersion = version === undefined ? null : version;
+  renderWorlds();
+}
+
+function renderWorlds() {
   const worldsList = document.getElementById('worlds-list');
   worldsList.innerHTML = ''; // Clear existing worlds
 
-  if (!worlds || worlds.length === 0) {
+  if (worldsState.length === 0) {
     const noWorldsDiv = document.createElement('div');
     noWorldsDiv.className = 'no-worlds';
     noWorldsDiv.textContent = 'No active worlds found';
@@ -196,130 +196,319 @@ function updateWorlds(worlds) {
     return;
   }
 
-  worlds.forEach((world, index) => {
-    const worldDiv = document.createElement('div');
-    worldDiv.className = 'world-card';
-    worldDiv.dataset.sessionId = world.sessionId;
-    worldDiv.dataset.name = world.name;
-    worldDiv.dataset.hidden = world.hidden;
-    worldDiv.dataset.description = world.description;
-    worldDiv.dataset.accessLevel = world.accessLevel;
-    worldDiv.dataset.maxUsers = world.maxUsers;
-    worldDiv.dataset.index = index; // Add the index to the dataset
-
-    // Add click handler
-    worldDiv.addEventListener('click', () => selectWorld(world.sessionId));
-
-    // Create tags HTML if tags exist
-    const tagsHtml = world.tags ?
-      `<div class="world-tags">
-            ${world.tags.split(',').map(tag => `<span class="tag">${tag.trim()}</span>`).join('')}
-           </div>` : '';
-
-    // Create users list HTML if users exist
-    const usersHtml = world.users_list && world.users_list.length > 0 ?
-      `<div class="user-list">
-            <span class="label">Connected Users:</span>
-            <div class="users">
-              ${world.users_list.map(user => `
-                <div class="user-card">
-                  <div class="user-header">
-                    <div class="user-info">
-                      <span class="user-name">${user.username}</span>
-                      <div class="copy-buttons">
-                        <button onclick="event.stopPropagation(); copyText('${user.username}', 'username')" class="copy-user-btn" title="Copy Username">
-                          Copy Name
-                        </button>
-                        <button onclick="event.stopPropagation(); copyText('${user.userId}', 'userId')" class="copy-user-btn" title="Copy User ID">
-                          Copy ID
-                        </button>
-                      </div>
-                    </div>
-                    <select class="role-select" onchange="handleRoleChange(event, '${user.username}', ${index})">
-                      ${AVAILABLE_ROLES.map(role => `
-                        <option value="${role}" ${user.role === role ? 'selected' : ''}>
-                          ${role}
-                        </option>
-                      `).join('')}
-                    </select>
-                  </div>
-                  <div class="user-stats">
-                    <span class="user-stat" title="Present Status">
-                      <i class="status-dot ${user.present ? 'present' : 'away'}"></i>
-                      ${user.present ? 'Present' : 'Away'}
-                    </span>
-                    <span class="user-stat" title="Ping">
-                      ${user.ping}ms
-                    </span>
-                    <span class="user-stat" title="FPS">
-                      ${user.fps.toFixed(1)} FPS
-                    </span>
-                    ${user.silenced ? '<span class="user-stat silenced" title="User is silenced">🔇</span>' : ''}
-                  </div>
-                  <div class="user-actions">
-                    <button onclick="event.stopPropagation(); handleUserAction('kick', '${user.username}', ${index})" class="user-action-btn" title="Kick User">
-                      Kick
-                    </button>
-                    <button onclick="event.stopPropagation(); handleUserAction('respawn', '${user.username}', ${index})" class="user-action-btn" title="Respawn User">
-                      Respawn
-                    </button>
-                    <button onclick="event.stopPropagation(); handleUserAction('${user.silenced ? 'unsilence' : 'silence'}', '${user.username}', ${index})" class="user-action-btn ${user.silenced ? 'unsilence' : 'silence'}" title="${user.silenced ? 'Unsilence User' : 'Silence User'}">
-                      ${user.silenced ? 'Unsilence' : 'Silence'}
-                    </button>
-                    <button onclick="event.stopPropagation(); handleUserAction('ban', '${user.username}', ${index})" class="user-action-btn ban" title="Ban User">
-                      Ban
-                    </button>
-                  </div>
-                </div>
-              `).join('')}
-            </div>
-           </div>` : '';
-
-    worldDiv.innerHTML = `
-          <span class="world-name">${world.name}</span>
-          <div class="session-id-container">
-            <div class="session-id">Session: ${world.sessionId}</div>
-            <button
-              class="copy-button"
-              onclick="event.stopPropagation(); copyToClipboard('${world.sessionId}')"
-              data-session-id="${world.sessionId}">
-              Copy
-            </button>
+  worldsState.forEach((world, index) => {
+    worldsList.appendChild(createWorldCard(world, index));
+  });
+}
+
+// Apply a worlds_patch from the server to the cached worlds and the DOM
+function applyWorldsPatch(patch) {
+  if (worldsVersion === null || patch.base_version !== worldsVersion) {
+    // We missed an update; ask for the full snapshot again
+    ws.send(JSON.stringify({ type: 'get_worlds', full: true }));
+    return;
+  }
+  worldsVersion = patch.version;
+
+  const byKey = new Map(worldsState.map(world => [worldKey(world), world]));
+  patch.removed.forEach(key => byKey.delete(key));
+  patch.added.forEach(world => byKey.set(worldKey(world), world));
+
+  patch.changed.forEach(change => {
+    const world = byKey.get(change.key);
+    if (!world) return;
+    Object.assign(world, change.fields || {});
+    if (change.users) {
+      applyUsersPatch(world, change.users);
+    }
+  });
+
+  if (patch.order) {
+    worldsState = patch.order.map(key => byKey.get(key)).filter(Boolean);
+    // World indexes are baked into the cards' focus commands, so redraw
+    renderWorlds();
+    return;
+  }
+
+  const worldsList = document.getElementById('worlds-list');
+  patch.changed.forEach(change => {
+    const index = worldsState.findIndex(world => worldKey(world) === change.key);
+    const card = worldsList.querySelector(`.world-card[data-key="${CSS.escape(change.key)}"]`);
+    if (index === -1 || !card) return;
+
+    if (change.fields) {
+      fillWorldCard(card, worldsState[index]);
+    }
+    if (change.users) {
+      patchUserCards(card, worldsState[index], change.users, index);
+    }
+  });
+}
+
+function applyUsersPatch(world, users) {
+  const list = world.users_list || [];
+  const left = new Set(users.left || []);
+  const changes = new Map((users.changed || []).map(change => [change.key, change.fields]));
+
+  world.users_list = list
+    .filter(user => !left.has(userKey(user)))
+    .map(user => changes.has(userKey(user)) ? Object.assign(user, changes.get(userKey(user))) : user)
+    .concat(users.joined || []);
+}
+
+function patchUserCards(card, world, users, index) {
+  const userList = card.querySelector('.user-list');
+  if (!world.users_list || world.users_list.length === 0) {
+    if (userList) userList.remove();
+    return;
+  }
+  if (!userList) {
+    card.querySelector('.world-details').appendChild(createUserList(world, index));
+    return;
+  }
+
+  const container = userList.querySelector('.users');
+  const findUserCard = key => container.querySelector(`.user-card[data-key="${CSS.escape(key)}"]`);
+
+  (users.left || []).forEach(key => {
+    const userCard = findUserCard(key);
+    if (userCard) userCard.remove();
+  });
+
+  (users.changed || []).forEach(change => {
+    const userCard = findUserCard(change.key);
+    const user = world.users_list.find(u => userKey(u) === change.key);
+    if (userCard && user) {
+      userCard.replaceWith(createUserCard(user, index));
+    }
+  });
+
+  (users.joined || []).forEach(user => {
+    container.appendChild(createUserCard(user, index));
+  });
+}
+
+function createWorldCard(world, index) {
+  const worldDiv = document.createElement('div');
+  worldDiv.className = 'world-card';
+  worldDiv.dataset.key = worldKey(world);
+  worldDiv.dataset.index = index; // Add the index to the dataset
+
+  // Add click handler
+  worldDiv.addEventListener('click', () => selectWorld(worldDiv.dataset.sessionId));
+
+  worldDiv.innerHTML = `
+        <span class="world-name" data-field="name"></span>
+        <div class="session-id-container">
+          <div class="session-id" data-field="sessionId"></div>
+          <button
+            class="copy-button"
+            onclick="event.stopPropagation(); copyToClipboard(this.dataset.sessionId)">
+            Copy
+          </button>
+        </div>
+        <div class="world-details">
+          <div class="world-stat">
+            <span class="label">Users:</span>
+            <span data-field="users"></span>
           </div>
-          <div class="world-details">
-            <div class="world-stat">
-              <span class="label">Users:</span>
-              <span>${world.users}/${world.maxUsers}</span>
-            </div>
-            <div class="world-stat">
-              <span class="label">Present:</span>
-              <span>${world.present}</span>
-            </div>
-            <div class="world-stat">
-              <span class="label">Access:</span>
-              <span>${world.accessLevel}</span>
-            </div>
-            <div class="world-stat">
-              <span class="label">Uptime:</span>
-              <span>${world.uptime}</span>
-            </div>
-            <div class="world-stat">
-              <span class="label">Hidden:</span>
-              <span>${world.hidden ? 'Yes' : 'No'}</span>
-            </div>
-            <div class="world-stat">
-              <span class="label">Mobile:</span>
-              <span>${world.mobileFriendly ? 'Yes' : 'No'}</span>
-            </div>
-            ${world.description ?
-        `<div class="world-description">${world.description}</div>` : ''}
-            ${tagsHtml}
-            ${usersHtml}
+          <div class="world-stat">
+            <span class="label">Present:</span>
+            <span data-field="present"></span>
+          </div>
+          <div class="world-stat">
+            <span class="label">Access:</span>
+            <span data-field="accessLevel"></span>
+          </div>
+          <div class="world-stat">
+            <span class="label">Uptime:</span>
+            <span data-field="uptime"></span>
+          </div>
+          <div class="world-stat">
+            <span class="label">Hidden:</span>
+            <span data-field="hidden"></span>
           </div>
+          <div class="world-stat">
+            <span class="label">Mobile:</span>
+            <span data-field="mobileFriendly"></span>
+          </div>
+          <div class="world-description" data-field="description"></div>
+          <div class="world-tags" data-field="tags"></div>
+        </div>
+      `;
+
+  fillWorldCard(worldDiv, world);
+
+  // Create users list if users exist
+  if (world.users_list && world.users_list.length > 0) {
+    worldDiv.querySelector('.world-details').appendChild(createUserList(world, index));
+  }
+
+  return worldDiv;
+}
+
+// Write a world's fields into an existing card without touching its users
+function fillWorldCard(card, world) {
+  card.dataset.sessionId = world.sessionId;
+  card.dataset.name = world.name;
+  card.dataset.hidden = world.hidden;
+  card.dataset.description = world.description;
+  card.dataset.accessLevel = world.accessLevel;
+  card.dataset.maxUsers = world.maxUsers;
+
+  const field = name => card.querySelector(`[data-field="${name}"]`);
+  field('name').textContent = world.name;
+  field('sessionId').textContent = `Session: ${world.sessionId}`;
+  field('users').textContent = `${world.users}/${world.maxUsers}`;
+  field('present').textContent = world.present;
+  field('accessLevel').textContent = world.accessLevel;
+  field('uptime').textContent = world.uptime;
+  field('hidden').textContent = world.hidden ? 'Yes' : 'No';
+  field('mobileFriendly').textContent = world.mobileFriendly ? 'Yes' : 'No';
+
+  const copyButton = card.querySelector('.copy-button');
+  copyButton.dataset.sessionId = world.sessionId;
+
+  const description = field('description');
+  description.textContent = world.description || '';
+  description.style.display = world.description ? '' : 'none';
+
+  const tags = field('tags');
+  tags.innerHTML = world.tags ?
+    world.tags.split(',').map(tag => `<span class="tag">${tag.trim()}</span>`).join('') : '';
+  tags.style.display = world.tags ? '' : 'none';
+}
+
+function createUserList(world, index) {
+  const userList = document.createElement('div');
+  userList.className = 'user-list';
+  userList.innerHTML = `
+          <span class="label">Connected Users:</span>
+          <div class="users"></div>
         `;
+  const container = userList.querySelector('.users');
+  world.users_list.forEach(user => container.appendChild(createUserCard(user, index)));
+  return userList;
+}
 
-    worldsList.appendChild(worldDiv);
-  });
+function createUserCard(user, index) {
+  const template = document.createElement('template');
+  template.innerHTML = `
+              <div class="user-card" data-key="${userKey(user)}">
+                <div class="user-header">
+                  <div class="user-info">
+                    <span class="user-name">${user.username}</span>
+                    <div class="copy-buttons">
+                      <button onclick="event.stopPropagation(); copyText('${user.username}', 'username')" class="copy-user-btn" title="Copy Username">
+                        Copy Name
+                      </button>
+                      <button onclick="event.stopPropagation(); copyText('${user.userId}', 'userId')" class="copy-user-btn" title="Copy User ID">
+                        Copy ID
+                      </button>
+                    </div>
+                  </div>
+                  <select class="role-select" onchange="handleRoleChange(event, '${user.username}', ${index})">
+                    ${AVAILABLE_ROLES.map(role => `
+                      <option value="${role}" ${user.role === role ? 'selected' : ''}>
+                        ${role}
+                      </option>
+                    `).join('')}
+                  </select>
+                </div>
+                <div class="user-stats">
+                  <span class="user-stat" title="Present Status">
+                    <i class="status-dot ${user.present ? 'present' : 'away'}"></i>
+                    ${user.present ? 'Present' : 'Away'}
+                  </span>
+                  <span class="user-stat" title="Ping">
+                    ${user.ping != null ? `${user.ping}ms` : '—'}
+                  </span>
+                  <span class="user-stat" title="FPS">
+                    ${user.fps != null ? user.fps.toFixed(1) : '—'} FPS
+                  </span>
+                  ${user.silenced ? '<span class="user-stat silenced" title="User is silenced">🔇</span>' : ''}
+                </div>
+                <div class="user-actions">
+                  <button onclick="event.stopPropagation(); handleUserAction('kick', '${user.username}', ${index})" class="user-action-btn" title="Kick User">
+                    Kick
+                  </button>
+                  <button onclick="event.stopPropagation(); handleUserAction('respawn', '${user.username}', ${index})" class="user-action-btn" title="Respawn User">
+                    Respawn
+                  </button>
+                  <button onclick="event.stopPropagation(); handleUserAction('${user.silenced ? 'unsilence' : 'silence'}', '${user.username}', ${index})" class="user-action-btn ${user.silenced ? 'unsilence' : 'silence'}" title="${user.silenced ? 'Unsilence User' : 'Silence User'}">
+                    ${user.silenced ? 'Unsilence' : 'Silence'}
+                  </button>
+                  <button onclick="event.stopPropagation(); handleUserAction('ban', '${user.username}', ${index})" class="user-action-btn ban" title="Ban User">
+                    Ban
+                  </button>
+                </div>
+              </div>
+            `.trim();
+  return template.content.firstChild;
+}
+
+// Fill the container picker; it only shows when the server manages more than one
+function updateContainers(containers, selected) {
+  const select = document.getElementById('container-select');
+  const previous = currentContainer;
+  const ids = containers.map(container => container.id);
+
+  select.innerHTML = ids
+    .map(id => `<option value="${id}">${id}</option>`)
+    .join('');
+  select.style.display = ids.length > 1 ? '' : 'none';
+
+  // Keep viewing the same container across reconnects if it still exists
+  if (previous && ids.includes(previous)) {
+    select.value = previous;
+    if (previous !== selected) {
+      selectContainer(previous);
+    }
+  } else {
+    currentContainer = selected;
+    select.value = selected;
+  }
+}
+
+function selectContainer(containerId) {
+  currentContainer = containerId;
+  output.innerHTML = '';
+  worldsState = [];
+  worldsVersion = null;
+  document.getElementById('worlds-list').innerHTML = '<div class="worlds-loading">Loading worlds...</div>';
+  cancelWorldProperties();
+
+  ws.send(JSON.stringify({ type: 'select_container', container: containerId }));
+  ws.send(JSON.stringify({ type: 'get_status' }));
+  ws.send(JSON.stringify({ type: 'get_worlds' }));
+
+  // The config editor shows the selected container's config
+  currentConfig = null;
+  if (document.querySelector('.config-section').style.display === 'block') {
+    loadConfig();
+  }
+}
+
+document.getElementById('container-select').addEventListener('change', function () {
+  selectContainer(this.value);
+});
+
+// Query string that routes REST calls to the selected container
+function containerQuery() {
+  return currentContainer ? `?container=${encodeURIComponent(currentContainer)}` : '';
+}
+
+// Show how old the server's shared worlds snapshot was when it was sent
+function updateWorldsAge(age, crawl) {
+  const header = document.querySelector('.worlds-header');
+  if (age === undefined || age === null) {
+    header.title = '';
+    return;
+  }
+  header.title = `Snapshot taken ${Math.round(age)}s before it was sent`;
+  if (crawl && crawl.duration !== null && crawl.duration !== undefined) {
+    header.title += `\nRefreshed ${crawl.crawled} of ${crawl.worlds} worlds in ${crawl.duration.toFixed(2)}s`;
+  }
 }
 
 // Handle Enter key in input
@@ -421,15 +610,17 @@ function copyToClipboard(sessionId) {
 }
 
 let currentConfig = null;
+let configEtag = null; // Version of the config the editor was loaded from
 
 async function loadConfig() {
   console.log('loadConfig')
   try {
-    const response = await fetch('/config');
+    const response = await fetch(`/config${containerQuery()}`);
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
     }
     const result = await response.json();
+    configEtag = response.headers.get('ETag');
     const editor = document.getElementById('config-editor');
 
     // Set the raw content in the editor
@@ -457,21 +648,28 @@ async function saveConfig() {
     // Validate JSON
     const config = JSON.parse(editor.value);
 
-    // Send to server
-    const response = await fetch('/config', {
+    // Send to server; If-Match makes the save fail if someone else saved in the meantime
+    const headers = { 'Content-Type': 'application/json' };
+    if (configEtag) {
+      headers['If-Match'] = configEtag;
+    }
+    const response = await fetch(`/config${containerQuery()}`, {
       method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
+      headers,
       body: JSON.stringify(config)
     });
 
+    if (response.status === 412) {
+      showError('The config was changed by someone else. Reload it before saving.');
+      return;
+    }
     if (!response.ok) {
       const error = await response.json();
       throw new Error(error.detail || 'Failed to save config');
     }
 
     currentConfig = config;
+    configEtag = response.headers.get('ETag');
     hideError();
     showSuccess();
   } catch (error) {
@@ -515,60 +713,63 @@ function hideError() {
   errorDiv.style.display = 'none';
 }
 
-let refreshInterval = 30 * 1000; // Default 30 seconds
-let refreshTimer = null;
+// Intervals are kept by the server's scheduler and shared by every client
+function setServerInterval(task, seconds) {
+  if (ws.readyState === WebSocket.OPEN && !isNaN(seconds)) {
+    ws.send(JSON.stringify({ type: 'set_interval', task: task, interval: seconds }));
+  }
+}
 
 function updateRefreshInterval() {
-  console.log('updateRefreshInterval');
   const input = document.getElementById('refresh-interval');
-  const newInterval = Math.max(5, Math.min(60, parseInt(input.value))) * 1000;
-
-  if (refreshInterval !== newInterval) {
-    refreshInterval = newInterval;
-
-    // Clear existing timer
-    if (refreshTimer) {
-      clearInterval(refreshTimer);
-    }
-
-    // Set up new timer
-    refreshTimer = setInterval(() => {
-      if (ws.readyState === WebSocket.OPEN) {
-        ws.send(JSON.stringify({ type: 'get_status' }));
-        ws.send(JSON.stringify({ type: 'get_worlds' }));
-      }
-    }, refreshInterval);
-  }
+  setServerInterval('status', Math.max(5, Math.min(60, parseInt(input.value))));
 }
 
 // Add event listener for the refresh interval input
 document.getElementById('refresh-interval').addEventListener('change', updateRefreshInterval);
-document.getElementById('refresh-interval').addEventListener('input', updateRefreshInterval);
 
 // Move the message handling logic to a separate function
 function handleMessage(data) {
+  // Ignore anything still in flight for a container we've switched away from
+  if (data.container && currentContainer && data.container !== currentContainer) {
+    return;
+  }
+
   switch (data.type) {
+    case 'containers_update':
+      updateContainers(data.containers, data.selected);
+      break;
     case 'container_output':
-      appendOutput(data.output);
+      // Lines arrive in batches; `dropped` counts lines skipped because this client fell behind
+      if (data.dropped) {
+        appendOutput(`... ${data.dropped} lines skipped ...`, 'error');
+      }
+      appendOutputLines(Array.isArray(data.output) ? data.output : [data.output]);
+      break;
+    case 'log_history':
+      // Stored scrollback replaces whatever the console was showing
+      output.innerHTML = '';
+      appendOutputLines(data.lines.map(([ts, line]) => line));
       break;
     case 'command_response':
-      if (data.command === 'friendRequests') {
-        const requests = data.output
-          .split('\n')
-          .filter((line, index) =>
-            index !== 0 && // Filter out first line
-            line.trim() && // Filter out empty lines
-            !line.includes('>') // Filter out command prompt
-          );
-        updateFriendRequests(requests);
-      }
       console.log('command_response', data.output);
       break;
+    case 'batch_response':
+      data.results.forEach(result => console.log('batch_response', result.command, result.output));
+      break;
+    case 'friend_requests_update':
+      updateFriendRequests(data.requests);
+      break;
     case 'status_update':
       updateStatus(data.status);
       break;
     case 'worlds_update':
-      updateWorlds(data.output);
+      updateWorlds(data.output, data.version);
+      updateWorldsAge(data.age, data.crawl);
+      break;
+    case 'worlds_patch':
+      applyWorldsPatch(data);
+      updateWorldsAge(data.age, data.crawl);
       break;
     case 'error':
       console.log('error', data.message);
@@ -577,6 +778,30 @@ function handleMessage(data) {
     case 'bans_update':
       updateBannedUsers(data.bans);
       break;
+    case 'log_stream':
+      // The server reconnects the output stream by itself and resumes where it left off
+      if (data.state === 'disconnected') {
+        appendOutput(`Output stream lost${data.error ? ` (${data.error})` : ''}, reconnecting...`, 'error');
+      } else if (data.gap) {
+        const from = data.gap.start ? new Date(data.gap.start * 1000).toLocaleTimeString() : 'the start';
+        appendOutput(`Output stream reconnected. ${data.gap.reason}: output after ${from} may be missing`, 'error');
+      } else {
+        appendOutput('Output stream reconnected, missed output follows');
+      }
+      break;
+    case 'restart_progress':
+      appendOutput(`Restart: ${data.message}`, data.stage === 'failed' ? 'error' : '');
+      if (data.stage === 'running') {
+        ws.send(JSON.stringify({ type: 'get_worlds', full: true }));
+      }
+      break;
+    case 'user_joined':
+    case 'user_left':
+    case 'world_started':
+    case 'world_stopped':
+      // The worlds list is updated by the worlds_patch that follows
+      console.log(data.type, data.world || '', data.username || '');
+      break;
     default:
       console.warn('Unknown message type:', data.type);
   }
@@ -702,7 +927,6 @@ function updateWorldPropertiesEditor(sessionId) {
 
   // Store session ID for the save function
   propertiesEditor.dataset.sessionId = sessionId;
-  propertiesEditor.dataset.worldIndex = world.index;
 }
 
 // Helper function to find world data by session ID
@@ -724,7 +948,6 @@ function findWorldBySessionId(sessionId) {
 async function saveWorldProperties() {
   const propertiesEditor = document.getElementById('world-properties');
   const sessionId = propertiesEditor.dataset.sessionId;
-  const worldIndex = propertiesEditor.dataset.worldIndex;
 
   // Get current values
   const currentValues = {
@@ -744,65 +967,36 @@ async function saveWorldProperties() {
     maxUsers: parseInt(propertiesEditor.dataset.originalMaxUsers)
   };
 
-  // First focus the world
-  ws.send(JSON.stringify({
-    type: 'command',
-    command: `focus ${worldIndex}`
-  }));
-
-  // Wait for focus command to complete
-  await new Promise(resolve => setTimeout(resolve, 500));
-
-  // Array to store commands that need to be executed
-  const commands = [];
-
-  // Check each field for changes and add necessary commands
-  if (currentValues.name !== originalValues.name) {
-    commands.push(`name ${currentValues.name}`);
-  }
-
-  if (currentValues.hidden !== originalValues.hidden) {
-    commands.push(`hideFromListing ${currentValues.hidden}`);
-  }
-
-  if (currentValues.description !== originalValues.description) {
-    commands.push(`description ${currentValues.description}`);
-  }
-
-  if (currentValues.accessLevel !== originalValues.accessLevel) {
-    commands.push(`accessLevel ${currentValues.accessLevel}`);
-  }
-
-  if (currentValues.maxUsers !== originalValues.maxUsers) {
-    commands.push(`maxUsers ${currentValues.maxUsers}`);
-  }
-
-  // Execute each command sequentially
-  for (const command of commands) {
-    ws.send(JSON.stringify({
-      type: 'command',
-      command: command
-    }));
-    // Wait between commands
-    await new Promise(resolve => setTimeout(resolve, 200));
-  }
-
-  // If any changes were made, save the config and reload
-  if (commands.length > 0) {
-    // Save the world configuration
-    ws.send(JSON.stringify({
-      type: 'command',
-      command: 'saveConfig'
-    }));
+  // Only send the properties that changed
+  const changes = {};
+  Object.keys(currentValues).forEach(key => {
+    if (currentValues[key] !== originalValues[key]) {
+      changes[key] = currentValues[key];
+    }
+  });
 
-    // Wait for save to complete
-    await new Promise(resolve => setTimeout(resolve, 500));
+  // The server runs every change and the config save as one batch on this world
+  if (Object.keys(changes).length > 0) {
+    try {
+      const response = await fetch(`/api/world-properties${containerQuery()}`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ sessionId, ...changes })
+      });
 
-    // Reload the config editor
-    loadConfig();
+      if (!response.ok) {
+        const error = await response.json();
+        throw new Error(error.detail || 'Failed to update world properties');
+      }
 
-    // Refresh the worlds list
-    ws.send(JSON.stringify({ type: 'get_worlds' }));
+      // Reload the config editor; the worlds list is pushed once the world is recrawled
+      loadConfig();
+    } catch (error) {
+      appendOutput(`Error: ${error.message}`, 'error');
+      return;
+    }
   }
 
   // Close the properties editor
@@ -885,31 +1079,11 @@ async function handleFriendRequest(action, username) {
 // Add function to update friend requests interval
 function updateFriendRequestsInterval() {
   const input = document.getElementById('friend-requests-interval');
-  const newInterval = Math.max(1, parseInt(input.value)) * 60 * 1000; // Convert minutes to milliseconds
-
-  if (friendRequestsInterval !== newInterval) {
-    friendRequestsInterval = newInterval;
-
-    // Clear existing timer
-    if (friendRequestsTimer) {
-      clearInterval(friendRequestsTimer);
-    }
-
-    // Set up new timer
-    friendRequestsTimer = setInterval(() => {
-      if (ws.readyState === WebSocket.OPEN) {
-        ws.send(JSON.stringify({
-          type: 'command',
-          command: 'friendRequests'
-        }));
-      }
-    }, friendRequestsInterval);
-  }
+  setServerInterval('friend_requests', Math.max(1, parseInt(input.value)) * 60); // Minutes to seconds
 }
 
 // Add event listener for the friend requests interval input
 document.getElementById('friend-requests-interval').addEventListener('change', updateFriendRequestsInterval);
-document.getElementById('friend-requests-interval').addEventListener('input', updateFriendRequestsInterval);
 
 // Add this function after the selectWorld function
 
@@ -951,17 +1125,19 @@ async function sendWorldCommand(command) {
 async function restartContainer() {
   if (confirm('Are you sure you want to restart the Docker container? This will close all worlds.')) {
     try {
-      const response = await fetch('/api/restart-container', {
+      const response = await fetch(`/api/restart-container${containerQuery()}`, {
         method: 'POST'
       });
 
       if (!response.ok) {
-        throw new Error('Failed to restart container');
+        const error = await response.json().catch(() => ({}));
+        throw new Error(error.detail || 'Failed to restart container');
       }
 
-      // The WebSocket will automatically reconnect after container restart
+      // Progress arrives over the WebSocket as restart_progress messages
     } catch (error) {
       console.error('Error restarting container:', error);
+      appendOutput(`Error: ${error.message}`, 'error');
     }
   }
 }
@@ -1090,17 +1266,6 @@ document.addEventListener('DOMContentLoaded', () => {
 
 // Add this function after the existing functions
 async function handleUserAction(action, username, worldIndex) {
-  // First focus the correct world
-  if (action !== 'ban') { // Ban doesn't require focusing
-    ws.send(JSON.stringify({
-      type: 'command',
-      command: `focus ${worldIndex}`
-    }));
-
-    // Wait a moment for the focus command to complete
-    await new Promise(resolve => setTimeout(resolve, 500));
-  }
-
   // Execute the appropriate command
   let command;
   switch (action) {
@@ -1124,41 +1289,27 @@ async function handleUserAction(action, username, worldIndex) {
       return;
   }
 
-  // Send the command
+  // The server focuses the world and runs the command in one batch; ban doesn't need a world
+  const world = worldsState[worldIndex];
   ws.send(JSON.stringify({
-    type: 'command',
-    command: command
+    type: 'batch',
+    sessionId: action !== 'ban' && world ? world.sessionId : undefined,
+    commands: [command]
   }));
-
-  // Refresh the worlds list after a short delay
-  setTimeout(() => {
-    ws.send(JSON.stringify({ type: 'get_worlds' }));
-  }, 1000);
 }
 
 // Add this new function after handleUserAction
 async function handleRoleChange(event, username, worldIndex) {
   const newRole = event.target.value;
+  const world = worldsState[worldIndex];
+  if (!world) return;
 
-  // First focus the world
-  ws.send(JSON.stringify({
-    type: 'command',
-    command: `focus ${worldIndex}`
-  }));
-
-  // Wait a moment for the focus command to complete
-  await new Promise(resolve => setTimeout(resolve, 500));
-
-  // Send the role command
+  // Focus and role change run as one batch on the server
   ws.send(JSON.stringify({
-    type: 'command',
-    command: `role ${username} ${newRole}`
+    type: 'batch',
+    sessionId: world.sessionId,
+    commands: [`role ${username} ${newRole}`]
   }));
-
-  // Refresh the worlds list after a short delay
-  setTimeout(() => {
-    ws.send(JSON.stringify({ type: 'get_worlds' }));
-  }, 1000);
 }
 
 // Add this function after the saveWorldProperties function
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+
+import psutil
+
+
+class StatusSampler:
+    """Keeps fresh host and container status in memory for `get_status`.
+
+    Host CPU and memory come from psutil's counters, sampled on a timer so the
+    CPU figure is the delta since the previous sample instead of a blocking
+    one-second measurement. Each container gets a thread reading Docker's
+    `stats` stream, and its run state is refreshed on a slower timer. Every
+    cached value carries the time it was sampled.
+    """
+
+    def __init__(self, fleet, interval=1, status_interval=5, retry_delay=5):
+        self.fleet = fleet
+        self.interval = interval
+        self.status_interval = status_interval  # Seconds between container state checks
+        self.retry_delay = retry_delay  # Seconds before reopening a failed stats stream
+        self.host = {}
+        self.host_sampled_at = None
+        self.containers = {}  # container id -> {"status", "status_at", "stats", "stats_at"}
+        self._streams = {}  # container id -> (thread, stop event)
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for thread, stop in self._streams.values():
+            stop.set()
+        self._streams = {}
+
+    async def get_status(self, headless):
+        """Cached status for one container merged with the host figures"""
+        cached = self.containers.setdefault(headless.id, {})
+        if "status" not in cached:
+            # Only until the first background sample lands for a new container
+            cached["status"] = await headless.docker_manager.get_container_status_async()
+            cached["status_at"] = time.time()
+        if self.host_sampled_at is None:
+            self.sample_host()
+
+        status = dict(cached["status"])
+        status.update(self.host)
+        status.update({
+            "container_stats": cached.get("stats"),
+            "host_sampled_at": self.host_sampled_at,
+            "status_sampled_at": cached["status_at"],
+            "stats_sampled_at": cached.get("stats_at")
+        })
+        return status
+
+    async def _run(self):
+        # The first call only primes psutil's counters
+        psutil.cpu_percent(interval=None)
+        last_status = 0
+        while True:
+            try:
+                self.sample_host()
+                self._sync_streams()
+            except Exception as e:
+                print(f"Error sampling status: {e}")
+
+            now = time.time()
+            if now - last_status >= self.status_interval:
+                last_status = now
+                await self.sample_container_status()
+            await asyncio.sleep(self.interval)
+
+    def sample_host(self):
+        memory = psutil.virtual_memory()
+        self.host = {
+            "cpu_usage": psutil.cpu_percent(interval=None),
+            "memory_percent": memory.percent,
+            "memory_used": f"{memory.used / (1024 * 1024 * 1024):.1f}GB",
+            "memory_total": f"{memory.total / (1024 * 1024 * 1024):.1f}GB",
+            "memory_used_bytes": memory.used
+        }
+        self.host_sampled_at = time.time()
+
+    async def sample_container_status(self):
+        """Refresh every container's run state in parallel"""
+        statuses = await self.fleet.statuses()
+        now = time.time()
+        for container_id, status in statuses.items():
+            entry = self.containers.setdefault(container_id, {})
+            entry["status"] = status
+            entry["status_at"] = now
+
+    def _sync_streams(self):
+        """Start a stats stream for new containers and stop those that left the fleet"""
+        for container_id, headless in list(self.fleet.headlesses.items()):
+            if container_id not in self._streams:
+                stop = threading.Event()
+                thread = threading.Thread(
+                    target=self._stream_stats,
+                    args=(container_id, headless.docker_manager, stop),
+                    name=f"stats-{container_id}",
+                    daemon=True
+                )
+                self._streams[container_id] = (thread, stop)
+                thread.start()
+        for container_id in list(self._streams):
+            if container_id not in self.fleet.headlesses:
+                thread, stop = self._streams.pop(container_id)
+                stop.set()
+                self.containers.pop(container_id, None)
+
+    def _stream_stats(self, container_id, docker_manager, stop):
+        """Thread body: keep the latest stats sample, reopening the stream if it drops"""
+        previous = None
+        while not stop.is_set():
+            try:
+                for stats in docker_manager.stream_container_stats():
+                    if stop.is_set():
+                        return
+                    now = time.time()
+                    if previous is not None:
+                        elapsed = now - previous[0]
+                        stats["network_rx_rate"] = (stats["network_rx_bytes"] - previous[1]["network_rx_bytes"]) / elapsed
+                        stats["network_tx_rate"] = (stats["network_tx_bytes"] - previous[1]["network_tx_bytes"]) / elapsed
+                    previous = (now, stats)
+                    entry = self.containers.setdefault(container_id, {})
+                    entry["stats"] = stats
+                    entry["stats_at"] = now
+            except Exception as e:
+                print(f"Stats stream for {container_id} failed: {e}")
+            previous = None
+            stop.wait(self.retry_delay)
@@ -0,0 +1,127 @@
+import codecs
+import re
+
+# Regex pattern for ANSI escape sequences
+ANSI_ESCAPE = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]|\x1B[()][AB012]')
+
+
+def clean_line(text):
+    """One line of console output as it ends up on screen, without colours or surrounding whitespace.
+
+    The headless returns the cursor with a bare `\\r` to print a log line
+    over its prompt, so only the last non-blank stretch after a `\\r` is
+    kept, the way a terminal would show it.
+    """
+    if '\x1b' in text or '\x9b' in text:
+        text = ANSI_ESCAPE.sub('', text)
+    if '\r' in text:
+        for segment in reversed(text.split('\r')):
+            if segment and not segment.isspace():
+                return segment.strip()
+        return ''
+    return text.strip()
+
+
+class DockerFrameReader:
+    """Strips the 8-byte headers Docker puts in front of each frame of a non-TTY stream.
+
+    A container without a TTY sends stdout and stderr multiplexed, each frame
+    starting with the stream type, three zero bytes and the payload size.
+    With `framed=None` the format is told from the first byte, since a TTY
+    stream doesn't start with a \\x00-\\x02 control character. Headers and
+    payloads may be split anywhere across chunks.
+    """
+
+    def __init__(self, framed=None):
+        self.framed = framed
+        self._header = b''  # Start of a header cut off at the end of the last chunk
+        self._remaining = 0  # Payload bytes still to come in the current frame
+
+    def feed(self, data):
+        """The payload bytes in `data`"""
+        if self.framed is None:
+            if not data:
+                return b''
+            self.framed = data[0] <= 2
+        if not self.framed:
+            return data
+        if self._header:
+            data = self._header + data
+            self._header = b''
+        payload = []
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if self._remaining:
+                take = min(self._remaining, end - pos)
+                payload.append(data[pos:pos + take])
+                self._remaining -= take
+                pos += take
+            elif end - pos >= 8:
+                self._remaining = int.from_bytes(data[pos + 4:pos + 8], 'big')
+                pos += 8
+            else:
+                self._header = data[pos:]
+                break
+        if len(payload) == 1:
+            return payload[0]
+        return b''.join(payload)
+
+
+class LineDecoder:
+    """Splits a byte stream into lines as the chunks arrive.
+
+    Bytes go through an incremental UTF-8 decoder, so a character split
+    across two chunks comes out whole, and an invalid byte becomes U+FFFD
+    instead of an error. Each chunk is split once and only the unfinished
+    last line is carried over, so a burst costs time linear in its size. A
+    line longer than `max_line` characters is handed out in pieces of that
+    size rather than cut off or held without bound. Lines are returned raw,
+    without the newline; see `clean_line`.
+    """
+
+    def __init__(self, max_line=64 * 1024, framed=False):
+        self.max_line = max_line
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._frames = DockerFrameReader(framed) if framed is not False else None
+        self._partial = []  # Pieces of the line still waiting for its newline
+        self._partial_size = 0
+        self.long_lines = 0  # Lines handed out in pieces because they passed max_line
+
+    def feed(self, data):
+        """The lines completed by `data`, in order"""
+        if self._frames is not None:
+            data = self._frames.feed(data)
+        text = self._decoder.decode(data)
+        if '\n' not in text:
+            return self._hold(text, [])
+        lines = text.split('\n')
+        rest = lines.pop()
+        if self._partial:
+            self._partial.append(lines[0])
+            lines[0] = ''.join(self._partial)
+            self._partial = []
+            self._partial_size = 0
+        return self._hold(rest, lines)
+
+    def flush(self):
+        """The unfinished last line, once the stream has ended"""
+        text = ''.join(self._partial) + self._decoder.decode(b'', final=True)
+        self._partial = []
+        self._partial_size = 0
+        return [text] if text else []
+
+    def _hold(self, text, lines):
+        if not text:
+            return lines
+        self._partial.append(text)
+        self._partial_size += len(text)
+        if self._partial_size > self.max_line:
+            text = ''.join(self._partial)
+            self.long_lines += 1
+            # Whole pieces go out; the remainder keeps waiting for its newline
+            cut = (len(text) - 1) // self.max_line * self.max_line
+            lines.extend(text[i:i + self.max_line] for i in range(0, cut, self.max_line))
+            self._partial = [text[cut:]]
+            self._partial_size = len(text) - cut
+        return lines
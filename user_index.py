@@ -0,0 +1,246 @@
+import difflib
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+
+
+class IndexedUser:
+    """What the index knows about one user across every managed headless"""
+
+    __slots__ = ('key', 'user_id', 'username', 'worlds', 'sessions', 'bans', 'last_seen')
+
+    def __init__(self, key, user_id, username, history):
+        self.key = key
+        self.user_id = user_id
+        self.username = username
+        self.worlds = {}  # (container id, session id) -> the world the user is in now
+        self.sessions = deque(maxlen=history)  # Worlds the user left, oldest first
+        self.bans = {}  # container id -> machine ids of the ban there
+        self.last_seen = None
+
+    @property
+    def online(self):
+        return bool(self.worlds)
+
+    def to_dict(self, history=True):
+        user = {
+            "userId": self.user_id,
+            "username": self.username,
+            "online": self.online,
+            "worlds": list(self.worlds.values()),
+            "banned": bool(self.bans),
+            "bans": [{"container": container_id, "machineIds": machine_ids}
+                     for container_id, machine_ids in self.bans.items()],
+            "lastSeen": self.last_seen
+        }
+        if history:
+            user["sessions"] = list(self.sessions)
+        return user
+
+
+class UserIndex:
+    """Every user seen in any world or ban list, searchable by id and name.
+
+    Worlds snapshots and `listbans` results are fed in as they arrive and
+    compared with what the index had for that container, so only users who
+    joined, left or were (un)banned are touched. A user is keyed by userId,
+    or by lowercased username until an id turns up. Lowercased names are
+    kept sorted, so a prefix search is a bisect; fuzzy matches come from
+    difflib, over names of about the query's length. Offline users who
+    aren't banned are forgotten, least recently seen first, once there are
+    more than `max_users`.
+    """
+
+    def __init__(self, max_users=10000, history=20):
+        self.max_users = max_users
+        self.history = history  # Past worlds kept per user
+        self.users = OrderedDict()  # key -> IndexedUser, least recently seen first
+        self._by_name = {}  # lowercased username -> set of keys
+        self._names = []  # Sorted lowercased usernames
+        self._presence = {}  # container id -> {(key, session id): world entry}
+        self._banned = {}  # container id -> keys banned there
+
+    def _add_name(self, user):
+        name = user.username.lower()
+        keys = self._by_name.get(name)
+        if keys is None:
+            keys = self._by_name[name] = set()
+            insort(self._names, name)
+        keys.add(user.key)
+
+    def _drop_name(self, user):
+        name = user.username.lower()
+        keys = self._by_name.get(name)
+        if keys is None:
+            return
+        keys.discard(user.key)
+        if not keys:
+            del self._by_name[name]
+            i = bisect_left(self._names, name)
+            if i < len(self._names) and self._names[i] == name:
+                del self._names[i]
+
+    def _user(self, user_id, username):
+        """The entry for a user, created or re-keyed as ids and names turn up"""
+        if not user_id and not username:
+            return None
+        user = self.users.get(user_id) if user_id else None
+        if user is None and username:
+            name_key = f"name:{username.lower()}"
+            user = self.users.get(name_key)
+            if user is not None and user_id:
+                # The id is known now, so key the entry by it
+                self._drop_name(user)
+                del self.users[name_key]
+                user.key = user_id
+                user.user_id = user_id
+                self.users[user_id] = user
+                self._add_name(user)
+                self._rekey(name_key, user_id)
+            elif user is None and not user_id:
+                # A name-only mention of a user already known by id
+                keys = self._by_name.get(username.lower())
+                if keys:
+                    user = self.users[next(iter(keys))]
+        if user is None:
+            key = user_id or f"name:{username.lower()}"
+            user = self.users[key] = IndexedUser(key, user_id or None, username or user_id, self.history)
+            self._add_name(user)
+        elif username and username != user.username:
+            self._drop_name(user)
+            user.username = username
+            self._add_name(user)
+        self.users.move_to_end(user.key)
+        return user
+
+    def _rekey(self, old, new):
+        for presence in self._presence.values():
+            for key, session_id in list(presence):
+                if key == old:
+                    presence[(new, session_id)] = presence.pop((old, session_id))
+        for keys in self._banned.values():
+            if old in keys:
+                keys.discard(old)
+                keys.add(new)
+
+    def _evict(self):
+        if len(self.users) <= self.max_users:
+            return
+        for key in list(self.users):
+            user = self.users[key]
+            if not user.worlds and not user.bans:
+                self._drop_name(user)
+                del self.users[key]
+                if len(self.users) <= self.max_users:
+                    return
+
+    def update_worlds(self, container_id, worlds):
+        """Record who is in which world of a container, from a worlds snapshot"""
+        now = time.time()
+        previous = self._presence.get(container_id, {})
+        current = {}
+        for world in worlds:
+            session_id = world.get("sessionId") or world.get("name")
+            for entry in world.get("users_list", []):
+                user = self._user(entry.get("userId"), entry.get("username"))
+                if user is None:
+                    continue
+                place = (user.key, session_id)
+                seen = previous.get(place) or current.get(place)
+                current[place] = {
+                    "container": container_id,
+                    "sessionId": world.get("sessionId"),
+                    "world": world.get("name"),
+                    "role": entry.get("role"),
+                    "present": entry.get("present"),
+                    "joined": seen["joined"] if seen else now
+                }
+                user.worlds[(container_id, session_id)] = current[place]
+                user.last_seen = now
+
+        for (key, session_id), world in previous.items():
+            if (key, session_id) in current:
+                continue
+            user = self.users.get(key)
+            if user is not None and user.worlds.pop((container_id, session_id), None) is not None:
+                user.sessions.append({**world, "left": now})
+                user.last_seen = now
+        if current:
+            self._presence[container_id] = current
+        else:
+            self._presence.pop(container_id, None)
+        self._evict()
+
+    def update_bans(self, container_id, bans):
+        """Record a container's ban list, as the dicts `listbans` is parsed into"""
+        banned = set()
+        for ban in bans:
+            user = self._user(ban.get("userId"), ban.get("username"))
+            if user is None:
+                continue
+            user.bans[container_id] = ban.get("machineIds") or []
+            banned.add(user.key)
+        for key in self._banned.get(container_id, set()) - banned:
+            user = self.users.get(key)
+            if user is not None:
+                user.bans.pop(container_id, None)
+        self._banned[container_id] = banned
+        self._evict()
+
+    def remove_container(self, container_id):
+        """Forget a container that is no longer managed; its users' sessions there end now"""
+        self.update_worlds(container_id, [])
+        self.update_bans(container_id, [])
+        self._banned.pop(container_id, None)
+
+    def get(self, user):
+        """Users whose id, or lowercased name, is exactly `user`"""
+        if user in self.users and not user.startswith('name:'):
+            return [self.users[user]]
+        return [self.users[key] for key in self._by_name.get(user.lower(), ())]
+
+    def search(self, query, limit=20, container_id=None, fuzzy=True):
+        """Users matching `query` by id, name, name prefix, substring and then fuzzily, best first.
+
+        Returns `(user, match)` pairs where match is one of `exact`,
+        `prefix`, `substring` or `fuzzy`.
+        """
+        query = query.strip()
+        needle = query.lower()
+        results = []
+        seen = set()
+
+        def add(users, match):
+            for user in users:
+                if len(results) >= limit:
+                    return
+                if user.key in seen or (container_id is not None and not self._involves(user, container_id)):
+                    continue
+                seen.add(user.key)
+                results.append((user, match))
+
+        def named(names):
+            for name in names:
+                # Users online now first
+                yield from sorted((self.users[key] for key in self._by_name[name]), key=lambda u: not u.online)
+
+        if not needle:
+            return results
+        add(self.get(query), 'exact')
+        start = bisect_left(self._names, needle)
+        end = start
+        while end < len(self._names) and self._names[end].startswith(needle):
+            end += 1
+        add(named(self._names[start:end]), 'prefix')
+        if len(results) < limit:
+            add(named(name for name in self._names if needle in name), 'substring')
+        if fuzzy and len(results) < limit:
+            candidates = [name for name in self._names if abs(len(name) - len(needle)) <= 3]
+            add(named(difflib.get_close_matches(needle, candidates, n=limit, cutoff=0.6)), 'fuzzy')
+        return results
+
+    @staticmethod
+    def _involves(user, container_id):
+        return (container_id in user.bans
+                or any(place[0] == container_id for place in user.worlds)
+                or any(session["container"] == container_id for session in user.sessions))
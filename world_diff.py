@@ -0,0 +1,76 @@
+def world_key(world):
+    """Stable identity for a world across crawls"""
+    return world.get("sessionId") or world.get("name")
+
+
+def user_key(user):
+    """Stable identity for a user across crawls"""
+    return user.get("userId") or user.get("username")
+
+
+def changed_fields(old, new, skip=()):
+    """Fields of `new` whose values differ from `old`"""
+    return {
+        field: value for field, value in new.items()
+        if field not in skip and old.get(field) != value
+    }
+
+
+def diff_users(old, new):
+    """Compare two user lists and return the joined, left and changed users"""
+    old_by_key = {user_key(user): user for user in old}
+    new_by_key = {user_key(user): user for user in new}
+
+    joined = [user for key, user in new_by_key.items() if key not in old_by_key]
+    left = [key for key in old_by_key if key not in new_by_key]
+    changed = []
+    for key, user in new_by_key.items():
+        previous = old_by_key.get(key)
+        if previous is not None and previous != user:
+            changed.append({"key": key, "fields": changed_fields(previous, user)})
+
+    diff = {}
+    if joined:
+        diff["joined"] = joined
+    if left:
+        diff["left"] = left
+    if changed:
+        diff["changed"] = changed
+    return diff
+
+
+def diff_worlds(old, new):
+    """Compare two worlds snapshots.
+
+    Returns a patch with the added worlds, the keys of removed worlds, and the
+    changed fields and user changes of the worlds in both. `order` is only
+    included when the world order changed, since the order decides the index
+    used by `focus`. Returns None when the worlds can't be told apart by key,
+    in which case the caller should send the full snapshot instead.
+    """
+    old_by_key = {world_key(world): world for world in old}
+    new_by_key = {world_key(world): world for world in new}
+    if len(old_by_key) != len(old) or len(new_by_key) != len(new):
+        return None
+
+    added = [world for key, world in new_by_key.items() if key not in old_by_key]
+    removed = [key for key in old_by_key if key not in new_by_key]
+    changed = []
+    for key, world in new_by_key.items():
+        previous = old_by_key.get(key)
+        if previous is None or previous == world:
+            continue
+        entry = {"key": key}
+        fields = changed_fields(previous, world, skip=("users_list",))
+        if fields:
+            entry["fields"] = fields
+        users = diff_users(previous.get("users_list", []), world.get("users_list", []))
+        if users:
+            entry["users"] = users
+        changed.append(entry)
+
+    patch = {"added": added, "removed": removed, "changed": changed}
+    order = list(new_by_key)
+    if order != list(old_by_key):
+        patch["order"] = order
+    return patch
@@ -0,0 +1,335 @@
+import asyncio
+import re
+import time
+
+from console_parser import format_uptime, parse_status, parse_users, parse_worlds
+from instrumentation import WORLD_CRAWL_SECONDS
+from world_diff import diff_worlds
+
+
+def listing_fields(entry):
+    """The parts of a `worlds` line that change when a world's details change"""
+    return (entry.users, entry.present, entry.access_level, entry.max_users)
+
+
+def build_world(entry, status_output, users_output):
+    """Combine a `worlds` line with the `status` and `users` output of that world"""
+    status = parse_status(status_output)
+    return {
+        "name": entry.name,
+        "sessionId": status.session_id,
+        "users": status.users,
+        "present": status.present,
+        "maxUsers": status.max_users,
+        "uptime": format_uptime(status.uptime),
+        "accessLevel": status.access_level,
+        "hidden": status.hidden,
+        "mobileFriendly": status.mobile_friendly,
+        "description": status.description,
+        "tags": status.tags,
+        "users_list": [user.to_dict() for user in parse_users(users_output)]
+    }
+
+
+async def crawl_worlds(docker_manager, cached=None, dirty=(), detail_max_age=None):
+    """Crawl the headless console, reusing cached details for worlds that haven't changed.
+
+    `cached` maps world names to `(listing fields, world data, crawled at)`
+    from the previous crawl. A world is crawled again when it is new, its
+    `worlds` line changed, its name is in `dirty`, or its details are older
+    than `detail_max_age`. The `focus`/`status`/`users` commands for every
+    world that needs them go to the console as one batch, so they run
+    back-to-back, paced only by the prompt.
+
+    Returns `(worlds, cache, stats)`, or raises when a console command fails.
+    """
+    cached = cached or {}
+    now = time.time()
+    # send_batch_async raises when the console fails, where send_command_async would return the
+    # error as output and the crawl would take it for a headless with no worlds
+    entries = parse_worlds((await docker_manager.send_batch_async(["worlds"]))[0])
+    names = [entry.name for entry in entries]
+
+    stale = []
+    for entry in entries:
+        previous = cached.get(entry.name)
+        if (previous is None
+                or names.count(entry.name) > 1  # Can't tell duplicates apart by name
+                or previous[0] != listing_fields(entry)
+                or entry.name in dirty
+                or (detail_max_age is not None and now - previous[2] >= detail_max_age)):
+            stale.append(entry)
+
+    commands = []
+    for entry in stale:
+        commands.extend((f"focus {entry.index}", "status", "users"))
+    outputs = await docker_manager.send_batch_async(commands) if commands else []
+
+    fresh = {}
+    for i, entry in enumerate(stale):
+        fresh[entry.index] = build_world(entry, outputs[i * 3 + 1], outputs[i * 3 + 2])
+
+    worlds = []
+    cache = {}
+    for entry in entries:
+        if entry.index in fresh:
+            world_data = fresh[entry.index]
+            cache[entry.name] = (listing_fields(entry), world_data, now)
+        else:
+            cache[entry.name] = cached[entry.name]
+            world_data = cached[entry.name][1]
+        worlds.append(world_data)
+
+    stats = {"worlds": len(entries), "crawled": len(stale), "commands": len(commands) + 1}
+    return worlds, cache, stats
+
+
+class WorldPoller:
+    """Keeps one shared worlds/users snapshot for every connected client.
+
+    Crawls are started by `refresh` (the server's scheduler runs one as a
+    periodic reconciliation pass) and call `on_update` when they finish.
+    Refreshes that arrive while a crawl is already running wait for that
+    crawl instead of starting another.
+
+    Every snapshot that differs from the previous one gets a new version, and
+    clients holding an older version can be sent a patch instead of the full
+    worlds list.
+
+    Crawls are incremental: only worlds that are new, changed in the `worlds`
+    listing, were named in console output since the last crawl, or haven't
+    been crawled for `detail_max_age` seconds get their details fetched again.
+    The console's answers to commands, the crawl's own included, reach the
+    log too, so lines written while `console_busy(ts)` says a command was in
+    flight, and prompts with a command typed at them, don't count.
+
+    Joins, leaves and world starts/stops seen in the console log are applied
+    to the snapshot as they happen (`apply_event`), so the scheduled crawl is
+    only a reconciliation pass.
+    """
+
+    def __init__(self, docker_manager, on_update, max_age=5, detail_max_age=60, name=None, console_busy=None):
+        self.docker_manager = docker_manager  # DockerManager, or a CommandExecutor wrapping one
+        self.console_busy = console_busy  # Callable taking a wall-clock time, True if a command was in flight then
+        self.name = name  # Container name used to label the crawl metrics
+        self.on_update = on_update  # async callable run after every crawl
+        self.max_age = max_age  # Snapshots younger than this are served as-is
+        self.detail_max_age = detail_max_age  # Longest a world's users/ping go without a recrawl
+        self.worlds = []
+        self.version = 0
+        self.updated_at = None  # Wall-clock time the last crawl finished
+        self.crawl_duration = None
+        self.crawl_stats = {}  # Worlds listed and crawled, and commands sent, by the last crawl
+        self._cache = {}  # World name -> (listing fields, world data, crawled at)
+        self._dirty = set()  # Worlds named in console output since the last crawl
+        self._names = None  # Pattern matching any known world name as a whole word
+        self._recrawl = False  # Crawl again once the running crawl finishes
+        self._publish_pending = False
+        self._publish_task = None
+        self._patches = {}  # Patches to the current version, keyed by base version
+        self._crawl_task = None
+
+    @property
+    def age(self):
+        """Seconds since the current snapshot was taken, or None if there is none yet"""
+        if self.updated_at is None:
+            return None
+        return time.time() - self.updated_at
+
+    def snapshot(self):
+        """Build the `worlds_update` message for the cached snapshot"""
+        return {
+            "type": "worlds_update",
+            "version": self.version,
+            "output": self.worlds,
+            "updated_at": self.updated_at,
+            "age": self.age,
+            "crawling": self.is_crawling,
+            "crawl": self.crawl_timing()
+        }
+
+    def patch_since(self, version, worlds):
+        """Build a `worlds_patch` message taking a client from `version` to the current one.
+
+        `worlds` is the snapshot the client was last sent. Returns None when no
+        patch can describe the change and the full snapshot must be sent.
+        """
+        if version == self.version:
+            patch = {"added": [], "removed": [], "changed": []}
+        else:
+            if version not in self._patches:
+                # Clients that were sent the same version share one diff
+                self._patches[version] = diff_worlds(worlds, self.worlds)
+            patch = self._patches[version]
+            if patch is None:
+                return None
+        return {
+            "type": "worlds_patch",
+            "base_version": version,
+            "version": self.version,
+            **patch,
+            "updated_at": self.updated_at,
+            "age": self.age,
+            "crawl": self.crawl_timing()
+        }
+
+    def crawl_timing(self):
+        """How long the last crawl took and how much of the listing it had to fetch"""
+        return {"duration": self.crawl_duration, **self.crawl_stats}
+
+    def note_output(self, ts, line):
+        """Log monitor listener: remember worlds mentioned in console output so the next crawl refetches them"""
+        if self._names is None or (self.console_busy is not None and self.console_busy(ts)):
+            return
+        prompt, typed, _ = line.partition('>')
+        if typed and (not prompt.strip() or prompt.strip() in self._cache):
+            return  # A command echoed at a world's prompt
+        self._dirty.update(match.group(0) for match in self._names.finditer(line))
+
+    @property
+    def is_crawling(self):
+        return self._crawl_task is not None and not self._crawl_task.done()
+
+    def is_fresh(self):
+        age = self.age
+        return age is not None and age < self.max_age
+
+    def request_refresh(self, again=False):
+        """Start a crawl unless one is already running, and return its task.
+
+        With `again`, a crawl that is already running is followed by another
+        one, for changes that may have happened after it started.
+        """
+        if not self.is_crawling:
+            self._crawl_task = asyncio.create_task(self._crawl())
+        elif again:
+            self._recrawl = True
+        return self._crawl_task
+
+    def world_index(self, session_id):
+        """The `focus` index of the world with this session id in the current snapshot, or None"""
+        for i, world in enumerate(self.worlds):
+            if world.get("sessionId") == session_id:
+                return i
+        return None
+
+    def invalidate(self, session_id=None):
+        """Have the next crawl refetch a world's details, or every world's when no session is given"""
+        if session_id is None:
+            self._dirty.update(self._cache)
+            return
+        index = self.world_index(session_id)
+        if index is not None:
+            self._dirty.add(self.worlds[index].get("name"))
+
+    def _find_world(self, name):
+        for i, world in enumerate(self.worlds):
+            if name is not None and name in (world.get("name"), world.get("sessionId")):
+                return i
+        return None
+
+    def apply_event(self, event):
+        """Apply a console event to the snapshot right away; returns True when it changed.
+
+        Events that can't be applied from the log line alone, like a world
+        starting, schedule a crawl instead. Worlds and user lists are copied
+        rather than edited in place, because clients' last-sent snapshots
+        share them.
+        """
+        if event.type == 'world_started':
+            self.request_refresh(again=True)
+            return False
+
+        index = self._find_world(event.world)
+        if index is None:
+            if event.type in ('world_stopped', 'user_joined', 'user_left'):
+                self.request_refresh(again=True)
+            return False
+
+        worlds = list(self.worlds)
+        if event.type == 'world_stopped':
+            del worlds[index]
+            self._cache.pop(self.worlds[index].get("name"), None)
+        elif event.type in ('user_joined', 'user_left'):
+            world = dict(worlds[index])
+            users = world.get("users_list", [])
+            kept = [user for user in users
+                    if (user.get("userId") or user.get("username")) != (event.user_id or event.username)]
+            removed = [user for user in users if user not in kept]
+            world["users"] = max(world.get("users", 0) - len(removed), 0)
+            world["present"] = max(world.get("present", 0) - sum(1 for user in removed if user.get("present")), 0)
+            if event.type == 'user_joined':
+                # Role, ping and FPS are filled in by the next crawl of this world
+                kept.append({"username": event.username, "userId": event.user_id, "role": None,
+                             "present": False, "ping": None, "fps": None, "silenced": False})
+                world["users"] += 1
+            world["users_list"] = kept
+            worlds[index] = world
+            self._dirty.add(world.get("name"))
+        else:
+            return False
+
+        self.worlds = worlds
+        self.version += 1
+        self._patches = {}
+        self.updated_at = time.time()
+        return True
+
+    def publish_soon(self):
+        """Run `on_update` for the latest snapshot, coalescing changes that arrive while it runs"""
+        self._publish_pending = True
+        if self._publish_task is None or self._publish_task.done():
+            self._publish_task = asyncio.create_task(self._publish())
+
+    async def _publish(self):
+        while self._publish_pending:
+            self._publish_pending = False
+            try:
+                await self.on_update()
+            except Exception as e:
+                print(f"Error publishing worlds: {e}")
+
+    async def refresh(self, again=False):
+        """Crawl the worlds now, or join the crawl that is already running.
+
+        With `again`, a crawl that is already running is followed by another
+        one, and that one is waited for too.
+        """
+        # Shield so a disconnecting client doesn't cancel the shared crawl
+        task = self.request_refresh(again)
+        await asyncio.shield(task)
+        if again and self._crawl_task is not task:
+            await asyncio.shield(self._crawl_task)
+
+    async def _crawl(self):
+        start = time.perf_counter()
+        dirty, self._dirty = self._dirty, set()
+        try:
+            worlds, self._cache, self.crawl_stats = await crawl_worlds(
+                self.docker_manager, self._cache, dirty, self.detail_max_age)
+            # Longest names first so "World 11" isn't taken for "World 1"
+            names = sorted((name for name in self._cache if name), key=len, reverse=True)
+            self._names = re.compile(
+                r'(?<!\w)(?:' + '|'.join(map(re.escape, names)) + r')(?!\w)') if names else None
+            if worlds != self.worlds:
+                self.worlds = worlds
+                self.version += 1
+                self._patches = {}
+            self.updated_at = time.time()
+        except Exception as e:
+            # Try the worlds we were told about again next time
+            self._dirty |= dirty
+            print(f"Error crawling worlds: {e}")
+            return
+        finally:
+            self.crawl_duration = time.perf_counter() - start
+            WORLD_CRAWL_SECONDS.labels(container=self.name).observe(self.crawl_duration)
+            if self._recrawl:
+                self._recrawl = False
+                self._crawl_task = asyncio.create_task(self._crawl())
+        await self.on_update()
+
+    async def stop(self):
+        for task in (self._crawl_task, self._publish_task):
+            if task is not None:
+                task.cancel()
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+from starlette.websockets import WebSocketState
+
+from instrumentation import REGISTRY, WEBSOCKET_SEND_ERRORS
+
+WEBSOCKET_FRAMES = REGISTRY.counter(
+    'websocket_frames',
+    'Frames sent to websocket clients',
+    ('message',))
+WEBSOCKET_BYTES = REGISTRY.counter(
+    'websocket_bytes',
+    'Bytes of JSON sent to websocket clients, before compression')
+WEBSOCKET_DROPPED_LINES = REGISTRY.counter(
+    'websocket_dropped_lines',
+    'Output lines a client never got, because its queue overflowed or it used up its send budget',
+    ('reason',))
+WEBSOCKET_SLOW_CLOSED = REGISTRY.counter(
+    'websocket_slow_clients_closed',
+    'Websocket clients disconnected because they stopped reading')
+
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':'), ensure_ascii=False)
+
+
+class ClientConnection:
+    """Everything sent to one websocket client goes through here.
+
+    `send` only queues a message, so a broadcast never waits for a slow
+    client; a writer task sends queued messages in order. Container output
+    from `follow` is batched into one `container_output` frame per
+    `flush_interval` or `max_batch_lines`, whichever comes first, instead of
+    a frame per line.
+
+    Each client has a budget of `budget_bytes` of output per second. Lines
+    over the budget are skipped, and so are lines its output queue dropped
+    while the client was behind; the next frame says how many in `dropped`.
+    A client whose send doesn't complete within `send_timeout`, or that lets
+    more than `max_pending` messages pile up, has stopped reading and is
+    disconnected. Liveness comes from the connection state and the
+    protocol-level pings uvicorn sends; nothing extra goes on the wire.
+    """
+
+    def __init__(self, websocket, flush_interval=0.05, max_batch_lines=500, budget_bytes=256 * 1024,
+                 max_pending=1000, send_timeout=10):
+        self.websocket = websocket
+        self.flush_interval = flush_interval
+        self.max_batch_lines = max_batch_lines
+        self.budget_bytes = budget_bytes  # Output bytes per second; 0 for no limit
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.closed = False
+        self.frames = 0
+        self.bytes = 0
+        self.dropped_lines = 0
+        self._messages = deque()  # Queued messages, sent before the next output batch
+        self._output = None  # Subscriber queue of (timestamp, line) from a LogMonitor
+        self._carry = deque()  # Lines taken off the output queue while waiting for work
+        self._after = None  # Output at or before this timestamp was already sent as scrollback
+        self._skipped = 0  # Lines dropped since the last frame, reported in it
+        self._tokens = budget_bytes
+        self._refilled = time.monotonic()
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task = asyncio.create_task(self._write_loop())
+
+    @property
+    def is_connected(self):
+        return (not self.closed and self.websocket.client_state == WebSocketState.CONNECTED
+                and self.websocket.application_state == WebSocketState.CONNECTED)
+
+    def send(self, message):
+        """Queue a message for this client"""
+        if self.closed:
+            return
+        if len(self._messages) >= self.max_pending:
+            print(f"Websocket client fell {len(self._messages)} messages behind, disconnecting it")
+            asyncio.create_task(self.close(slow=True))
+            return
+        self._messages.append(message)
+        self._idle.clear()
+        self._wake.set()
+
+    async def flush(self):
+        """Wait until every queued message was sent, for callers that produce a lot of them"""
+        await self._idle.wait()
+
+    def follow(self, output_queue, after=None):
+        """Send the lines arriving on a LogMonitor subscriber queue, skipping any at or before `after`"""
+        self._output = output_queue
+        self._after = after
+        self._carry.clear()
+        self._skipped = 0
+        self._wake.set()
+
+    def unfollow(self):
+        self._output = None
+        self._carry.clear()
+        self._skipped = 0
+
+    async def close(self, slow=False):
+        if self.closed:
+            return
+        self._mark_closed(slow)
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+        await self._close_socket(slow)
+
+    def _mark_closed(self, slow):
+        self.closed = True
+        self._idle.set()
+        if slow:
+            WEBSOCKET_SLOW_CLOSED.inc()
+
+    async def _close_socket(self, slow):
+        try:
+            # 1008 tells the browser it was dropped for not keeping up, so it can reconnect
+            await asyncio.wait_for(self.websocket.close(code=1008 if slow else 1000), self.send_timeout)
+        except Exception:
+            pass
+
+    async def _write_loop(self):
+        try:
+            while not self.closed:
+                if not self._messages and not self._has_output():
+                    self._idle.set()
+                    await self._wait_for_work()
+                if self._has_output():
+                    await self._send_output()
+                while self._messages and not self.closed:
+                    message = self._messages.popleft()
+                    await self._send(encode(message), message.get("type"))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            if self.closed:
+                return  # A send cut short by closing the connection
+            WEBSOCKET_SEND_ERRORS.labels(message="transport").inc()
+            print(f"Error sending to websocket: {e}")
+            self._mark_closed(False)
+            asyncio.create_task(self._close_socket(False))
+        finally:
+            self._idle.set()
+
+    def _has_output(self):
+        return self._output is not None and (bool(self._carry) or not self._output.empty())
+
+    async def _wait_for_work(self):
+        """Sleep until a message is queued or output arrives"""
+        self._wake.clear()
+        output = self._output
+        if output is None:
+            await self._wake.wait()
+            return
+        waiters = {asyncio.ensure_future(self._wake.wait()), asyncio.ensure_future(output.get())}
+        done, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            item = task.result()
+            if item is not True and output is self._output:
+                self._carry.append(item)
+
+    async def _send_output(self):
+        """Send the waiting output as one frame, after giving a short burst time to fill it"""
+        output = self._output
+        if len(self._carry) + output.qsize() < self.max_batch_lines and not self._messages:
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if output is not self._output:
+                return
+
+        lines = []
+        while len(lines) < self.max_batch_lines and (self._carry or not output.empty()):
+            ts, line = self._carry.popleft() if self._carry else output.get_nowait()
+            if self._after is not None and ts <= self._after:
+                continue  # Already sent as scrollback
+            lines.append(line)
+        self._skipped += output.dropped
+        if output.dropped:
+            WEBSOCKET_DROPPED_LINES.labels(reason='queue').inc(output.dropped)
+            output.dropped = 0
+        lines = self._within_budget(lines)
+        if not lines and not self._skipped:
+            return
+
+        message = {"type": "container_output", "output": lines}
+        if self._skipped:
+            message["dropped"] = self._skipped
+            self.dropped_lines += self._skipped
+            self._skipped = 0
+        await self._send(encode(message), "container_output")
+
+    def _within_budget(self, lines):
+        """The newest lines that fit in what's left of this second's budget"""
+        if not self.budget_bytes:
+            return lines
+        now = time.monotonic()
+        self._tokens = min(self.budget_bytes, self._tokens + (now - self._refilled) * self.budget_bytes)
+        self._refilled = now
+        kept = []
+        size = 0
+        for line in reversed(lines):
+            cost = len(line) + 3  # Quotes and comma in the JSON array
+            if size + cost > self._tokens:
+                break
+            size += cost
+            kept.append(line)
+        self._tokens -= size
+        if len(kept) < len(lines):
+            self._skipped += len(lines) - len(kept)
+            WEBSOCKET_DROPPED_LINES.labels(reason='budget').inc(len(lines) - len(kept))
+        kept.reverse()
+        return kept
+
+    async def _send(self, text, kind):
+        try:
+            await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+        except asyncio.TimeoutError:
+            print(f"Websocket client didn't read for {self.send_timeout}s, disconnecting it")
+            self._mark_closed(True)
+            asyncio.create_task(self._close_socket(True))
+            return
+        self.frames += 1
+        self.bytes += len(text)
+        WEBSOCKET_FRAMES.labels(message=kind).inc()
+        WEBSOCKET_BYTES.inc(len(text))